@@ -0,0 +1,77 @@
+"""Throughput of crawl_engine.crawl versus tab count.
+
+Each simulated query blocks its worker thread for a fixed latency, the way a
+DrissionPage navigation does, so keywords/min should grow roughly linearly
+with --concurrency until the simulated rate limit (--max-qps) is reached.
+
+    python benchmarks/bench_crawl_engine.py --jobs 200 --latency 0.05
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawl_engine import crawl
+
+
+def make_fetch(latency, max_qps):
+    lock = threading.Lock()
+    next_slot = [time.monotonic()]
+
+    def fetch(job):
+        if max_qps:
+            with lock:
+                now = time.monotonic()
+                wait = max(0.0, next_slot[0] - now)
+                next_slot[0] = max(now, next_slot[0]) + 1.0 / max_qps
+            time.sleep(wait)
+        time.sleep(latency)
+        return 1000
+    return fetch
+
+
+async def run(jobs, concurrency, latency, max_qps):
+    fetch = make_fetch(latency, max_qps)
+    started = time.perf_counter()
+    done = 0
+    async for result in crawl(range(jobs), fetch, concurrency=concurrency, timeout=30):
+        done += result.error is None
+    return done, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per simulated query')
+    parser.add_argument('--max-qps', type=float, default=0, help='simulated rate limit (0 = none)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = []
+    for concurrency in args.concurrency:
+        done, elapsed = asyncio.run(run(args.jobs, concurrency, args.latency, args.max_qps))
+        rows.append({
+            'concurrency': concurrency,
+            'jobs': done,
+            'seconds': round(elapsed, 3),
+            'jobs_per_min': round(done / elapsed * 60, 1),
+        })
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    base = rows[0]['jobs_per_min']
+    print(f"{'tabs':>5} {'seconds':>8} {'jobs/min':>10} {'speedup':>8}")
+    for row in rows:
+        print(f"{row['concurrency']:>5} {row['seconds']:>8} {row['jobs_per_min']:>10} "
+              f"{row['jobs_per_min'] / base:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Accuracy and speed of result_count against the legacy extractors.
+
+Runs every page in benchmarks/fixtures/serp (expected counts in
+expected.json) through:
+
+  legacy-regex  the old process_keywords.extract_count (r'About ([\\d,]+) results')
+                on the text the crawler read (#result-stats, else the page text)
+  legacy-split  the old main.py split on "About" / "results", same text
+  text          result_count.extract_count on that same text
+  legacy-raw    the legacy regex over the whole raw page, padded to a
+                realistic SERP size (--page-kb)
+  raw-html      result_count.count_from_html on that same raw page
+
+The new extractors read every fixture locale where the legacy ones only read
+English "About N results". On the same input the text path still costs
+~5x the legacy regex (a few microseconds), which it trades for that
+accuracy. The raw-HTML path beats the legacy regex run over the same raw
+page (one byte search that stops at the stats node), but a scan of a few
+hundred KB costs far more than a regex over an already extracted text: it
+saves the browser wait for the DOM, not CPU per page. ``vs legacy`` is
+relative to legacy-regex on text rows and to legacy-raw on raw rows.
+
+    python benchmarks/bench_extract.py [--rounds 2000] [--json]
+"""
+import os
+import re
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_count import count_from_html, extract_count, stats_text
+
+_TAG = re.compile(r'<[^>]+>')
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'serp')
+
+
+def legacy_regex(text):
+    match = re.search(r'About ([\d,]+) results', text)
+    if match:
+        return int(match.group(1).replace(',', ''))
+    return 0
+
+
+def legacy_split(text):
+    match = None
+    if "About" in text:
+        match = text.split('About')[1].split("results")[0].strip()
+    return int(match.replace(',', '')) if match else 0
+
+
+def load_corpus(page_kb):
+    with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+    # Real SERPs carry a few hundred KB of inline script before the stats node
+    padding = b'<script>' + b'var _g={};' * (page_kb * 100) + b'</script>'
+    corpus = []
+    for name, count in sorted(expected.items()):
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            raw = f.read()
+        # What a DOM-reading crawler gets: the stats node, or the page text without one
+        text = stats_text(raw) or ' '.join(_TAG.sub(' ', raw.decode('utf-8')).split())
+        raw = raw.replace(b'<body>', b'<body>' + padding, 1)
+        corpus.append((name, raw, text, count))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--page-kb', type=int, default=300)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.page_kb)
+    extractors = {
+        'legacy-regex': lambda raw, text: legacy_regex(text),
+        'legacy-split': lambda raw, text: legacy_split(text),
+        'text': lambda raw, text: extract_count(text),
+        'legacy-raw': lambda raw, text: legacy_regex(raw.decode('utf-8')),
+        'raw-html': lambda raw, text: count_from_html(raw),
+    }
+
+    report = []
+    for label, extractor in extractors.items():
+        wrong = []
+        for name, raw, text, count in corpus:
+            try:
+                got = extractor(raw, text)
+            except Exception:
+                got = 'error'
+            if got != count:
+                wrong.append(f"{name}: got {got}, expected {count}")
+        seconds = timeit.timeit(
+            lambda: [extractor(raw, text) for _, raw, text, _ in corpus], number=args.rounds)
+        report.append({
+            'extractor': label,
+            'correct': len(corpus) - len(wrong),
+            'total': len(corpus),
+            'us_per_page': round(seconds / (args.rounds * len(corpus)) * 1e6, 2),
+            'wrong': wrong,
+        })
+
+    baselines = {row['extractor']: row['us_per_page'] for row in report}
+    for row in report:
+        baseline = baselines['legacy-raw' if row['extractor'] in ('legacy-raw', 'raw-html') else 'legacy-regex']
+        row['vs_legacy'] = round(row['us_per_page'] / baseline, 2) if baseline else None
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    print(f"{'extractor':<14} {'correct':>9} {'us/page':>9} {'vs legacy':>10}")
+    for row in report:
+        print(f"{row['extractor']:<14} {row['correct']:>4}/{row['total']:<4} {row['us_per_page']:>9} "
+              f"{row['vs_legacy']:>9}x")
+    for row in report:
+        for miss in row['wrong']:
+            print(f"  {row['extractor']}: {miss}")
+
+
+if __name__ == '__main__':
+    main()
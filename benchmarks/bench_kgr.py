@@ -0,0 +1,46 @@
+"""Time kgr.score on synthetic tables.
+
+    python benchmarks/bench_kgr.py --rows 2000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kgr import normalize_keywords, score
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    keywords = pd.Series([f'Keyword  {i}' for i in range(args.rows)])
+
+    started = time.perf_counter()
+    keys = normalize_keywords(keywords)
+    normalized = time.perf_counter() - started
+
+    volumes = pd.DataFrame({'key': keys, 'keyword': keywords,
+                            'search_volume': rng.integers(0, 10000, args.rows)})
+    counts = pd.DataFrame({'key': keys.sample(frac=1.0, random_state=0).to_numpy(),
+                           'intitle_count': rng.integers(0, 100000, args.rows),
+                           'allintitle_count': rng.integers(0, 5000, args.rows)})
+
+    started = time.perf_counter()
+    scored = score(volumes, counts)
+    scoring = time.perf_counter() - started
+
+    print(f"rows:       {args.rows}")
+    print(f"normalize:  {normalized:.2f}s")
+    print(f"join+score: {scoring:.2f}s ({args.rows / scoring:,.0f} rows/s)")
+    print(scored['kgr_class'].value_counts(dropna=False).to_string())
+
+
+if __name__ == '__main__':
+    main()
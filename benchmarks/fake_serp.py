@@ -0,0 +1,211 @@
+"""A local stand-in for Google's /search page, for offline benchmarks.
+
+Serves pages with a ``#result-stats`` node in several locales. The count is
+derived from the query, so every run sees the same numbers. Latency, server
+errors, 429s, consent interstitials and CAPTCHA redirects can be injected at
+configurable rates to exercise the crawlers' retry and fallback paths.
+
+Point the crawlers at it with SERP_BASE_URL=http://127.0.0.1:<port>/search.
+GET /__stats returns every request served so far as JSON; /__reset clears it.
+
+    python benchmarks/fake_serp.py --port 8765 --latency 0.2 --captcha-rate 0.02
+"""
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+# Locale -> (<html lang>, stats text, no-results text); mirrors benchmarks/fixtures/serp
+_LOCALES = {
+    'en': ('en', 'About {count:,} results (0.{ms:02d} seconds)',
+           'did not match any documents'),
+    'de': ('de', 'Ungefähr {dotted} Ergebnisse (0,{ms:02d} Sekunden)',
+           'ergab keine Treffer'),
+    'fr': ('fr', 'Environ {spaced} résultats (0,{ms:02d} secondes)',
+           'ne correspond à aucun document'),
+    'es': ('es', 'Aproximadamente {count:,} resultados (0,{ms:02d} segundos)',
+           'no obtuvo ningún resultado'),
+    'zh': ('zh', '找到约 {count:,} 条结果 （用时 0.{ms:02d} 秒）',
+           '找不到和您查询的'),
+    'ja': ('ja', '約 {count:,} 件 （0.{ms:02d} 秒）',
+           'に一致する情報は見つかりませんでした'),
+}
+
+_PAGE = ('<!doctype html><html lang="{lang}"><head><meta charset="utf-8"><title>{query}</title>'
+         '</head><body><div id="search">{padding}</div>{body}</body></html>')
+_CONSENT = ('<!doctype html><html lang="en"><body><form action="https://consent.google.com/save" '
+            'method="POST"><button>Accept all</button></form></body></html>')
+_CAPTCHA = ('<!doctype html><html lang="en"><body><p>Our systems have detected unusual traffic '
+            'from your computer network.</p><form id="captcha-form"></form></body></html>')
+
+
+def expected_count(query):
+    """Deterministic result count for ``query``; 0 for about one query in 16."""
+    digest = zlib.crc32(query.encode('utf-8'))
+    if digest % 16 == 0:
+        return 0
+    return digest % 50000000
+
+
+def _locale_for(query, locales):
+    return locales[zlib.crc32(query.encode('utf-8'), 7) % len(locales)]
+
+
+def render_page(query, locale='en', padding=0):
+    lang, stats, no_results = _LOCALES[locale]
+    count = expected_count(query)
+    if count:
+        text = stats.format(count=count, ms=count % 100,
+                            dotted=f'{count:,}'.replace(',', '.'),
+                            spaced=f'{count:,}'.replace(',', ' '))
+        body = f'<div id="result-stats">{text}<nobr></nobr></div>'
+    else:
+        body = f'<div id="topstuff"><p>{query} {no_results}</p></div>'
+    return _PAGE.format(lang=lang, query=query.replace('<', '&lt;'),
+                        padding='x' * padding, body=body).encode('utf-8')
+
+
+class FakeSerp:
+    """Fault-injection settings plus the log of served requests."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, ratelimit_rate=0.0,
+                 consent_rate=0.0, captcha_rate=0.0, locales=('en',), padding=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.ratelimit_rate = ratelimit_rate
+        self.consent_rate = consent_rate
+        self.captcha_rate = captcha_rate
+        self.locales = tuple(locales)
+        self.padding = padding
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def outcome(self):
+        with self.lock:
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        for name, rate in (('error', self.error_rate), ('ratelimit', self.ratelimit_rate),
+                           ('consent', self.consent_rate), ('captcha', self.captcha_rate)):
+            if roll < rate:
+                return name, delay
+            roll -= rate
+        return 'ok', delay
+
+    def record(self, query, status, outcome, started):
+        with self.lock:
+            self.requests.append({'query': query, 'status': status, 'outcome': outcome,
+                                  'started': started, 'elapsed': time.time() - started})
+
+    def stats(self):
+        with self.lock:
+            return list(self.requests)
+
+    def reset(self):
+        with self.lock:
+            self.requests = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='text/html; charset=utf-8', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        serp = self.server.serp
+        url = urlsplit(self.path)
+        if url.path == '/__stats':
+            return self._send(200, json.dumps(serp.stats()).encode('utf-8'), 'application/json')
+        if url.path == '/__reset':
+            serp.reset()
+            return self._send(204)
+        if url.path.startswith('/sorry/'):
+            return self._send(429, _CAPTCHA.encode('utf-8'))
+        if url.path != '/search':
+            return self._send(404)
+
+        started = time.time()
+        query = parse_qs(url.query).get('q', [''])[0]
+        outcome, delay = serp.outcome()
+        time.sleep(delay)
+        if outcome == 'error':
+            status = 500
+            self._send(status, b'server error')
+        elif outcome == 'ratelimit':
+            status = 429
+            self._send(status, b'too many requests', headers=[('Retry-After', '1')])
+        elif outcome == 'captcha':
+            status = 302
+            self._send(status, headers=[('Location', f'/sorry/index?continue={quote(self.path)}')])
+        elif outcome == 'consent':
+            status = 200
+            self._send(status, _CONSENT.encode('utf-8'))
+        else:
+            status = 200
+            self._send(status, render_page(query, _locale_for(query, serp.locales), serp.padding))
+        serp.record(query, status, outcome, started)
+
+
+def start_server(serp, host='127.0.0.1', port=0):
+    """Serve ``serp`` from a background thread; returns the server (``server_address`` has the port)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.serp = serp
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.15, help='seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.05, help='+/- seconds of latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of HTTP 500 responses')
+    parser.add_argument('--ratelimit-rate', type=float, default=0.0, help='share of HTTP 429 responses')
+    parser.add_argument('--consent-rate', type=float, default=0.0, help='share of consent interstitials')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='share of /sorry/ CAPTCHA redirects')
+    parser.add_argument('--locales', default='en,de,fr,es,zh,ja',
+                        help=f"comma-separated page locales ({', '.join(_LOCALES)})")
+    parser.add_argument('--padding', type=int, default=250000,
+                        help='filler bytes per page, real SERPs are ~300KB')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def from_arguments(args):
+    return FakeSerp(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    ratelimit_rate=args.ratelimit_rate, consent_rate=args.consent_rate,
+                    captcha_rate=args.captcha_rate, locales=args.locales.split(','),
+                    padding=args.padding, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(from_arguments(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Fake SERP listening, export SERP_BASE_URL=http://{host}:{port}/search")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
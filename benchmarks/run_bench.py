@@ -0,0 +1,238 @@
+"""End-to-end crawler benchmark against the local fake SERP server.
+
+Starts benchmarks/fake_serp.py in-process, then runs each crawler entry point
+as a subprocess with SERP_BASE_URL pointing at it (rate limiter and SERP cache
+off, checkpoints in a scratch directory) and reports, per crawler:
+
+  keywords_per_min   keywords finished per minute of wall time
+  latency_p50/p95    per query, first request to final response (retries included)
+  retries            requests beyond one per query
+  peak_rss_mb        peak resident memory of the crawler process tree
+  accuracy           share of counts matching the server's deterministic count
+
+No network access or R2 credentials are needed; process_keywords.py runs
+with --local. Browser crawlers still need Chrome / Playwright installed.
+
+    python benchmarks/run_bench.py --keywords 200 --crawlers main-http,main-browser \\
+        --captcha-rate 0.02 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_serp import add_arguments, expected_count, from_arguments, start_server
+from result_files import read_result_csv
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _main_cmd(run_id, keywords_path, concurrency, backend=None):
+    cmd = [sys.executable, os.path.join(ROOT, 'main.py'), run_id, '', keywords_path,
+           '--concurrency', str(concurrency), '--no-cache']
+    if backend:
+        cmd += ['--backend', backend]
+    return cmd
+
+
+def _process_cmd(run_id, keywords_path, concurrency, backend=None):
+    cmd = [sys.executable, os.path.join(ROOT, 'process_keywords.py'), '-', run_id, 'bench',
+           '--local', 'local']
+    if backend:
+        cmd += ['--backend', backend]
+    if concurrency > 1:
+        cmd += ['--workers', str(concurrency)]
+    return cmd
+
+
+def _main_pl_cmd(run_id, keywords_path, concurrency, backend=None):
+    return [sys.executable, os.path.join(ROOT, 'main-pl.py'), run_id, '', keywords_path,
+            '--contexts', str(concurrency)]
+
+
+# name -> (command builder, backend, keywords on stdin, result reader)
+CRAWLERS = {
+    'main-browser': (_main_cmd, None, False, 'csv'),
+    'main-http': (_main_cmd, 'http', False, 'csv'),
+    'main-auto': (_main_cmd, 'auto', False, 'csv'),
+    'main-pl': (_main_pl_cmd, None, False, 'csv-repo'),
+    'process-keywords': (_process_cmd, None, True, 'json'),
+    'process-keywords-http': (_process_cmd, 'http', True, 'json'),
+}
+
+
+def _read_results(kind, workdir, run_id):
+    """{(keyword, search_type): count} from whatever the crawler wrote."""
+    if kind == 'json':
+        path = os.path.join(workdir, 'local', f'{run_id}.json')
+        counts = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                for record in json.load(file):
+                    for search_type in ('intitle', 'allintitle'):
+                        if record.get(search_type) is not None:
+                            counts[(record['keyword'], search_type)] = record[search_type]
+        return counts
+    # main-pl.py writes next to itself rather than into the working directory
+    base = ROOT if kind == 'csv-repo' else workdir
+    path = os.path.join(base, 'results', f'{run_id}.csv')
+    if not os.path.exists(path):
+        return {}
+    try:
+        return {(keyword, search_type): count
+                for keyword, search_type, count in read_result_csv(path) if count is not None}
+    finally:
+        if kind == 'csv-repo':
+            os.remove(path)
+
+
+def _percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+def _tree_rss(pid):
+    try:
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+    except psutil.Error:
+        return 0
+
+
+def run_crawler(name, keywords, serp, base_url, concurrency, timeout):
+    build, backend, use_stdin, kind = CRAWLERS[name]
+    run_id = f'bench-{name}-{os.getpid()}'
+    workdir = tempfile.mkdtemp(prefix=f'{name}-')
+    keywords_path = os.path.join(workdir, 'keywords.txt')
+    with open(keywords_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(keywords) + '\n')
+    env = dict(os.environ, SERP_BASE_URL=base_url, RATE_LIMIT='off', SERP_CACHE='off',
+               CHECKPOINT_DIR=os.path.join(workdir, 'checkpoints'), PYTHONUNBUFFERED='1')
+
+    serp.reset()
+    log_path = os.path.join(workdir, 'crawler.log')
+    peak_tree = [0]
+    with open(log_path, 'wb') as log, open(keywords_path, 'rb') as stdin:
+        started = time.perf_counter()
+        process = subprocess.Popen(build(run_id, keywords_path, concurrency, backend), cwd=workdir,
+                                   env=env, stdin=stdin if use_stdin else subprocess.DEVNULL,
+                                   stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        done = threading.Event()
+
+        def watch():
+            # Whole process tree (Chrome/Firefox children included) when psutil is available
+            while not done.wait(0.25):
+                if psutil is not None:
+                    peak_tree[0] = max(peak_tree[0], _tree_rss(process.pid))
+                if time.perf_counter() - started > timeout:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    return
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - started
+        done.set()
+
+    counts = _read_results(kind, workdir, run_id)
+    requests = serp.stats()
+    by_query = {}
+    for request in requests:
+        by_query.setdefault(request['query'], []).append(request)
+    latencies = []
+    for served in by_query.values():
+        first = min(r['started'] for r in served)
+        last = max(r['started'] + r['elapsed'] for r in served)
+        latencies.append(last - first)
+    correct = sum(1 for (keyword, search_type), count in counts.items()
+                  if count == expected_count(f'{search_type}:"{keyword}"'))
+    expected_queries = len(keywords) * 2
+
+    result = {
+        'crawler': name,
+        'exit_code': process.returncode,
+        'keywords': len(keywords),
+        'wall_seconds': round(wall, 3),
+        'keywords_per_min': round(len(keywords) / wall * 60, 1) if wall else None,
+        'queries_expected': expected_queries,
+        'queries_completed': len(counts),
+        'requests': len(requests),
+        'retries': len(requests) - len(by_query),
+        'outcomes': {outcome: sum(1 for r in requests if r['outcome'] == outcome)
+                     for outcome in sorted({r['outcome'] for r in requests})},
+        'latency_p50': round(_percentile(latencies, 0.5), 4) if latencies else None,
+        'latency_p95': round(_percentile(latencies, 0.95), 4) if latencies else None,
+        # ru_maxrss is KiB on Linux: the crawler process and any children it reaped
+        'peak_rss_mb': round(max(usage.ru_maxrss * 1024, peak_tree[0]) / 2 ** 20, 1),
+        'accuracy': round(correct / expected_queries, 4) if expected_queries else None,
+        'log': log_path,
+    }
+    if process.returncode == 0:
+        shutil.rmtree(workdir, ignore_errors=True)
+        result.pop('log')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keywords', type=int, default=100, help='synthetic keywords per crawler')
+    parser.add_argument('--crawlers', default='main-http,main-browser',
+                        help=f"comma-separated, from: {', '.join(CRAWLERS)}")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='main.py --concurrency / main-pl.py --contexts / process_keywords.py --workers')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds before a crawler is killed')
+    parser.add_argument('--output', help='also write the JSON report here')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    names = args.crawlers.split(',')
+    unknown = [name for name in names if name not in CRAWLERS]
+    if unknown:
+        parser.error(f"unknown crawler(s): {', '.join(unknown)}")
+
+    serp = from_arguments(args)
+    server = start_server(serp)
+    host, port = server.server_address[:2]
+    base_url = f'http://{host}:{port}/search'
+    keywords = [f'benchmark keyword {n:05d}' for n in range(args.keywords)]
+
+    report = {
+        'server': {key: getattr(args, key) for key in
+                   ('latency', 'jitter', 'error_rate', 'ratelimit_rate', 'consent_rate',
+                    'captcha_rate', 'locales', 'padding', 'seed')},
+        'concurrency': args.concurrency,
+        'results': [],
+    }
+    try:
+        for name in names:
+            print(f"Running {name} on {len(keywords)} keywords...", file=sys.stderr)
+            result = run_crawler(name, keywords, serp, base_url, args.concurrency, args.timeout)
+            report['results'].append(result)
+            print(json.dumps(result), file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import os
+import glob
+import json
+import time
+import threading
+
+DEFAULT_CHECKPOINT_DIR = 'checkpoints'
+
+
+class Checkpoint:
+    """Append-only JSONL log of completed results for one run.
+
+    Records are buffered and flushed (with fsync) every ``flush_every``
+    records or ``flush_interval`` seconds, whichever comes first, so a killed
+    run loses at most that much work. Worker processes write their own
+    ``part`` file next to the main one; ``load()`` reads them all.
+    """
+
+    def __init__(self, run_id, directory=None, part=None, flush_every=20, flush_interval=5.0):
+        self.run_id = run_id
+        self.directory = directory or os.getenv('CHECKPOINT_DIR', DEFAULT_CHECKPOINT_DIR)
+        name = f'{run_id}.jsonl' if part is None else f'{run_id}.{part}.jsonl'
+        self.path = os.path.join(self.directory, name)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._file = None
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def paths(self):
+        escaped = glob.escape(str(self.run_id))
+        return sorted(glob.glob(os.path.join(self.directory, f'{escaped}.jsonl')) +
+                      glob.glob(os.path.join(self.directory, f'{escaped}.*.jsonl')))
+
+    def load(self):
+        """All records written so far, across every part file."""
+        records = []
+        for path in self.paths():
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break  # torn last line from a killed run
+        return records
+
+    def append(self, record):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(record) + '\n')
+            self._pending += 1
+            if (self._pending >= self.flush_every or
+                    time.monotonic() - self._flushed_at >= self.flush_interval):
+                self._flush()
+
+    def _flush(self):
+        if self._file is not None and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        """Delete every part of this run's checkpoint (after a complete run)."""
+        self.close()
+        for path in self.paths():
+            os.remove(path)
+
+
+def open_checkpoint(run_id, resume_id=None, part=None):
+    """Checkpoint for ``run_id`` plus the records to resume from.
+
+    Without ``resume_id`` any stale checkpoint for ``run_id`` is discarded.
+    When resuming from a different run, its records are carried over into
+    this run's checkpoint so a second interruption loses nothing.
+    """
+    checkpoint = Checkpoint(run_id, part=part)
+    if resume_id is None:
+        if part is None:
+            checkpoint.remove()
+        return checkpoint, []
+    records = Checkpoint(resume_id).load()
+    if str(resume_id) != str(run_id):
+        checkpoint.remove()
+        for record in records:
+            checkpoint.append(record)
+        checkpoint.flush()
+    print(f"Resuming from checkpoint {resume_id}: {len(records)} completed result(s)")
+    return checkpoint, records
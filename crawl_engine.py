@@ -0,0 +1,163 @@
+import asyncio
+import time
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, NamedTuple, Optional
+from metrics import outcome_code
+from retry import failure_reason
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 60.0
+
+_STOP = object()
+_clock = contextvars.ContextVar('crawl_clock', default=None)
+
+
+class JobResult(NamedTuple):
+    job: Any
+    value: Any = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    code: Optional[str] = None  # metrics.outcome_code of the failure
+    reason: Optional[str] = None  # retry.failure_reason of the failure
+
+
+class _Clock:
+    """Time a job has spent working, i.e. outside ``waiting()`` blocks."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.waited = 0.0
+        self.depth = 0
+        self.wait_started = None
+        self.abandoned = False  # timed out: don't start anything new
+
+    def working(self):
+        now = time.monotonic()
+        current = now - self.wait_started if self.wait_started is not None else 0.0
+        return now - self.started - self.waited - current
+
+
+@contextlib.contextmanager
+def waiting():
+    """Mark a wait for a query slot (circuit breaker, rate limiter, free tab).
+
+    Inside ``crawl`` the time spent here does not count towards the per-job
+    timeout, and a job that has already timed out stops here instead of
+    queueing for another navigation. Outside ``crawl`` it does nothing.
+    """
+    clock = _clock.get()
+    if clock is None:
+        yield
+        return
+    if clock.abandoned:
+        raise asyncio.TimeoutError("the query timed out before its next step")
+    if clock.depth == 0:
+        clock.wait_started = time.monotonic()
+    clock.depth += 1
+    try:
+        yield
+    finally:
+        clock.depth -= 1
+        if clock.depth == 0:
+            clock.waited += time.monotonic() - clock.wait_started
+            clock.wait_started = None
+
+
+async def _until_done(future, clock, timeout):
+    # Like wait_for, but only the job's working time counts towards ``timeout``
+    if timeout is None:
+        return await future
+    while True:
+        remaining = timeout - clock.working()
+        if remaining <= 0:
+            clock.abandoned = True
+            future.cancel()
+            raise asyncio.TimeoutError
+        # While the job waits for a slot its clock stands still: check back later
+        done, _ = await asyncio.wait({future}, timeout=min(remaining, 1.0) if clock.depth else remaining)
+        if done:
+            return future.result()
+
+
+async def _produce(jobs, queue, concurrency):
+    try:
+        if hasattr(jobs, '__aiter__'):
+            async for job in jobs:
+                await queue.put(job)
+        else:
+            for job in jobs:
+                await queue.put(job)
+    finally:
+        for _ in range(concurrency):
+            await queue.put(_STOP)
+
+
+async def _work(fetch, queue, done, executor, timeout):
+    loop = asyncio.get_running_loop()
+    while True:
+        job = await queue.get()
+        if job is _STOP:
+            await done.put(_STOP)
+            return
+        started = time.monotonic()
+        clock = _Clock()
+        token = _clock.set(clock)  # seen by the fetch through its copy of the context
+        try:
+            if executor is None:
+                future = asyncio.ensure_future(fetch(job))
+            else:
+                future = loop.run_in_executor(executor, contextvars.copy_context().run, fetch, job)
+        finally:
+            _clock.reset(token)
+        try:
+            value = await _until_done(future, clock, timeout)
+            result = JobResult(job, value, None, time.monotonic() - started)
+        except asyncio.TimeoutError:
+            result = JobResult(job, None, f"timed out after {timeout}s", time.monotonic() - started, 'timeout',
+                               'timeout')
+        except Exception as e:
+            result = JobResult(job, None, str(e), time.monotonic() - started, outcome_code(e), failure_reason(e))
+        await done.put(result)
+
+
+async def crawl(jobs: Iterable, fetch: Callable[[Any], Any],
+                concurrency: int = DEFAULT_CONCURRENCY,
+                timeout: Optional[float] = DEFAULT_TIMEOUT) -> AsyncIterator[JobResult]:
+    """Run the blocking ``fetch(job)`` over ``jobs`` with at most ``concurrency``
+    calls in flight, yielding a ``JobResult`` per job in completion order.
+    ``fetch`` may also be a coroutine function (async Playwright); it then runs
+    on the event loop instead of a worker thread and is cancelled on timeout.
+
+    ``jobs`` may be a plain or an async iterable; it is consumed lazily through
+    a bounded queue, so producers are throttled by the workers. ``timeout``
+    covers the fetch's own work: time it spends in ``waiting()`` (held by the
+    circuit breaker or the rate limiter) is not counted. A timed-out fetch is
+    reported as an error; a thread still navigating runs to completion in the
+    background (browser calls cannot be interrupted mid-navigation), but does
+    not queue for another query.
+    """
+    concurrency = max(1, int(concurrency))
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = asyncio.Queue()
+    executor = None
+    if not asyncio.iscoroutinefunction(fetch):
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawl')
+    tasks = [asyncio.ensure_future(_produce(jobs, queue, concurrency))]
+    tasks += [asyncio.ensure_future(_work(fetch, queue, done, executor, timeout))
+              for _ in range(concurrency)]
+    try:
+        running = concurrency
+        while running:
+            result = await done.get()
+            if result is _STOP:
+                running -= 1
+                continue
+            yield result
+        await tasks[0]  # surface errors raised while reading the jobs
+    finally:
+        for task in tasks:
+            task.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,404 @@
+"""Per-keyword progress events for the front end, without polling R2.
+
+Workers append JSON lines to an append-only log per batch group,
+``.cache/events/<batch_group_id>.jsonl`` (EVENT_LOG_DIR):
+
+  {"type": "batch_started", "batchId": ..., "keywords": n or null}
+  {"type": "keywords", "batchId": ..., "results": [{keyword, intitle, allintitle}, ...]}
+  {"type": "batch_done", "batchId": ..., "keywords": n, "hasErrors": bool}
+  {"type": "group_done", "totalBatches": n or null, "hasErrors": bool}
+
+``group_done`` is appended once the group's final rollup is published (or the
+lease queue has published every batch); it ends the stream even for clients
+that never learned the group size.
+
+Keyword results are coalesced: a process writes at most EVENTS_MAX_RATE
+(default 4) ``keywords`` events per second, each carrying every result
+finished since the previous one. Shard and worker processes on the host all
+append to the same file.
+
+``python events.py serve`` tails those logs and streams them as Server-Sent
+Events in the message shape sse.html already handles
+(``GET /results?batchGroupId=<id>``): group progress down to the keyword,
+the results that are new since the previous message and, with
+``--volumes``, their KGR. Messages are again coalesced to EVENTS_MAX_RATE
+per client; a reconnecting client resumes from Last-Event-ID. EVENTS=off
+turns publishing off. The server drops a finished group's log
+EVENTS_RETAIN_FINISHED seconds (default 3600) after its ``group_done`` and
+any log untouched for EVENTS_RETAIN_IDLE seconds (default 7 days);
+``python events.py prune`` does the same once. Any page may read the
+stream without credentials; origins listed in EVENTS_ALLOWED_ORIGINS
+(comma separated) may also send them, as sse.html does.
+
+    python events.py serve --port 8787 [--volumes volumes.csv]
+    python events.py prune
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_LOG_DIR = os.path.join('.cache', 'events')
+DEFAULT_MAX_RATE = 4.0
+DEFAULT_PORT = 8787
+KEEPALIVE_SECONDS = 15.0
+TAIL_INTERVAL = 0.1
+DEFAULT_RETAIN_FINISHED = 3600.0       # seconds a finished group's log is kept for late readers
+DEFAULT_RETAIN_IDLE = 7 * 24 * 3600.0  # seconds before an abandoned log is dropped
+PRUNE_INTERVAL = 300.0
+RESULT_FIELDS = ('keyword', 'intitle', 'allintitle', 'allintitle_max', 'error', 'reason')
+
+
+def events_enabled():
+    return os.getenv('EVENTS', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def max_rate():
+    return float(os.getenv('EVENTS_MAX_RATE', DEFAULT_MAX_RATE))
+
+
+def allowed_origins():
+    return {o.strip().rstrip('/') for o in os.getenv('EVENTS_ALLOWED_ORIGINS', '').split(',') if o.strip()}
+
+
+def log_path(batch_group_id, directory=None):
+    directory = directory or os.getenv('EVENT_LOG_DIR', DEFAULT_LOG_DIR)
+    safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in batch_group_id)
+    return os.path.join(directory, f'{safe}.jsonl')
+
+
+def append_event(path, event):
+    """Append one event as a single write, so concurrent processes never interleave lines."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = (json.dumps(event, default=str) + '\n').encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+class ProgressReporter:
+    """Publishes one batch's progress; ``keyword()`` calls are coalesced to ``rate`` events/s."""
+
+    def __init__(self, batch_group_id, batch_id, rate=None, path=None):
+        self.batch_group_id = batch_group_id
+        self.batch_id = batch_id
+        self.interval = 1.0 / (rate or max_rate())
+        self.path = path or log_path(batch_group_id)
+        self._pending = []
+        self._last_flush = 0.0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _publish(self, event_type, **fields):
+        event = {'type': event_type, 'batchGroupId': self.batch_group_id, 'batchId': self.batch_id,
+                 'ts': round(time.time(), 3), 'pid': os.getpid()}
+        event.update(fields)
+        try:
+            append_event(self.path, event)
+        except OSError as e:
+            print(f"Error publishing progress event: {str(e)}")
+
+    def start(self, keywords=None):
+        self._publish('batch_started', keywords=keywords)
+
+    def keyword(self, result):
+        with self._lock:
+            self._pending.append({field: result[field] for field in RESULT_FIELDS if field in result})
+            wait = self._last_flush + self.interval - time.monotonic()
+            if wait <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                # Publish the stragglers even if no further keyword finishes soon
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._publish('keywords', results=self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def finish(self, keywords=None, has_errors=False):
+        self.flush()
+        self._publish('batch_done', keywords=keywords, hasErrors=bool(has_errors))
+
+
+def finish_group(batch_group_id, total_batches=None, has_errors=False, path=None):
+    """Publish that every batch of the group is done (idempotent for readers)."""
+    if not events_enabled() or not batch_group_id:
+        return
+    event = {'type': 'group_done', 'batchGroupId': batch_group_id, 'totalBatches': total_batches,
+             'hasErrors': bool(has_errors), 'ts': round(time.time(), 3), 'pid': os.getpid()}
+    try:
+        append_event(path or log_path(batch_group_id), event)
+    except OSError as e:
+        print(f"Error publishing progress event: {str(e)}")
+
+
+def prune_logs(directory=None, retain_finished=None, retain_idle=None):
+    """Delete logs of groups finished ``retain_finished`` seconds ago and logs idle for ``retain_idle``."""
+    directory = directory or os.getenv('EVENT_LOG_DIR', DEFAULT_LOG_DIR)
+    retain_finished = float(os.getenv('EVENTS_RETAIN_FINISHED', DEFAULT_RETAIN_FINISHED)
+                            if retain_finished is None else retain_finished)
+    retain_idle = float(os.getenv('EVENTS_RETAIN_IDLE', DEFAULT_RETAIN_IDLE) if retain_idle is None else retain_idle)
+    removed = 0
+    now = time.time()
+    for name in (os.listdir(directory) if os.path.isdir(directory) else []):
+        path = os.path.join(directory, name)
+        if not name.endswith('.jsonl'):
+            continue
+        try:
+            age = now - os.path.getmtime(path)
+            if age < retain_finished or (age < retain_idle and not _finished(path)):
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue  # being written or already removed by another pruner
+    return removed
+
+
+def _finished(path):
+    # group_done is the last event of a finished group: the tail of the log is enough
+    with open(path, 'rb') as file:
+        file.seek(max(0, os.path.getsize(path) - 4096))
+        return b'"group_done"' in file.read()
+
+
+def get_reporter(batch_group_id, batch_id):
+    """Reporter for a batch, or None when EVENTS=off or there is no group to report to."""
+    if not events_enabled() or not batch_group_id:
+        return None
+    return ProgressReporter(batch_group_id, batch_id)
+
+
+class GroupState:
+    """Progress of one batch group, folded from its event log."""
+
+    def __init__(self, total_batches=None, volumes=None):
+        self.total_batches = total_batches
+        self.volumes = volumes or {}
+        self.batches = {}  # batch_id -> {'keywords': n or None, 'done': n, 'finished': bool, 'errors': bool}
+        self.new_results = []
+        self.finished = False  # a group_done event was seen
+        self.errors = False
+
+    def apply(self, event):
+        if event['type'] == 'group_done':
+            self.finished = True
+            self.errors = self.errors or bool(event.get('hasErrors'))
+            if event.get('totalBatches') is not None:
+                self.total_batches = event['totalBatches']
+            return
+        batch = self.batches.setdefault(event.get('batchId'),
+                                        {'keywords': None, 'done': 0, 'finished': False, 'errors': False})
+        if event['type'] == 'batch_started':
+            # A re-run batch starts over
+            batch.update(keywords=event.get('keywords'), done=0, finished=False, errors=False)
+        elif event['type'] == 'keywords':
+            batch['done'] += len(event['results'])
+            batch['errors'] = batch['errors'] or any('error' in result for result in event['results'])
+            self.new_results.extend(self._score(result) for result in event['results'])
+        elif event['type'] == 'batch_done':
+            batch.update(finished=True, errors=bool(event.get('hasErrors')))
+            if event.get('keywords') is not None:
+                batch['keywords'] = event['keywords']
+
+    def _score(self, result):
+        volume = self.volumes.get(result.get('keyword'))
+        if volume and result.get('allintitle') is not None:
+            kgr = result['allintitle'] / volume
+            result = dict(result, searchVolume=volume, kgr=round(kgr, 4), kgrClass=kgr_class(kgr))
+        return result
+
+    def completed(self):
+        done = sum(1 for batch in self.batches.values() if batch['finished'])
+        return self.finished or (self.total_batches is not None and done >= self.total_batches)
+
+    def message(self):
+        """The next SSE payload; takes the results collected since the previous one."""
+        results, self.new_results = self.new_results, []
+        totals = [batch['keywords'] for batch in self.batches.values()]
+        return {
+            'status': 'completed' if self.completed() else 'progress',
+            'completedBatches': sum(1 for batch in self.batches.values() if batch['finished']),
+            'totalBatches': self.total_batches if self.total_batches is not None else len(self.batches),
+            'completedKeywords': sum(batch['done'] for batch in self.batches.values()),
+            'totalKeywords': sum(totals) if None not in totals else None,
+            'hasErrors': self.errors or any(batch['errors'] for batch in self.batches.values()),
+            'results': results,
+        }
+
+
+def kgr_class(kgr):
+    # Same buckets as kgr.KGR_CLASSES / getKGRClass in sse.js
+    if kgr <= 0.25:
+        return 'kgr-excellent'
+    if kgr <= 0.5:
+        return 'kgr-good'
+    if kgr <= 1.0:
+        return 'kgr-moderate'
+    return 'kgr-difficult'
+
+
+def _total_batches(batch_group_id):
+    # One GET of the published rollup for the group size; None without R2 access
+    try:
+        from progress import read_status
+        status = read_status(batch_group_id)
+    except Exception:
+        return None
+    return (status or {}).get('totalBatches')
+
+
+def serve(port=DEFAULT_PORT, host='0.0.0.0', directory=None, volumes=None, rate=None):
+    """Stream the event logs in ``directory`` as Server-Sent Events until interrupted."""
+    interval = 1.0 / (rate or max_rate())
+    origins = allowed_origins()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            batch_group_id = (query.get('batchGroupId') or [None])[0]
+            if url.path not in ('/results', '/events') or not batch_group_id:
+                self.send_error(404 if batch_group_id else 400)
+                return
+            total = (query.get('totalBatches') or [None])[0]
+            try:
+                total = int(total) if total else _total_batches(batch_group_id)
+                if total is not None and total < 0:
+                    raise ValueError(total)
+            except ValueError:
+                self.send_error(400, 'totalBatches must be a non-negative integer')
+                return
+            state = GroupState(total, volumes)
+            self.close_connection = True  # the stream ends the response
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            origin = self.headers.get('Origin')
+            if origin and origin.rstrip('/') in origins:
+                # Credentials only for configured origins, never a reflected one
+                self.send_header('Access-Control-Allow-Origin', origin)
+                self.send_header('Access-Control-Allow-Credentials', 'true')
+                self.send_header('Vary', 'Origin')
+            else:
+                self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            try:
+                self._stream(log_path(batch_group_id, directory), state)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _send(self, payload, offset=None):
+            lines = [f'id: {offset}'] if offset is not None else []
+            lines.append(f'data: {json.dumps(payload, default=str)}')
+            self.wfile.write(('\n'.join(lines) + '\n\n').encode('utf-8'))
+            self.wfile.flush()
+
+        def _stream(self, path, state):
+            self._send({'status': 'connected'})
+            # The whole log is replayed to rebuild the state; results already
+            # seen by a reconnecting client are not sent again
+            resume = self.headers.get('Last-Event-ID')
+            seen = int(resume) if resume and resume.isdigit() else 0
+            offset, partial = 0, b''
+            changed, last_sent, last_write = False, 0.0, time.monotonic()
+            while True:
+                if os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        file.seek(offset + len(partial))
+                        chunk = file.read()
+                    lines = (partial + chunk).split(b'\n')
+                    partial = lines.pop()  # a line still being written
+                    for line in lines:
+                        offset += len(line) + 1
+                        if line.strip():
+                            state.apply(json.loads(line))
+                            changed = True
+                        if offset <= seen:
+                            state.new_results = []
+                now = time.monotonic()
+                if changed and now - last_sent >= interval:
+                    message = state.message()
+                    self._send(message, offset)
+                    changed, last_sent, last_write = False, now, now
+                    if message['status'] == 'completed':
+                        return
+                elif now - last_write >= KEEPALIVE_SECONDS:
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    last_write = now
+                time.sleep(TAIL_INTERVAL)
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    stop = threading.Event()
+
+    def prune():
+        while not stop.wait(PRUNE_INTERVAL):
+            try:
+                prune_logs(directory)
+            except OSError as e:
+                print(f"Error pruning event logs: {str(e)}")
+    threading.Thread(target=prune, daemon=True).start()
+    print(f"Streaming progress events from {directory or os.getenv('EVENT_LOG_DIR', DEFAULT_LOG_DIR)} "
+          f"on http://{host}:{server.server_address[1]}/results?batchGroupId=<id>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+def load_volumes(paths):
+    """{normalized keyword: search volume} from search-volume exports (needs pandas)."""
+    from kgr import load_volumes as load_volume_frame
+    frame = load_volume_frame(paths).dropna(subset=['search_volume'])
+    return dict(zip(frame['key'], frame['search_volume'].astype(float)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Progress event stream for crawler workers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='stream event logs as Server-Sent Events')
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--dir', help=f'event log directory (EVENT_LOG_DIR, default {DEFAULT_LOG_DIR})')
+    serve_parser.add_argument('--volumes', nargs='+', help='search-volume export CSV(s) for early KGR scores')
+    serve_parser.add_argument('--rate', type=float, help='messages per second per client (EVENTS_MAX_RATE)')
+    prune_parser = commands.add_parser('prune', help='drop logs of finished and abandoned groups')
+    prune_parser.add_argument('--dir', help=f'event log directory (EVENT_LOG_DIR, default {DEFAULT_LOG_DIR})')
+    args = parser.parse_args()
+
+    if args.command == 'prune':
+        print(f"Removed {prune_logs(args.dir)} event log(s)")
+        return
+    volumes = load_volumes(args.volumes) if args.volumes else None
+    serve(args.port, args.host, args.dir, volumes, args.rate)
+
+
+if __name__ == '__main__':
+    main()
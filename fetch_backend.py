@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+from getbrowser import get_pool
+from serp import BlockedError, build_search_url, fetch_count
+from result_count import count_from_html, is_captcha_page, is_consent_page
+from metrics import get_metrics
+from crawl_engine import waiting
+
+BACKENDS = ('browser', 'http', 'auto')
+DEFAULT_BACKEND = 'browser'
+HTTP_TIMEOUT = 10.0
+
+_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+# Pre-accepted consent cookies so EU egress IPs get results instead of the consent wall
+_COOKIES = {'CONSENT': 'YES+', 'SOCS': 'CAESEwgDEgk0ODE3Nzk3MjQaAmVuIAEaBgiA_LyaBg'}
+
+
+class FallbackRequired(Exception):
+    """The lightweight backend could not read a count; retry with the browser."""
+
+    def __init__(self, message='', reason='no_stats'):
+        super().__init__(message)
+        self.reason = reason  # retry.failure_reason code
+
+
+class HttpBackend:
+    """Fetch SERP HTML over a pooled keep-alive HTTP session.
+
+    Consent walls, CAPTCHA/429 responses and JavaScript-only pages raise
+    ``FallbackRequired`` rather than returning a bogus zero.
+    """
+
+    name = 'http'
+
+    def __init__(self, limiter=None, timeout=HTTP_TIMEOUT, pool_size=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.limiter = limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(_HEADERS)
+        self.session.cookies.update(_COOKIES)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def count(self, keyword, search_type):
+        metrics = get_metrics()
+        if self.limiter is not None:
+            with waiting(), metrics.stage('rate_limit_wait'):
+                self.limiter.acquire()
+        started = time.monotonic()
+        with metrics.stage('http_fetch'):
+            response = self.session.get(build_search_url(keyword, search_type), timeout=self.timeout)
+        elapsed = time.monotonic() - started
+        metrics.incr('bytes_received', len(response.content))
+        blocked = (response.status_code == 429 or '/sorry/' in response.url or
+                   is_captcha_page(response.content))
+        if self.limiter is not None:
+            self.limiter.report(blocked=blocked, elapsed=elapsed)
+        if blocked:
+            raise FallbackRequired(f"blocked (HTTP {response.status_code})",
+                                   reason='rate_limited' if response.status_code == 429 else 'captcha')
+        if 'consent.google.' in response.url or is_consent_page(response.content):
+            raise FallbackRequired("consent page", reason='consent')
+        response.raise_for_status()
+        with metrics.stage('parse'):
+            count = count_from_html(response.content)
+        if count is None:
+            raise FallbackRequired("no readable #result-stats in HTML")
+        return count
+
+    def close(self):
+        self.session.close()
+
+
+class BrowserBackend:
+    """Render the SERP in a pooled Chromium tab (the original path)."""
+
+    name = 'browser'
+
+    def __init__(self, pool=None, limiter=None):
+        self.pool = pool if pool is not None else get_pool()
+        self.limiter = limiter
+
+    def count(self, keyword, search_type):
+        return fetch_count(self.pool, keyword, search_type, self.limiter)
+
+    def close(self):
+        pass  # the pool is owned by the caller
+
+
+class FallbackBackend:
+    """Try HTTP first and fall back to the browser when it cannot read a count."""
+
+    name = 'auto'
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def count(self, keyword, search_type):
+        try:
+            return self.primary.count(keyword, search_type)
+        except FallbackRequired as e:
+            with self._lock:
+                self.fallbacks += 1
+            print(f"Falling back to browser for '{keyword}' ({search_type}): {e}")
+            return self.fallback.count(keyword, search_type)
+
+    def close(self):
+        if self.fallbacks:
+            print(f"Browser fallback used for {self.fallbacks} queries")
+        self.primary.close()
+        self.fallback.close()
+
+
+class _StrictHttp:
+    # HTTP only: a page that would need the browser is a failure, reported as blocked
+    name = 'http'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def count(self, keyword, search_type):
+        try:
+            return self.backend.count(keyword, search_type)
+        except FallbackRequired as e:
+            raise BlockedError(str(e), reason=e.reason)
+
+    def close(self):
+        self.backend.close()
+
+
+def get_backend(name=None, pool=None, limiter=None, concurrency=1):
+    """Build the backend named by ``name`` (or FETCH_BACKEND), default 'browser'."""
+    name = name or os.getenv('FETCH_BACKEND', DEFAULT_BACKEND)
+    if name == 'browser':
+        return BrowserBackend(pool, limiter)
+    if name == 'http':
+        return _StrictHttp(HttpBackend(limiter, pool_size=concurrency))
+    if name == 'auto':
+        return FallbackBackend(HttpBackend(limiter, pool_size=concurrency), BrowserBackend(pool, limiter))
+    raise ValueError(f"Unknown fetch backend '{name}', expected one of {', '.join(BACKENDS)}")
@@ -1,11 +1,35 @@
-from dotenv import load_dotenv
 from DrissionPage import Chromium, ChromiumOptions
 import os
 import json
+import time
 import platform
+import tempfile
 import subprocess
+import threading
+import atexit
+from queue import Queue, Empty
+from functools import lru_cache
 from pathlib import Path
+from metrics import get_metrics
+from serp import LEAN_BLOCKED_URLS, lean_load_enabled
 
+try:
+    import fcntl
+except ImportError:  # Windows: no host-wide renderer cap
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_MAX_PAGES = 1000      # page loads before a browser is restarted
+DEFAULT_MAX_RSS_MB = 2048     # browser + renderer RSS before a restart (0: no limit)
+RSS_CHECK_INTERVAL = 5.0      # seconds between RSS samples of one browser
+RENDERER_WAIT = 300.0         # seconds to wait for a host-wide renderer slot
+DEFAULT_CHECKOUT_TIMEOUT = 600.0  # seconds a query waits for a pooled tab before failing
+
+@lru_cache(maxsize=None)
 def find_chrome_path():
     """Find Chrome browser path based on operating system"""
     system = platform.system()
@@ -63,9 +87,16 @@ def find_chrome_path():
     print("Chrome not found in common locations")
     return None
 
-def setup_chrome():
-    """Setup Chrome with appropriate configurations"""
-    chrome_path = find_chrome_path()
+def setup_chrome(auto_port=False, lean=False):
+    """Setup Chrome with appropriate configurations
+
+    ``lean`` disables images and remote fonts and makes ``get()`` return
+    without waiting for the page to finish loading (callers wait for the
+    element they need instead).
+    """
+    metrics = get_metrics()
+    with metrics.stage('chrome_discovery'):
+        chrome_path = find_chrome_path()
     if not chrome_path:
         raise Exception("Chrome browser not found. Please install Chrome.")
     
@@ -73,7 +104,436 @@ def setup_chrome():
     co.set_browser_path(chrome_path)
     co.set_argument('--no-sandbox')  # 无沙盒模式
     co.headless()  # 无头模式
-    return Chromium(co)
+    if auto_port:
+        co.auto_port()  # 独立端口和用户目录, 允许同时启动多个浏览器
+    if lean:
+        co.no_imgs(True)
+        co.set_argument('--disable-remote-fonts')
+        co.set_load_mode('none')  # get() returns once the navigation starts
+    with metrics.stage('browser_launch'):
+        return Chromium(co)
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of ``pid`` and all its descendants (0 if unknown)."""
+    if not pid:
+        return 0
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+        except psutil.Error:
+            return 0
+    if not os.path.isdir('/proc'):
+        return 0
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                ppid = int(f.read().rsplit(b')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(current, ()))
+    return total
+
+
+class RendererSlots:
+    """Host-wide cap on open tabs (renderers), shared by every pool on the machine.
+
+    Each open tab holds an exclusive flock on one of ``cap`` slot files in
+    ``directory``; the kernel drops the lock when a process exits, so a
+    crashed worker never leaks its slots.
+    """
+
+    def __init__(self, cap, directory=None):
+        self.cap = int(cap)
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'kgr-renderers')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def acquire(self, timeout=RENDERER_WAIT):
+        """Take a free slot and return its handle, waiting up to ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for n in range(self.cap):
+                fd = os.open(os.path.join(self.directory, f'slot-{n}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except OSError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"All {self.cap} renderer slots on this host stayed busy")
+            time.sleep(0.5)
+
+    def release(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class _Browser:
+    # One Chromium process of the pool and what the governor knows about it
+    __slots__ = ('chromium', 'tabs', 'pages', 'in_flight', 'retiring', 'rss', 'rss_checked')
+
+    def __init__(self, chromium):
+        self.chromium = chromium
+        self.tabs = {}  # id(tab) -> tab
+        self.pages = 0
+        self.in_flight = 0
+        self.retiring = None  # restart reason once draining
+        self.rss = 0
+        self.rss_checked = 0.0
+
+
+class BrowserPool:
+    """A pool of warm headless Chromium instances handing out reusable tabs.
+
+    Browsers are launched once on ``start()``; callers ``checkout()`` a tab,
+    navigate with ``navigate()`` and hand it back with ``checkin()``. A tab
+    that has served ``max_navigations`` page loads is closed and replaced by a
+    fresh one from the same browser on check-in.
+
+    A governor keeps long runs flat: a browser that has served ``max_pages``
+    page loads, or whose process tree grew beyond ``max_rss_mb``, stops
+    handing out tabs, drains the queries it has in flight and is restarted.
+    With ``renderer_cap`` every open tab also holds one of that many host-wide
+    slots (RendererSlots), so concurrent pools cannot oversubscribe the host.
+    Defaults come from BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB and RENDERER_CAP.
+    A tab or browser that fails to come back is retried on a later checkout;
+    until then the pool runs short rather than blocking. ``checkout()`` waits
+    at most ``checkout_timeout`` seconds (BROWSER_CHECKOUT_TIMEOUT).
+
+    ``auto_port`` gives every browser its own debugging port and profile so
+    several pools (e.g. one per worker process) can run side by side; it
+    defaults to on when the pool itself launches more than one browser.
+    ``lean`` (default: LEAN_LOAD env) blocks non-essential requests in every tab.
+    """
+
+    def __init__(self, browsers=1, tabs_per_browser=1, max_navigations=50, auto_port=None, lean=None,
+                 max_pages=None, max_rss_mb=None, renderer_cap=None, checkout_timeout=None):
+        self.browsers = max(1, int(browsers))
+        self.tabs_per_browser = max(1, int(tabs_per_browser))
+        self.max_navigations = max(1, int(max_navigations))
+        self.auto_port = self.browsers > 1 if auto_port is None else auto_port
+        self.lean = lean_load_enabled() if lean is None else lean
+        self.max_pages = max(1, int(os.getenv('BROWSER_MAX_PAGES', DEFAULT_MAX_PAGES)
+                                    if max_pages is None else max_pages))
+        self.max_rss_mb = float(os.getenv('BROWSER_MAX_RSS_MB', DEFAULT_MAX_RSS_MB)
+                                if max_rss_mb is None else max_rss_mb)
+        self.checkout_timeout = float(os.getenv('BROWSER_CHECKOUT_TIMEOUT', DEFAULT_CHECKOUT_TIMEOUT)
+                                      if checkout_timeout is None else checkout_timeout)
+        renderer_cap = int(os.getenv('RENDERER_CAP', '0') if renderer_cap is None else renderer_cap)
+        if renderer_cap and fcntl is None:
+            print("RENDERER_CAP needs flock (not available on this platform); ignoring it")
+        self._renderers = RendererSlots(renderer_cap) if renderer_cap and fcntl is not None else None
+        self._instances = []
+        self._idle = Queue()
+        self._owner = {}        # id(tab) -> _Browser
+        self._navigations = {}  # id(tab) -> page loads served
+        self._slots = {}        # id(tab) -> renderer slot handle
+        self._owed = []         # browsers owed a tab (None: a whole browser) after a failed replacement
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.restarts = {'pages': 0, 'memory': 0}
+        self.peak_rss = 0
+
+    @property
+    def size(self):
+        return self.browsers * self.tabs_per_browser
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return self
+            if self._closed:
+                raise RuntimeError("Browser pool has been shut down")
+            for _ in range(self.browsers):
+                self._launch()
+            self._started = True
+            print(f"Browser pool ready: {self.browsers} browser(s), {self.size} tab(s)")
+        return self
+
+    # Launching a browser and opening a tab are slow (a renderer slot alone can
+    # take RENDERER_WAIT), so both run outside self._lock and only take it to
+    # register what they made. Whatever fails to come back is owed in
+    # self._owed and retried by checkout() while the pool runs short.
+
+    def _launch(self):
+        browser = _Browser(setup_chrome(auto_port=self.auto_port, lean=self.lean))
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._instances.append(browser)
+        if closed:
+            browser.chromium.quit()
+            return browser
+        for _ in range(self.tabs_per_browser):
+            self._refill(browser)
+        return browser
+
+    def _open_tab(self, browser):
+        slot = self._renderers.acquire() if self._renderers is not None else None
+        try:
+            tab = browser.chromium.new_tab()
+            if self.lean:
+                tab.run_cdp('Network.enable')
+                tab.run_cdp('Network.setBlockedURLs', urls=list(LEAN_BLOCKED_URLS))
+        except BaseException:
+            if slot is not None:
+                self._renderers.release(slot)
+            raise
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                if slot is not None:
+                    self._slots[id(tab)] = slot
+                browser.tabs[id(tab)] = tab
+                self._owner[id(tab)] = browser
+                self._navigations[id(tab)] = 0
+        if closed:
+            self._close_tab(tab, slot)
+            raise RuntimeError("Browser pool has been shut down")
+        return tab
+
+    def _refill(self, browser):
+        # Put a fresh tab of ``browser`` (None: of a new browser) in the idle queue; on
+        # failure (False) the pool runs a tab short until a later checkout() retries
+        try:
+            if browser is None:
+                with get_metrics().stage('browser_restart'):
+                    self._launch()
+            else:
+                self._idle.put(self._open_tab(browser))
+            return True
+        except Exception as e:
+            with self._lock:
+                if self._closed:
+                    return False
+                self._owed.append(browser)
+            get_metrics().incr('browser_refill_failures')
+            print(f"Error replacing a browser {'tab' if browser else 'instance'}, "
+                  f"pool is {len(self._owed)} short: {str(e)}")
+            return False
+
+    def _forget_tab(self, tab):
+        # Under self._lock: drop the pool's record of ``tab``; returns its renderer slot
+        browser = self._owner.pop(id(tab), None)
+        if browser is not None:
+            browser.tabs.pop(id(tab), None)
+        self._navigations.pop(id(tab), None)
+        return self._slots.pop(id(tab), None)
+
+    def _close_tab(self, tab, slot):
+        try:
+            tab.close()
+        except Exception:
+            pass
+        if slot is not None:
+            self._renderers.release(slot)
+
+    def _discard_tab(self, tab):
+        self._close_tab(tab, self._forget_tab(tab))
+
+    def _sample_rss(self, browser):
+        # Outside self._lock: RSS of the browser's process tree if a sample is due, else None
+        # (without psutil process_tree_rss walks /proc, too slow to hold the pool lock for)
+        if browser is None or self.max_rss_mb <= 0 or time.monotonic() - browser.rss_checked < RSS_CHECK_INTERVAL:
+            return None
+        browser.rss_checked = time.monotonic()
+        return process_tree_rss(getattr(browser.chromium, 'process_id', None))
+
+    def _govern(self, browser, rss=None):
+        # Under self._lock: decide on check-in whether this browser should drain and restart
+        if rss is not None:
+            browser.rss = rss
+            self.peak_rss = max(self.peak_rss, rss)
+        if browser.pages >= self.max_pages:
+            browser.retiring = 'pages'
+        elif rss is not None and rss > self.max_rss_mb * 2 ** 20:
+            browser.retiring = 'memory'
+        if browser.retiring:
+            print(f"Draining browser for a restart ({browser.retiring}: {browser.pages} pages, "
+                  f"{browser.rss / 2 ** 20:.0f} MB), {browser.in_flight} query(ies) in flight")
+
+    def _retire(self, browser):
+        # Under self._lock: take a drained browser out of the pool; returns its tabs
+        # to close (idle ones still queued are skipped by checkout())
+        self._instances.remove(browser)
+        self.restarts[browser.retiring] += 1
+        metrics = get_metrics()
+        metrics.incr('browser_restarts')
+        metrics.incr(f'browser_restarts_{browser.retiring}')
+        return [(tab, self._forget_tab(tab)) for tab in list(browser.tabs.values())]
+
+    def _restart(self, browser, tabs):
+        for tab, slot in tabs:
+            self._close_tab(tab, slot)
+        try:
+            browser.chromium.quit()
+        except Exception as e:
+            print(f"Error shutting down browser: {str(e)}")
+        self._refill(None)
+
+    def checkout(self, timeout=None):
+        """Take an idle tab, blocking up to ``timeout`` (default: the pool's checkout_timeout) seconds."""
+        if not self._started:
+            self.start()
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._idle.empty():
+                with self._lock:
+                    # A tab owed by a browser restarted since is no longer owed
+                    self._owed = [b for b in self._owed if b is None or b in self._instances]
+                    owed = self._owed.pop(0) if self._owed and not self._closed else False
+                if owed is not False:
+                    self._refill(owed)
+            try:
+                tab = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                raise TimeoutError(f"No browser tab became available in {timeout:.0f}s")
+            with self._lock:
+                browser = self._owner.get(id(tab))
+                if browser is not None and not browser.retiring:
+                    browser.in_flight += 1
+                    return tab
+                # Its browser is draining, or was restarted and already closed it
+                slot = self._forget_tab(tab) if browser is not None else None
+            if browser is not None:
+                self._close_tab(tab, slot)
+
+    def checkin(self, tab):
+        """Return a tab to the pool, recycling it (or its whole browser) if it is worn out."""
+        # Decide under the lock, do the slow sampling, closing and reopening outside it
+        retired = None
+        owner = self._owner.get(id(tab))
+        rss = self._sample_rss(owner) if owner is not None and not owner.retiring else None
+        with self._lock:
+            browser = self._owner.get(id(tab))
+            if browser is not None:
+                browser.in_flight -= 1
+            if self._closed or browser is None:
+                action = 'discard'
+            else:
+                if not browser.retiring:
+                    self._govern(browser, rss if browser is owner else None)
+                if browser.retiring:
+                    action = 'discard'
+                    if browser.in_flight == 0:
+                        retired = self._retire(browser)
+                elif self._navigations.get(id(tab), 0) >= self.max_navigations:
+                    action = 'recycle'
+                else:
+                    action = 'keep'
+            slot = self._forget_tab(tab) if action != 'keep' else None
+        if action == 'keep':
+            self._idle.put(tab)
+            return
+        self._close_tab(tab, slot)
+        if retired is not None:
+            self._restart(browser, retired)
+        elif action == 'recycle':
+            self._refill(browser)
+
+    def navigate(self, tab, url, **kwargs):
+        """Load ``url`` in ``tab``, counting it towards the recycle and restart limits."""
+        self._navigations[id(tab)] = self._navigations.get(id(tab), 0) + 1
+        browser = self._owner.get(id(tab))
+        if browser is not None:
+            browser.pages += 1
+        return tab.get(url, **kwargs)
+
+    def stats(self):
+        """Governor view of the pool: browsers, tabs, queries in flight, restarts, RSS."""
+        with self._lock:
+            return {
+                'browsers': len(self._instances),
+                'tabs': len(self._owner),
+                'in_flight': sum(browser.in_flight for browser in self._instances),
+                'owed': len(self._owed),
+                'restarts': dict(self.restarts),
+                'rss_mb': round(sum(browser.rss for browser in self._instances) / 2 ** 20, 1),
+                'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            }
+
+    def tab(self, timeout=None):
+        """Context manager form of checkout/checkin."""
+        return _PooledTab(self, timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while True:
+                try:
+                    self._discard_tab(self._idle.get_nowait())
+                except Empty:
+                    break
+            for browser in self._instances:
+                for tab in list(browser.tabs.values()):
+                    self._discard_tab(tab)
+                try:
+                    browser.chromium.quit()
+                except Exception as e:
+                    print(f"Error shutting down browser: {str(e)}")
+            self._instances = []
+            if self._started:
+                print(f"Browser pool closed: {sum(self.restarts.values())} restart(s) "
+                      f"({self.restarts['pages']} page limit, {self.restarts['memory']} memory), "
+                      f"peak browser RSS {self.peak_rss / 2 ** 20:.0f} MB")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PooledTab:
+    def __init__(self, pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+        self.tab = None
+
+    def __enter__(self):
+        self.tab = self.pool.checkout(self.timeout)
+        return self.tab
+
+    def __exit__(self, *exc):
+        self.pool.checkin(self.tab)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide pool, sized from BROWSER_POOL_* env vars."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool(
+                browsers=int(os.getenv('BROWSER_POOL_BROWSERS', '1')),
+                tabs_per_browser=int(os.getenv('BROWSER_POOL_TABS', '1')),
+                max_navigations=int(os.getenv('BROWSER_POOL_MAX_NAVIGATIONS', '50')),
+            )
+            atexit.register(_default_pool.close)
+        return _default_pool
 
 
 def main():
@@ -83,16 +543,14 @@ def main():
     print(f"Machine: {platform.machine()}")
     print("\nStarting search volume retrieval...")
     
+    pool = get_pool()
     try:
-        browser = setup_chrome()
-        keywords = get_keywords()
-        
-            
+        with pool.tab() as tab:
+            print(f"Browser ready, tab: {tab.tab_id}")
     except Exception as e:
         print(f"Error in main execution: {str(e)}")
     finally:
-        if 'browser' in locals():
-            browser.quit()
+        pool.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,213 @@
+"""Columnar history of every crawl run.
+
+``compact`` folds the per-run CSVs in ``results/`` into a Parquet dataset
+under ``history/``, hash-partitioned on the normalized keyword::
+
+    history/_runs.json                  runs already ingested, with their timestamps
+    history/bucket=NN/part.parquet      every (keyword, search_type, count, run) row
+    history/bucket=NN/latest.parquet    newest count per (keyword, search_type)
+
+A keyword always lives in one bucket and rows are sorted by keyword, so a
+point lookup or history query reads a single small file (and, through the
+row-group statistics, usually a single row group) however long the history
+grows. Bulk joins read only the buckets their keywords hash to.
+
+    python history_store.py compact [results/*.csv]
+    python history_store.py last "sprunki" [--type allintitle]
+    python history_store.py history "sprunki"
+    python history_store.py join keywords.txt --output latest.csv
+"""
+import os
+import sys
+import json
+import zlib
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from glob import glob
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from keyword_source import iter_keywords, normalize_keyword
+from result_files import read_result_csv
+
+DEFAULT_HISTORY_DIR = 'history'
+BUCKETS = 64
+
+SCHEMA = pa.schema([
+    ('keyword', pa.string()),
+    ('search_type', pa.string()),
+    ('count', pa.int64()),
+    ('run_id', pa.string()),
+    ('fetched_at', pa.timestamp('s', tz='UTC')),
+])
+_ROW_KEY = ['keyword', 'search_type', 'run_id']
+
+
+def bucket_of(keyword):
+    """Partition of a normalized keyword (stable across processes and machines)."""
+    return zlib.crc32(keyword.encode('utf-8')) % BUCKETS
+
+
+def _git_added_times(paths):
+    # The commit that added a results file is the best run timestamp we have;
+    # checkout resets mtimes, so they are only the fallback
+    times = {}
+    try:
+        output = subprocess.check_output(
+            ['git', 'log', '--format=%ct', '--name-only', '--diff-filter=A', '--'] + sorted(
+                {os.path.dirname(path) or '.' for path in paths}),
+            stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return times
+    stamp = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.isdigit():
+            stamp = int(line)
+        elif line and stamp is not None:
+            times.setdefault(os.path.normpath(line), stamp)
+    return times
+
+
+class HistoryStore:
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+
+    def _bucket_dir(self, bucket):
+        return os.path.join(self.directory, f'bucket={bucket:02d}')
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, '_runs.json')
+
+    def runs(self):
+        if not os.path.exists(self._manifest_path()):
+            return {}
+        with open(self._manifest_path(), encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, table, path):
+        tmp = path + '.tmp'
+        pq.write_table(table, tmp, compression='zstd', row_group_size=64 * 1024)
+        os.replace(tmp, path)
+
+    def compact(self, paths, force=False):
+        """Ingest run CSVs not yet in the store; returns the number of new rows."""
+        runs = self.runs()
+        added_times = _git_added_times(paths)
+        frames = []
+        for path in sorted(paths):
+            run_id = os.path.splitext(os.path.basename(path))[0]
+            if run_id in runs and not force:
+                continue
+            fetched_at = added_times.get(os.path.normpath(path)) or int(os.path.getmtime(path))
+            rows = [(normalize_keyword(keyword), search_type, count)
+                    for keyword, search_type, count in read_result_csv(path)]
+            frame = pd.DataFrame(rows, columns=['keyword', 'search_type', 'count'])
+            frame['run_id'] = run_id
+            frame['fetched_at'] = pd.Timestamp(fetched_at, unit='s', tz='UTC')
+            frames.append(frame)
+            runs[run_id] = {'path': path, 'fetched_at': fetched_at, 'rows': len(frame)}
+        if not frames:
+            return 0
+
+        new = pd.concat(frames, ignore_index=True)
+        new['bucket'] = new['keyword'].map(bucket_of)
+        for bucket, rows in new.groupby('bucket'):
+            self._merge_bucket(bucket, rows.drop(columns='bucket'))
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._manifest_path(), 'w', encoding='utf-8') as f:
+            json.dump(runs, f, indent=2, sort_keys=True)
+        return len(new)
+
+    def _merge_bucket(self, bucket, rows):
+        directory = self._bucket_dir(bucket)
+        os.makedirs(directory, exist_ok=True)
+        part = os.path.join(directory, 'part.parquet')
+        if os.path.exists(part):
+            rows = pd.concat([pq.read_table(part).to_pandas(), rows], ignore_index=True)
+        rows = (rows.drop_duplicates(_ROW_KEY, keep='last')
+                .sort_values(['keyword', 'search_type', 'fetched_at'], kind='stable'))
+        self._write(pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False), part)
+        latest = rows.drop_duplicates(['keyword', 'search_type'], keep='last')
+        self._write(pa.Table.from_pandas(latest, schema=SCHEMA, preserve_index=False),
+                    os.path.join(directory, 'latest.parquet'))
+
+    def _read(self, bucket, name, keywords):
+        path = os.path.join(self._bucket_dir(bucket), name)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=SCHEMA.names)
+        return pq.read_table(path, filters=[('keyword', 'in', list(keywords))]).to_pandas()
+
+    def last(self, keyword, search_type=None):
+        """Newest stored counts for ``keyword``: {search_type: row}."""
+        keyword = normalize_keyword(keyword)
+        rows = self._read(bucket_of(keyword), 'latest.parquet', [keyword])
+        if search_type:
+            rows = rows[rows['search_type'] == search_type]
+        return {row['search_type']: row for row in rows.to_dict('records')}
+
+    def history(self, keyword, search_type=None):
+        """Every stored count for ``keyword``, oldest first."""
+        keyword = normalize_keyword(keyword)
+        rows = self._read(bucket_of(keyword), 'part.parquet', [keyword])
+        if search_type:
+            rows = rows[rows['search_type'] == search_type]
+        return rows.sort_values('fetched_at', kind='stable').reset_index(drop=True)
+
+    def join(self, keywords, table='latest'):
+        """Latest (or full) rows for many keywords, reading only their buckets."""
+        by_bucket = {}
+        for keyword in keywords:
+            keyword = normalize_keyword(keyword)
+            by_bucket.setdefault(bucket_of(keyword), set()).add(keyword)
+        name = 'latest.parquet' if table == 'latest' else 'part.parquet'
+        frames = [self._read(bucket, name, wanted) for bucket, wanted in sorted(by_bucket.items())]
+        if not frames:
+            return pd.DataFrame(columns=SCHEMA.names)
+        return pd.concat(frames, ignore_index=True)
+
+
+def _print_rows(rows):
+    for row in rows:
+        fetched_at = row['fetched_at']
+        if isinstance(fetched_at, datetime):
+            fetched_at = fetched_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M')
+        print(f"{row['keyword']}\t{row['search_type']}\t{row['count']}\t{row['run_id']}\t{fetched_at}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar history of crawl results')
+    parser.add_argument('--dir', default=DEFAULT_HISTORY_DIR, help='history store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    compact = commands.add_parser('compact', help='ingest results/*.csv run files')
+    compact.add_argument('paths', nargs='*')
+    compact.add_argument('--force', action='store_true', help='re-ingest runs already in the store')
+    for name in ('last', 'history'):
+        command = commands.add_parser(name)
+        command.add_argument('keyword')
+        command.add_argument('--type', dest='search_type')
+    join = commands.add_parser('join', help='latest counts for a keyword file (CSV/text or -)')
+    join.add_argument('input')
+    join.add_argument('--output', help='CSV path (default: stdout)')
+    join.add_argument('--all', action='store_true', help='every run, not only the latest count')
+    args = parser.parse_args()
+
+    store = HistoryStore(args.dir)
+    if args.command == 'compact':
+        paths = args.paths or glob(os.path.join('results', '*.csv'))
+        print(f"Compacted {store.compact(paths, force=args.force)} new rows from {len(paths)} file(s)")
+    elif args.command == 'last':
+        _print_rows(store.last(args.keyword, args.search_type).values())
+    elif args.command == 'history':
+        _print_rows(store.history(args.keyword, args.search_type).to_dict('records'))
+    elif args.command == 'join':
+        rows = store.join(iter_keywords(args.input), table='all' if args.all else 'latest')
+        rows.to_csv(args.output or sys.stdout, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import io
+import os
+import csv
+import sys
+import math
+import hashlib
+import unicodedata
+from itertools import islice
+
+DEFAULT_EXACT_LIMIT = 500000     # keywords kept in an exact set before switching to a Bloom filter
+DEFAULT_ERROR_RATE = 0.001
+
+
+def normalize_keyword(keyword):
+    """Canonical keyword form: NFKC, case-folded, single-spaced."""
+    return ' '.join(unicodedata.normalize('NFKC', keyword).split()).casefold()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        for p in self._positions(item):
+            self.array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class Deduper:
+    """Seen-set with bounded memory.
+
+    Keeps an exact ``set`` until ``exact_limit`` distinct keywords, then moves
+    to a scalable Bloom filter (a chain of filters, each twice as large with
+    a tighter error rate), so a very rare false positive may drop a keyword
+    but memory grows by a few bits per keyword rather than a whole string.
+    """
+
+    def __init__(self, exact_limit=DEFAULT_EXACT_LIMIT, error_rate=DEFAULT_ERROR_RATE):
+        self.exact_limit = exact_limit
+        self.error_rate = error_rate
+        self._exact = set()
+        self._filters = None
+
+    def _grow(self):
+        n = len(self._filters)
+        capacity = self.exact_limit * 2 ** (n + 1)
+        self._filters.append(BloomFilter(capacity, self.error_rate * 0.5 ** (n + 1)))
+
+    def seen(self, item):
+        """Record ``item``; return True if it was (probably) seen before."""
+        if self._filters is None:
+            if item in self._exact:
+                return True
+            self._exact.add(item)
+            if len(self._exact) >= self.exact_limit:
+                self._filters = []
+                self._grow()
+                for old in self._exact:
+                    self._filters[-1].add(old)
+                self._exact = None
+            return False
+        if any(item in bloom for bloom in self._filters):
+            return True
+        if self._filters[-1].count >= self._filters[-1].capacity:
+            self._grow()
+        self._filters[-1].add(item)
+        return False
+
+
+def _csv_cells(file, all_columns):
+    for row in csv.reader(file):
+        if all_columns:
+            yield from row
+        elif row:
+            yield row[0]
+
+
+def _lines(file):
+    for line in file:
+        yield line.rstrip('\n')
+
+
+def read_source(path, all_columns=False):
+    """Stream raw keywords from a CSV file, a plain-text file or '-' (stdin)."""
+    if path == '-':
+        yield from _lines(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'))
+        return
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        if path.lower().endswith('.csv'):
+            yield from _csv_cells(file, all_columns)
+        else:
+            yield from _lines(file)
+
+
+def iter_keywords(input_path=None, input_keywords=None, all_columns=False,
+                  dedupe=True, exact_limit=DEFAULT_EXACT_LIMIT):
+    """Yield normalized, de-duplicated keywords as they are read.
+
+    ``input_keywords`` is a comma-separated string; ``input_path`` is a CSV
+    (first column, or every cell with ``all_columns``), a text file with one
+    keyword per line, or '-' for stdin. Missing files are skipped.
+    """
+    deduper = Deduper(exact_limit) if dedupe else None
+
+    def sources():
+        if input_path and (input_path == '-' or os.path.exists(input_path)):
+            yield from read_source(input_path, all_columns)
+        if input_keywords:
+            yield from input_keywords.split(',')
+
+    for raw in sources():
+        keyword = normalize_keyword(raw)
+        if not keyword:
+            continue
+        if deduper is not None and deduper.seen(keyword):
+            continue
+        yield keyword
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most ``size`` items, lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
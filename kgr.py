@@ -0,0 +1,139 @@
+"""Vectorised Keyword Golden Ratio scoring.
+
+KGR = allintitle result count / monthly search volume, bucketed the same way
+as ``getKGRClass`` in sse.js (<= 0.25 excellent, <= 0.5 good, <= 1 moderate,
+otherwise difficult). Search-volume exports and crawled counts are joined on
+the normalized keyword with a pandas hash join and scored a whole column at
+a time, so millions of rows take seconds.
+
+    python kgr.py --volumes volumes.csv --counts results/*.csv --output scored.csv
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+KGR_BINS = [-np.inf, 0.25, 0.5, 1.0, np.inf]
+KGR_CLASSES = ['kgr-excellent', 'kgr-good', 'kgr-moderate', 'kgr-difficult']
+
+# Column names used by Keyword Planner, Ahrefs, Semrush and our own crawlers
+_KEYWORD_COLUMNS = ('keyword', 'keywords', 'query', 'search term')
+_VOLUME_COLUMNS = ('search_volume', 'search volume', 'volume', 'avg. monthly searches',
+                   'avg monthly searches', 'searchvolume', 'sv')
+_TYPE_COLUMNS = ('search_type', 'searchtype', 'search type')
+_COUNT_COLUMNS = ('count',)
+OUTPUT_COLUMNS = ['keyword', 'search_volume', 'intitle_count', 'allintitle_count', 'kgr_score', 'kgr_class']
+
+
+def normalize_keywords(series):
+    """Vectorised keyword_source.normalize_keyword: NFKC, case-folded, single-spaced."""
+    return (series.astype(str).str.normalize('NFKC').str.casefold()
+            .str.replace(r'\s+', ' ', regex=True).str.strip())
+
+
+def _find_column(frame, candidates, what, path):
+    lookup = {str(column).strip().lower(): column for column in frame.columns}
+    for candidate in candidates:
+        if candidate in lookup:
+            return lookup[candidate]
+    raise ValueError(f"No {what} column in {path} (columns: {', '.join(map(str, frame.columns))})")
+
+
+def _to_number(series):
+    # Exports write volumes like "1,300" or "1.3K"; ranges like "1K – 10K" keep the lower bound
+    text = series.astype(str).str.strip().str.split(r'\s*[–-]\s*', n=1, regex=True).str[0]
+    text = text.str.replace(',', '', regex=False)
+    multiplier = text.str[-1:].str.upper().map({'K': 1e3, 'M': 1e6}).fillna(1.0)
+    text = text.where(multiplier.eq(1.0), text.str[:-1])
+    return pd.to_numeric(text, errors='coerce') * multiplier
+
+
+def load_volumes(paths):
+    """Search-volume exports -> DataFrame[key, keyword, search_volume]."""
+    frames = []
+    for path in paths:
+        frame = pd.read_csv(path, sep=None, engine='python', encoding='utf-8-sig')
+        keyword = _find_column(frame, _KEYWORD_COLUMNS, 'keyword', path)
+        volume = _find_column(frame, _VOLUME_COLUMNS, 'search volume', path)
+        frames.append(pd.DataFrame({'keyword': frame[keyword].astype(str),
+                                    'search_volume': _to_number(frame[volume])}))
+    volumes = pd.concat(frames, ignore_index=True)
+    volumes['key'] = normalize_keywords(volumes['keyword'])
+    # Later files win for keywords that appear twice
+    return volumes.drop_duplicates('key', keep='last')
+
+
+def _read_counts(path):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            frame = pd.DataFrame(json.load(f))
+        if 'error' in frame.columns:
+            frame = frame[frame['error'].isna()]
+        return frame.rename(columns={'intitle': 'intitle_count', 'allintitle': 'allintitle_count'})[
+            ['keyword', 'intitle_count', 'allintitle_count']]
+
+    frame = pd.read_csv(path, encoding='utf-8-sig')
+    keyword = _find_column(frame, _KEYWORD_COLUMNS, 'keyword', path)
+    search_type = _find_column(frame, _TYPE_COLUMNS, 'search type', path)
+    count = _find_column(frame, _COUNT_COLUMNS, 'count', path)
+    frame = frame.rename(columns={keyword: 'keyword', search_type: 'search_type', count: 'count'})
+    wide = frame.pivot_table(index='keyword', columns='search_type', values='count', aggfunc='last')
+    wide = wide.rename(columns={'intitle': 'intitle_count', 'allintitle': 'allintitle_count'})
+    return wide.reindex(columns=['intitle_count', 'allintitle_count']).reset_index()
+
+
+def load_counts(paths):
+    """Crawler output (long CSVs from main.py/main-pl.py or process_keywords
+    results.json) -> DataFrame[key, intitle_count, allintitle_count]."""
+    frames = [_read_counts(path) for path in sorted(paths, key=os.path.getmtime)]
+    counts = pd.concat(frames, ignore_index=True)
+    counts['key'] = normalize_keywords(counts['keyword'])
+    # Newest non-missing value per keyword and operator
+    counts = counts.groupby('key', sort=False)[['intitle_count', 'allintitle_count']].last()
+    return counts.reset_index()
+
+
+def score(volumes, counts):
+    """Join on the normalized keyword and compute KGR and its class for every row."""
+    scored = volumes.merge(counts, on='key', how='inner')
+    volume = scored['search_volume'].to_numpy(dtype=float)
+    allintitle = scored['allintitle_count'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kgr = np.where(volume > 0, allintitle / volume, np.nan)
+    scored['kgr_score'] = kgr
+    classes = pd.cut(scored['kgr_score'], bins=KGR_BINS, labels=KGR_CLASSES, right=True)
+    scored['kgr_class'] = classes.astype(object).where(classes.notna(), None)
+    return scored[OUTPUT_COLUMNS].sort_values('kgr_score', na_position='last', kind='stable')
+
+
+def write_scored(scored, path):
+    if path.endswith('.parquet'):
+        scored.to_parquet(path, index=False)
+    elif path.endswith('.json'):
+        # Records in the shape sse.js renders
+        scored.to_json(path, orient='records', force_ascii=False)
+    else:
+        scored.to_csv(path, index=False)
+    print(f"Scored {len(scored)} keywords -> {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score keywords by KGR (allintitle / search volume)')
+    parser.add_argument('--volumes', nargs='+', required=True, help='search-volume export CSV file(s)')
+    parser.add_argument('--counts', nargs='+', required=True, help='crawler result CSV/JSON file(s)')
+    parser.add_argument('--output', default='scored.csv', help='.csv, .json or .parquet')
+    args = parser.parse_args()
+
+    volumes = load_volumes(args.volumes)
+    counts = load_counts(args.counts)
+    scored = score(volumes, counts)
+    unmatched = len(volumes) - len(scored)
+    if unmatched:
+        print(f"{unmatched} keyword(s) with a search volume have no crawled counts", file=sys.stderr)
+    write_scored(scored, args.output)
+
+
+if __name__ == '__main__':
+    main()
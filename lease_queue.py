@@ -0,0 +1,684 @@
+"""Lease-based work queue for the keywords of a batch group, shared by many nodes.
+
+Batches are enqueued whole, but workers lease single keywords: a lease lasts
+``lease_seconds`` and is kept alive by heartbeats while the keyword is being
+searched. A worker that dies simply stops heartbeating and its keyword is
+leased again once the lease expires. Workers prefer keywords of their own
+("home") batch and otherwise steal from the batch with the most work left,
+so the group finishes when total capacity allows, not when its slowest
+runner does.
+
+Completion is idempotent: the first result stored for a keyword wins.
+Publishing a finished batch (results upload, then its batch-group marker) is
+a lease of its own: it is recorded as done only after the publish succeeded,
+so a worker that crashes or fails half-way leaves the batch to be published
+again once that lease expires. Besides the worker that completes a batch's
+last keyword, every idle worker sweeps for finished batches nobody
+published, so a crash right after the last keyword loses nothing either.
+
+Two stores share one interface:
+  SqliteLeaseStore  one SQLite file (a single host, a shared volume, tests)
+  R2LeaseStore      the R2 bucket, using conditional PUTs (If-None-Match /
+                    If-Match) for leases, results and finalization
+LEASE_STORE=r2 selects the bucket; the default is .cache/lease_queue.sqlite3.
+
+    python lease_queue.py enqueue <batch_group_id> <batch_id> "kw1,kw2"
+    python lease_queue.py work <batch_group_id> [--home <batch_id>] [--exit-when-done]
+    python lease_queue.py status <batch_group_id>
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import NamedTuple
+from events import events_enabled, finish_group, get_reporter
+from storage import RESULT_FORMATS
+
+DEFAULT_STORE_PATH = os.path.join('.cache', 'lease_queue.sqlite3')
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+CLAIM_BATCH = 4  # keywords leased per claim round
+
+
+class Lease(NamedTuple):
+    batch_group_id: str
+    batch_id: str
+    position: int
+    keyword: str
+    token: str  # proves ownership for heartbeats and releases
+    attempts: int = 0  # failed attempts before this lease
+
+
+def _steal_order(pending, home):
+    """Batch ids in claim order: home first, then the batch with the most work left."""
+    return sorted(pending, key=lambda batch_id: (batch_id != home, -pending[batch_id], batch_id))
+
+
+class SqliteLeaseStore:
+    """Lease queue in one SQLite file; every claim runs inside BEGIN IMMEDIATE."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS lease_batches (
+                group_id TEXT NOT NULL,
+                batch_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                enqueued_at REAL NOT NULL,
+                finalized_by TEXT,
+                finalize_token TEXT,
+                finalize_expires REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_id, batch_id)
+            );
+            CREATE TABLE IF NOT EXISTS lease_tasks (
+                group_id TEXT NOT NULL,
+                batch_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                keyword TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                token TEXT,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                PRIMARY KEY (group_id, batch_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS lease_tasks_open ON lease_tasks (group_id, done, lease_expires);
+        ''')
+        for column in ('finalize_token TEXT', 'finalize_expires REAL NOT NULL DEFAULT 0'):
+            try:  # queues created before finalization became a lease
+                self._conn.execute(f'ALTER TABLE lease_batches ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work()
+                self._conn.execute('COMMIT')
+                return result
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def enqueue(self, batch_group_id, batch_id, keywords):
+        keywords = list(keywords)
+
+        def work():
+            self._conn.execute(
+                'INSERT OR IGNORE INTO lease_batches (group_id, batch_id, size, enqueued_at) VALUES (?, ?, ?, ?)',
+                (batch_group_id, batch_id, len(keywords), time.time()))
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO lease_tasks (group_id, batch_id, position, keyword) VALUES (?, ?, ?, ?)',
+                [(batch_group_id, batch_id, n, keyword) for n, keyword in enumerate(keywords)])
+        self._transaction(work)
+        return len(keywords)
+
+    def claim(self, batch_group_id, worker, limit=CLAIM_BATCH, lease_seconds=DEFAULT_LEASE_SECONDS,
+              home=None):
+        def work():
+            now = time.time()
+            pending = dict(self._conn.execute(
+                'SELECT batch_id, COUNT(*) FROM lease_tasks WHERE group_id = ? AND done = 0 '
+                'AND lease_expires < ? GROUP BY batch_id', (batch_group_id, now)).fetchall())
+            leases = []
+            for batch_id in _steal_order(pending, home):
+                rows = self._conn.execute(
+                    'SELECT position, keyword, attempts FROM lease_tasks WHERE group_id = ? AND batch_id = ? '
+                    'AND done = 0 AND lease_expires < ? ORDER BY position LIMIT ?',
+                    (batch_group_id, batch_id, now, limit - len(leases))).fetchall()
+                for position, keyword, attempts in rows:
+                    token = f'{worker}/{uuid.uuid4().hex}'
+                    self._conn.execute(
+                        'UPDATE lease_tasks SET token = ?, lease_expires = ? '
+                        'WHERE group_id = ? AND batch_id = ? AND position = ?',
+                        (token, now + lease_seconds, batch_group_id, batch_id, position))
+                    leases.append(Lease(batch_group_id, batch_id, position, keyword, token, attempts))
+                if len(leases) >= limit:
+                    break
+            return leases
+        return self._transaction(work)
+
+    def heartbeat(self, leases, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend ``leases``; returns the ones still held."""
+        held = []
+        with self._lock:
+            for lease in leases:
+                cursor = self._conn.execute(
+                    'UPDATE lease_tasks SET lease_expires = ? WHERE group_id = ? AND batch_id = ? '
+                    'AND position = ? AND token = ? AND done = 0',
+                    (time.time() + lease_seconds, lease.batch_group_id, lease.batch_id, lease.position,
+                     lease.token))
+                if cursor.rowcount:
+                    held.append(lease)
+        return held
+
+    def complete(self, lease, result):
+        """Store the keyword's result; False if it was already completed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE lease_tasks SET done = 1, result = ?, token = NULL WHERE group_id = ? AND batch_id = ? '
+                'AND position = ? AND done = 0',
+                (json.dumps(result), lease.batch_group_id, lease.batch_id, lease.position))
+            return cursor.rowcount == 1
+
+    def release(self, lease, delay=0.0):
+        """Give a failed keyword back for another attempt, claimable again after ``delay`` seconds."""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE lease_tasks SET token = NULL, lease_expires = ?, attempts = attempts + 1 '
+                'WHERE group_id = ? AND batch_id = ? AND position = ? AND token = ? AND done = 0',
+                (time.time() + delay, lease.batch_group_id, lease.batch_id, lease.position, lease.token))
+
+    def is_batch_done(self, batch_group_id, batch_id):
+        with self._lock:
+            remaining, = self._conn.execute(
+                'SELECT COUNT(*) FROM lease_tasks WHERE group_id = ? AND batch_id = ? AND done = 0',
+                (batch_group_id, batch_id)).fetchone()
+        return remaining == 0
+
+    def claim_finalization(self, batch_group_id, batch_id, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease publishing the batch; a token, or None if it is published or being published."""
+        token = f'{worker}/{uuid.uuid4().hex}'
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE lease_batches SET finalize_token = ?, finalize_expires = ? WHERE group_id = ? '
+                'AND batch_id = ? AND finalized_by IS NULL AND finalize_expires < ?',
+                (token, now + lease_seconds, batch_group_id, batch_id, now))
+            return token if cursor.rowcount == 1 else None
+
+    def commit_finalization(self, batch_group_id, batch_id, token):
+        """Record a successful publish; False if the lease had been taken over meanwhile."""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE lease_batches SET finalized_by = ?, finalize_token = NULL WHERE group_id = ? '
+                'AND batch_id = ? AND finalize_token = ?',
+                (token.rsplit('/', 1)[0], batch_group_id, batch_id, token))
+            return cursor.rowcount == 1
+
+    def unfinalized(self, batch_group_id):
+        """Finished batches that nobody has published or is publishing."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT batch_id FROM lease_batches b WHERE group_id = ? AND finalized_by IS NULL '
+                'AND finalize_expires < ? AND NOT EXISTS (SELECT 1 FROM lease_tasks t WHERE '
+                't.group_id = b.group_id AND t.batch_id = b.batch_id AND t.done = 0) ORDER BY batch_id',
+                (batch_group_id, time.time())).fetchall()
+        return [batch_id for batch_id, in rows]
+
+    def is_finished(self, batch_group_id):
+        """True once every batch of the group is published."""
+        with self._lock:
+            unpublished, = self._conn.execute(
+                'SELECT COUNT(*) FROM lease_batches WHERE group_id = ? AND finalized_by IS NULL',
+                (batch_group_id,)).fetchone()
+        return unpublished == 0
+
+    def results(self, batch_group_id, batch_id):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT result FROM lease_tasks WHERE group_id = ? AND batch_id = ? ORDER BY position',
+                (batch_group_id, batch_id)).fetchall()
+        return [json.loads(result) for result, in rows if result is not None]
+
+    def status(self, batch_group_id):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT t.batch_id, COUNT(*), SUM(t.done), '
+                'SUM(t.done = 0 AND t.token IS NOT NULL AND t.lease_expires >= ?), '
+                'b.finalized_by IS NOT NULL FROM lease_tasks t JOIN lease_batches b '
+                'ON b.group_id = t.group_id AND b.batch_id = t.batch_id WHERE t.group_id = ? '
+                'GROUP BY t.batch_id ORDER BY t.batch_id', (time.time(), batch_group_id)).fetchall()
+        return {batch_id: {'keywords': size, 'done': done, 'leased': leased, 'finalized': bool(finalized)}
+                for batch_id, size, done, leased, finalized in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class R2LeaseStore:
+    """Lease queue as small objects in the R2 bucket, for workers on different nodes.
+
+    Layout under ``lease-queues/<group>/``:
+      batches/<batch>.json     keyword list, written once by enqueue
+      leases/<batch>/<pos>     present while leased; its LastModified is the
+                               heartbeat, so expiry is read from listings
+      failures/<batch>/<pos>.<not before, ms>.<id>
+                               one empty object per failed attempt; the keyword
+                               is not leased again before that time (backoff)
+      done/<batch>/<pos>.json  the keyword's result, created only once
+      complete/<batch>         every keyword has a result; claims skip the batch
+      finalizing/<batch>       publish lease; LastModified is its start
+      finalized/<batch>        created once the batch has been published
+    Creation uses If-None-Match: * and lease renewal If-Match, so two workers
+    can never both win the same lease, result or finalization.
+    """
+
+    def __init__(self, s3=None, bucket_name=None, prefix='lease-queues'):
+        if s3 is None:
+            from storage import get_r2_client
+            s3, bucket_name = get_r2_client()
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.path = f'r2://{bucket_name}/{prefix}'
+        self._keywords = {}  # (group, batch) -> keyword list; immutable once enqueued
+        self._pending = {}  # (group, batch) -> claimable keywords at its last scan
+
+    def _key(self, batch_group_id, *parts):
+        return '/'.join((self.prefix, batch_group_id) + parts)
+
+    def _list(self, prefix):
+        entries = {}
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for entry in page.get('Contents', []):
+                entries[entry['Key'][len(prefix):]] = entry
+        return entries
+
+    def _create(self, key, body, **kwargs):
+        """PUT only if ``key`` does not exist (or still has etag ``IfMatch``); returns the new ETag or None."""
+        from progress import CONFLICT_CODES, _is_status
+        conditions = kwargs or {'IfNoneMatch': '*'}
+        try:
+            return self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=body, **conditions)['ETag']
+        except Exception as e:
+            if _is_status(e, *CONFLICT_CODES):
+                return None
+            if type(e).__name__ == 'ParamValidationError':
+                raise RuntimeError("The R2 lease store needs conditional writes (botocore >= 1.36)")
+            raise
+
+    def _batch_keywords(self, batch_group_id, batch_id):
+        if (batch_group_id, batch_id) not in self._keywords:
+            body = self.s3.get_object(Bucket=self.bucket_name,
+                                      Key=self._key(batch_group_id, 'batches', f'{batch_id}.json'))['Body'].read()
+            self._keywords[(batch_group_id, batch_id)] = json.loads(body)['keywords']
+        return self._keywords[(batch_group_id, batch_id)]
+
+    def enqueue(self, batch_group_id, batch_id, keywords):
+        keywords = list(keywords)
+        body = json.dumps({'keywords': keywords, 'enqueuedAt': datetime.utcnow().isoformat()})
+        self._create(self._key(batch_group_id, 'batches', f'{batch_id}.json'), body)
+        return len(keywords)
+
+    def _open_batches(self, batch_group_id):
+        # Two listings over batch ids only: keyword-level state is read per batch, on demand
+        batches = [name[:-len('.json')] for name in self._list(self._key(batch_group_id, 'batches') + '/')]
+        complete = self._list(self._key(batch_group_id, 'complete') + '/')
+        return [batch_id for batch_id in batches if batch_id not in complete]
+
+    def _open_tasks(self, batch_group_id, batch_id, lease_seconds):
+        """[(position, lease entry or None, failures)] of the batch's keywords claimable now."""
+        size = len(self._batch_keywords(batch_group_id, batch_id))
+        done = self._list(self._key(batch_group_id, 'done', batch_id) + '/')
+        if len(done) >= size:
+            # Later claims skip the batch without listing its keywords again
+            self._create(self._key(batch_group_id, 'complete', batch_id), b'')
+            return []
+        leases = self._list(self._key(batch_group_id, 'leases', batch_id) + '/')
+        failures, not_before = {}, {}
+        for name in self._list(self._key(batch_group_id, 'failures', batch_id) + '/'):
+            parts = name.split('.')
+            failures[parts[0]] = failures.get(parts[0], 0) + 1
+            if len(parts) == 3 and parts[1].isdigit():
+                not_before[parts[0]] = max(not_before.get(parts[0], 0), int(parts[1]) / 1000)
+        now = datetime.now(timezone.utc)
+        open_tasks = []
+        for position in range(size):
+            name = f'{position:06d}'
+            if f'{name}.json' in done or not_before.get(name, 0) > now.timestamp():
+                continue
+            lease = leases.get(name)
+            if lease is not None and (now - lease['LastModified']).total_seconds() < lease_seconds:
+                continue
+            open_tasks.append((position, lease, failures.get(name, 0)))
+        return open_tasks
+
+    def claim(self, batch_group_id, worker, limit=CLAIM_BATCH, lease_seconds=DEFAULT_LEASE_SECONDS,
+              home=None):
+        # Batches are scanned one at a time in steal order (by the work left
+        # seen on earlier scans; unseen batches first) and scanning stops
+        # once ``limit`` keywords are leased, so a claim costs about one
+        # batch's listings however large the group is
+        batches = self._open_batches(batch_group_id)
+        pending = {batch_id: self._pending.get((batch_group_id, batch_id), float('inf')) for batch_id in batches}
+        leases = []
+        for batch_id in _steal_order(pending, home):
+            open_tasks = self._open_tasks(batch_group_id, batch_id, lease_seconds)
+            self._pending[(batch_group_id, batch_id)] = len(open_tasks)
+            keywords = self._batch_keywords(batch_group_id, batch_id) if open_tasks else None
+            for position, expired, attempts in open_tasks:
+                key = self._key(batch_group_id, 'leases', batch_id, f'{position:06d}')
+                body = json.dumps({'worker': worker, 'claimedAt': datetime.utcnow().isoformat()})
+                # Take over an expired lease only if nobody renewed or took it meanwhile
+                etag = self._create(key, body, IfMatch=expired['ETag']) if expired else self._create(key, body)
+                if etag is not None:
+                    self._pending[(batch_group_id, batch_id)] -= 1
+                    leases.append(Lease(batch_group_id, batch_id, position, keywords[position], etag, attempts))
+                    if len(leases) >= limit:
+                        return leases
+        return leases
+
+    def heartbeat(self, leases, lease_seconds=DEFAULT_LEASE_SECONDS):
+        held = []
+        for lease in leases:
+            key = self._key(lease.batch_group_id, 'leases', lease.batch_id, f'{lease.position:06d}')
+            body = json.dumps({'heartbeatAt': datetime.utcnow().isoformat()})
+            etag = self._create(key, body, IfMatch=lease.token)
+            if etag is not None:
+                held.append(lease._replace(token=etag))
+        return held
+
+    def _holds(self, key, token):
+        # True while ``key`` still carries our ETag, i.e. nobody took the lease over
+        current = self._head(key)
+        return current is not None and current['ETag'] == token
+
+    def complete(self, lease, result):
+        lease_key = self._key(lease.batch_group_id, 'leases', lease.batch_id, f'{lease.position:06d}')
+        if not self._holds(lease_key, lease.token):
+            return False  # stolen: the new owner completes it
+        key = self._key(lease.batch_group_id, 'done', lease.batch_id, f'{lease.position:06d}.json')
+        first = self._create(key, json.dumps(result)) is not None
+        self.s3.delete_object(Bucket=self.bucket_name, Key=lease_key)
+        return first
+
+    def release(self, lease, delay=0.0):
+        lease_key = self._key(lease.batch_group_id, 'leases', lease.batch_id, f'{lease.position:06d}')
+        if not self._holds(lease_key, lease.token):
+            return
+        name = f'{lease.position:06d}.{int((time.time() + delay) * 1000)}.{uuid.uuid4().hex}'
+        self.s3.put_object(Bucket=self.bucket_name,
+                           Key=self._key(lease.batch_group_id, 'failures', lease.batch_id, name), Body=b'')
+        self.s3.delete_object(Bucket=self.bucket_name, Key=lease_key)
+
+    def is_batch_done(self, batch_group_id, batch_id):
+        if self._head(self._key(batch_group_id, 'complete', batch_id)) is not None:
+            return True
+        done = self._list(self._key(batch_group_id, 'done', batch_id) + '/')
+        if len(done) < len(self._batch_keywords(batch_group_id, batch_id)):
+            return False
+        self._create(self._key(batch_group_id, 'complete', batch_id), b'')
+        return True
+
+    def _head(self, key):
+        from progress import _is_status
+        try:
+            return self.s3.head_object(Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            if _is_status(e, 'NoSuchKey', 'NotFound', '404'):
+                return None
+            raise
+
+    def claim_finalization(self, batch_group_id, batch_id, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+        if self._head(self._key(batch_group_id, 'finalized', batch_id)) is not None:
+            return None
+        key = self._key(batch_group_id, 'finalizing', batch_id)
+        body = worker.encode('utf-8')
+        token = self._create(key, body)
+        if token is None:
+            current = self._head(key)
+            if current is None:
+                return self._create(key, body)
+            age = (datetime.now(timezone.utc) - current['LastModified']).total_seconds()
+            if age < lease_seconds:
+                return None
+            # The previous publisher died or failed: take its lease over
+            token = self._create(key, body, IfMatch=current['ETag'])
+        return token
+
+    def commit_finalization(self, batch_group_id, batch_id, token):
+        key = self._key(batch_group_id, 'finalizing', batch_id)
+        if not self._holds(key, token):
+            return False
+        self._create(self._key(batch_group_id, 'finalized', batch_id), b'')
+        self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+        return True
+
+    def unfinalized(self, batch_group_id):
+        batches = [name[:-len('.json')] for name in self._list(self._key(batch_group_id, 'batches') + '/')]
+        complete = self._list(self._key(batch_group_id, 'complete') + '/')
+        finalized = self._list(self._key(batch_group_id, 'finalized') + '/')
+        return [batch_id for batch_id in sorted(batches) if batch_id in complete and batch_id not in finalized]
+
+    def is_finished(self, batch_group_id):
+        batches = self._list(self._key(batch_group_id, 'batches') + '/')
+        finalized = self._list(self._key(batch_group_id, 'finalized') + '/')
+        return all(name[:-len('.json')] in finalized for name in batches)
+
+    def results(self, batch_group_id, batch_id):
+        prefix = self._key(batch_group_id, 'done', batch_id) + '/'
+        return [json.loads(self.s3.get_object(Bucket=self.bucket_name, Key=prefix + name)['Body'].read())
+                for name in sorted(self._list(prefix))]
+
+    def status(self, batch_group_id):
+        batches = [name[:-len('.json')] for name in self._list(self._key(batch_group_id, 'batches') + '/')]
+        finalized = self._list(self._key(batch_group_id, 'finalized') + '/')
+        summary = {}
+        for batch_id in sorted(batches):
+            summary[batch_id] = {
+                'keywords': len(self._batch_keywords(batch_group_id, batch_id)),
+                'done': len(self._list(self._key(batch_group_id, 'done', batch_id) + '/')),
+                'leased': len(self._list(self._key(batch_group_id, 'leases', batch_id) + '/')),
+                'finalized': batch_id in finalized,
+            }
+        return summary
+
+    def close(self):
+        pass
+
+
+def get_store():
+    if os.getenv('LEASE_STORE', 'sqlite') == 'r2':
+        return R2LeaseStore()
+    return SqliteLeaseStore(os.getenv('LEASE_STORE_PATH', DEFAULT_STORE_PATH))
+
+
+class _Heartbeat(threading.Thread):
+    """Renews the worker's current leases every third of the lease time."""
+
+    def __init__(self, store, lease_seconds):
+        super().__init__(daemon=True)
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.leases = {}  # position key -> Lease
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def hold(self, leases):
+        with self.lock:
+            for lease in leases:
+                self.leases[(lease.batch_id, lease.position)] = lease
+
+    def drop(self, lease):
+        with self.lock:
+            return self.leases.pop((lease.batch_id, lease.position), lease)
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.lock:
+                leases = list(self.leases.values())
+            try:
+                held = {(lease.batch_id, lease.position): lease
+                        for lease in self.store.heartbeat(leases, self.lease_seconds)}
+            except Exception as e:
+                print(f"Lease heartbeat failed: {str(e)}")
+                continue
+            with self.lock:
+                for lease in leases:
+                    key = (lease.batch_id, lease.position)
+                    if key not in self.leases:
+                        continue  # finished while we were renewing
+                    if key in held:
+                        self.leases[key] = held[key]
+                    else:
+                        print(f"Lost lease on {key[0]}#{key[1]}; another worker took it over")
+                        del self.leases[key]
+
+
+def finalize_batch(store, batch_group_id, batch_id, worker, local=None, result_format=None,
+                   lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Publish a finished batch: results, then the batch-group marker.
+
+    Returns True if this call published it. A failed publish is left to be
+    retried (by any worker's sweep) once the finalization lease expires.
+    """
+    import storage
+    from process_keywords import update_batch_group_status, upload_results_to_r2
+
+    token = store.claim_finalization(batch_group_id, batch_id, worker, lease_seconds)
+    if token is None:
+        return False
+    reporter = get_reporter(batch_group_id, batch_id)
+    try:
+        results = store.results(batch_group_id, batch_id)
+        has_errors = any('error' in result for result in results)
+        if local:
+            storage.save_results(batch_id, results, local, result_format)
+        else:
+            upload_results_to_r2(batch_id, results, result_format)
+            # The rollup publishes group_done after the last batch's batch_done
+            if not update_batch_group_status(batch_group_id, batch_id, error=has_errors, keywords=len(results),
+                                             reporter=reporter):
+                raise RuntimeError("batch-group marker not written")
+    except Exception as e:
+        print(f"Error publishing batch {batch_id}, retrying after {lease_seconds:.0f}s: {str(e)}")
+        return False
+    if not store.commit_finalization(batch_group_id, batch_id, token):
+        print(f"Publishing batch {batch_id} was taken over meanwhile; its new publisher records it")
+        return False
+    print(f"Published batch {batch_id}: {len(results)} keyword(s), errors: {has_errors}")
+    if local and reporter is not None:
+        # No rollup offline: the queue itself knows when the group is done
+        reporter.finish(len(results), has_errors)
+        if store.is_finished(batch_group_id):
+            finish_group(batch_group_id)
+    return True
+
+
+def work(store, batch_group_id, home=None, backend=None, local=None, result_format=None,
+         lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS, exit_when_done=False,
+         poll_interval=2.0):
+    """Search leased keywords of the group until stopped (or nothing is left)."""
+    from process_keywords import close_services, open_services, search_keyword
+    from getbrowser import get_pool
+    from retry import get_retry_policy
+
+    policy = get_retry_policy()
+    policy.max_attempts = max_attempts
+
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    reporters = {}  # batch_id -> progress events for the keywords this worker completes
+    heartbeat = _Heartbeat(store, lease_seconds)
+    heartbeat.start()
+    services = open_services(backend)
+    searched = 0
+
+    def publish(batch_id):
+        if batch_id in reporters:
+            reporters.pop(batch_id).flush()
+        finalize_batch(store, batch_group_id, batch_id, worker, local, result_format, lease_seconds)
+
+    try:
+        while True:
+            leases = store.claim(batch_group_id, worker, lease_seconds=lease_seconds, home=home)
+            if not leases:
+                # Publish batches whose last keyword's worker died or failed to publish
+                for batch_id in store.unfinalized(batch_group_id):
+                    publish(batch_id)
+                if exit_when_done and store.is_finished(batch_group_id):
+                    break
+                time.sleep(poll_interval)  # everything left is leased (or being published) by someone else
+                continue
+            heartbeat.hold(leases)
+            for lease in leases:
+                result = search_keyword(lease.keyword, cache=services.cache, limiter=services.limiter,
+                                        backend=services.fetcher)
+                lease = heartbeat.drop(lease)
+                if 'error' in result:
+                    if policy.should_retry(result.get('reason'), lease.attempts + 1):
+                        # Someone (maybe us) tries again after an exponential, jittered backoff
+                        store.release(lease, policy.delay(lease.attempts + 1, result.get('reason')))
+                        continue
+                    result['attempts'] = lease.attempts + 1
+                if store.complete(lease, result) and events_enabled():
+                    if lease.batch_id not in reporters:
+                        reporters[lease.batch_id] = get_reporter(batch_group_id, lease.batch_id)
+                    reporters[lease.batch_id].keyword(result)
+                searched += 1
+                if store.is_batch_done(batch_group_id, lease.batch_id):
+                    publish(lease.batch_id)
+    finally:
+        heartbeat.stopped.set()
+        for reporter in reporters.values():
+            reporter.flush()
+        close_services(services)
+        get_pool().close()
+        print(f"Worker {worker} searched {searched} keyword(s)")
+
+
+def main():
+    from fetch_backend import BACKENDS  # imports the browser stack; kept out of library use
+
+    parser = argparse.ArgumentParser(description='Lease-based keyword work queue for batch groups')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='add a batch to the group queue')
+    enqueue_parser.add_argument('batch_group_id')
+    enqueue_parser.add_argument('batch_id')
+    enqueue_parser.add_argument('keywords', help="comma-separated keywords, or '-' for one per line on stdin")
+
+    work_parser = commands.add_parser('work', help='search leased keywords of a group')
+    work_parser.add_argument('batch_group_id')
+    work_parser.add_argument('--home', metavar='BATCH_ID', help='batch to work on first before stealing')
+    work_parser.add_argument('--backend', choices=BACKENDS,
+                             help="'browser' (default, FETCH_BACKEND), 'http' or 'auto'")
+    work_parser.add_argument('--local', metavar='DIR',
+                             help='write results to DIR/<batch_id>.* and skip R2 and the batch-group status')
+    work_parser.add_argument('--format', dest='result_format', choices=RESULT_FORMATS,
+                             help="format of results/<batch_id>.*: 'json' (default, RESULTS_FORMAT), "
+                                  "'ndjson.gz' or 'parquet'")
+    work_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                             help='seconds a keyword stays leased without a heartbeat')
+    work_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work_parser.add_argument('--exit-when-done', action='store_true',
+                             help='exit once every batch of the group is searched and published')
+
+    status_parser = commands.add_parser('status', help='per-batch progress of a group')
+    status_parser.add_argument('batch_group_id')
+    args = parser.parse_args()
+
+    store = get_store()
+    try:
+        if args.command == 'enqueue':
+            from keyword_source import iter_keywords
+            source = iter_keywords('-') if args.keywords == '-' else iter_keywords(input_keywords=args.keywords)
+            count = store.enqueue(args.batch_group_id, args.batch_id, source)
+            reporter = get_reporter(args.batch_group_id, args.batch_id)
+            if reporter is not None:
+                reporter.start(count)
+            print(f"Enqueued {count} keyword(s) of batch {args.batch_id} in {store.path}")
+        elif args.command == 'work':
+            work(store, args.batch_group_id, home=args.home, backend=args.backend, local=args.local,
+                 result_format=args.result_format, lease_seconds=args.lease, max_attempts=args.max_attempts,
+                 exit_when_done=args.exit_when_done)
+        else:
+            print(json.dumps(store.status(args.batch_group_id), indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
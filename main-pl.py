@@ -1,122 +1,301 @@
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import csv
 import os
-import sys
-from typing import List, Dict
-import re
-
-def fetch_keywords(input_csv_path: str = None, input_keywords: str = None) -> List[str]:
-    """Fetch keywords from either a CSV file or from the input string."""
-    keywords = []
-    
-    # If a CSV file path is provided, parse the CSV
-    if input_csv_path and os.path.exists(input_csv_path):
-        with open(input_csv_path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            keywords.extend([item for sublist in reader for item in sublist])
-    
-    # If keywords are provided as a string, split by commas
-    if input_keywords:
-        keywords.extend([k.strip() for k in input_keywords.split(',')])
-    
-    # Remove empty strings and duplicates
-    return [k for k in keywords if k]
-
-def start_crawler(keywords: List[str], id: str) -> None:
-    """Start the crawler and process keywords."""
-    results = []
-    retry_list = []
-    
-    with sync_playwright() as p:
-        browser = p.firefox.launch(headless=True)
-        page = browser.new_page()
-        
-        # Loop through keywords and start scraping
-        for keyword in keywords:
+import asyncio
+import argparse
+import fnmatch
+import itertools
+from typing import Dict, Iterable, Iterator, Optional
+from keyword_source import iter_keywords, batched
+from checkpoint import open_checkpoint
+from result_count import extract_count, is_captcha_page, is_consent_page, is_no_results
+from serp import (SEARCH_TYPES, STATS_TIMEOUT, LEAN_BLOCKED_RESOURCE_TYPES, LEAN_BLOCKED_URLS,
+                  TRANSFER_SIZE_JS, BlockedError, MissingStatsError, build_search_url, lean_load_enabled)
+from crawl_engine import crawl, waiting, DEFAULT_TIMEOUT
+from ratelimit import get_limiter
+from metrics import get_metrics
+from retry import RetryScheduler, failure_reason, get_breaker
+
+DEFAULT_CONTEXTS = 8
+DEFAULT_CHECKOUT_TIMEOUT = 600.0  # seconds a query waits for a free context before failing
+BROWSERS = ('firefox', 'chromium', 'webkit')
+
+def fetch_keywords(input_csv_path: str = None, input_keywords: str = None) -> Iterator[str]:
+    """Stream keywords from a CSV/text file ('-' for stdin) and the input string.
+
+    Every CSV cell is a keyword; keywords are normalized and duplicates removed
+    as they are read.
+    """
+    return iter_keywords(input_csv_path, input_keywords, all_columns=True)
+
+class ContextPool:
+    """Isolated browser contexts inside one browser process, one reusable page each.
+
+    Contexts are created once and handed out per query; a context that has
+    served ``max_navigations`` pages is replaced by a fresh one on check-in.
+    With ``lean`` every context aborts non-essential requests and navigation
+    only waits for the response to start (callers wait for #result-stats).
+    A replacement context that fails to open is retried by a later
+    ``checkout()``, which waits at most ``checkout_timeout`` seconds
+    (BROWSER_CHECKOUT_TIMEOUT) for a free context.
+    """
+
+    def __init__(self, browser, size=DEFAULT_CONTEXTS, max_navigations=50, lean=False, checkout_timeout=None):
+        self.browser = browser
+        self.size = max(1, int(size))
+        self.max_navigations = max(1, int(max_navigations))
+        self.lean = lean
+        self.checkout_timeout = float(os.getenv('BROWSER_CHECKOUT_TIMEOUT', DEFAULT_CHECKOUT_TIMEOUT)
+                                      if checkout_timeout is None else checkout_timeout)
+        self._idle = asyncio.Queue()
+        self._navigations = {}  # id(page) -> page loads served
+        self._owed = 0          # contexts that failed to reopen, retried by checkout()
+
+    async def start(self):
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._open_page())
+        print(f'Context pool ready: {self.size} context(s) in one {self.browser.browser_type.name} process')
+        return self
+
+    async def _open_page(self):
+        context = await self.browser.new_context()
+        if self.lean:
+            await context.route('**/*', _lean_route)
+        page = await context.new_page()
+        self._navigations[id(page)] = 0
+        return page
+
+    async def _refill(self):
+        # Put a fresh context in the idle queue; True on success, else the pool runs one short
+        try:
+            self._idle.put_nowait(await self._open_page())
+            return True
+        except Exception as e:
+            self._owed += 1
+            get_metrics().incr('browser_refill_failures')
+            print(f'Error replacing a browser context, pool is {self._owed} short: {e}')
+            return False
+
+    async def checkout(self):
+        if self._idle.empty() and self._owed:
+            self._owed -= 1
+            await self._refill()
+        try:
+            return await asyncio.wait_for(self._idle.get(), self.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'No browser context became available in {self.checkout_timeout:.0f}s') from None
+
+    async def checkin(self, page):
+        if page.is_closed() or self._navigations.get(id(page), 0) >= self.max_navigations:
+            self._navigations.pop(id(page), None)
             try:
-                # Open search URL
-                page.goto(f'https://www.google.com/search?q=intitle%3A%22{keyword}%22')
-                
-                # Wait for Google's result stats
-                visible = page.locator('#result-stats').is_visible()
-                if not visible:
-                    print('There is no stats showing at all')
-                    continue
-                
-                t = page.locator('#result-stats').all_text_contents()
-                print('========', t)
-                
-                # Extract result count
-                result_stats = page.locator('#result-stats').text_content()
-                match = re.search(r'About ([\d,]+) results', result_stats)
-                count = int(match.group(1).replace(',', '')) if match else 0
-                
-                results.append({
-                    'keyword': keyword,
-                    'searchType': 'intitle',
-                    'count': count
-                })
-                print(f'Keyword: "{keyword}", Type: "intitle", Count: {count}')
-                
-            except Exception as error:
-                print(f'Error for "{keyword}": {str(error)}')
-                retry_list.append(keyword)
-        
-        # Retry failed requests
-        if retry_list:
-            print(f'Retrying {len(retry_list)} failed keywords...')
-            for keyword in retry_list:
+                await page.context.close()
+            except Exception:
+                pass
+            await self._refill()
+            return
+        self._idle.put_nowait(page)
+
+    async def navigate(self, page, url):
+        self._navigations[id(page)] = self._navigations.get(id(page), 0) + 1
+        return await page.goto(url, wait_until='commit' if self.lean else 'domcontentloaded')
+
+    async def close(self):
+        while not self._idle.empty():
+            page = self._idle.get_nowait()
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+
+async def _lean_route(route):
+    request = route.request
+    if request.resource_type in LEAN_BLOCKED_RESOURCE_TYPES or any(
+            fnmatch.fnmatchcase(request.url, pattern) for pattern in LEAN_BLOCKED_URLS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def query_count(pool: ContextPool, page, keyword: str, search_type: str, limiter=None,
+                      timeout: float = STATS_TIMEOUT) -> int:
+    """Run one query on ``page`` and return the parsed result count."""
+    if limiter is not None:
+        with waiting():
+            await asyncio.to_thread(limiter.acquire)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await pool.navigate(page, build_search_url(keyword, search_type))
+    try:
+        stats = await page.wait_for_selector('#result-stats', timeout=timeout * 1000)
+    except PlaywrightTimeoutError:
+        stats = None
+    elapsed = loop.time() - started
+    if stats is None:
+        html = await page.content()
+        blocked = '/sorry/' in page.url or is_captcha_page(html)
+        if limiter is not None:
+            await asyncio.to_thread(limiter.report, blocked=blocked, elapsed=elapsed)
+        if blocked:
+            raise BlockedError('Google returned a CAPTCHA / unusual traffic page')
+        if is_no_results(html):
+            return 0
+        if 'consent.google.' in page.url or is_consent_page(html):
+            raise MissingStatsError('Google showed its consent page', reason='consent')
+        raise MissingStatsError('No #result-stats on the results page')
+    if limiter is not None:
+        await asyncio.to_thread(limiter.report, elapsed=elapsed)
+    if pool.lean:
+        await page.evaluate('window.stop()')  # the count is on screen; skip the rest of the page
+    result_stats = await stats.text_content()
+    try:
+        get_metrics().incr('bytes_received', int(await page.evaluate(f'() => {{ {TRANSFER_SIZE_JS} }}') or 0))
+    except Exception:
+        pass
+    count = extract_count(result_stats)
+    if count is None:
+        raise ValueError(f'Unrecognised result stats: {result_stats!r}')
+    return count
+
+async def run_jobs(jobs, emit, contexts: int = DEFAULT_CONTEXTS, timeout: float = DEFAULT_TIMEOUT,
+                   browser_name: str = 'firefox', lean: bool = False) -> None:
+    limiter = get_limiter()
+    breaker = get_breaker()
+    metrics = get_metrics()
+
+    async with async_playwright() as p:
+        # One browser process; concurrency comes from its isolated contexts
+        browser = await getattr(p, browser_name).launch(headless=True)
+        pool = await ContextPool(browser, contexts, lean=lean).start()
+
+        async def fetch(job):
+            index, (keyword, search_type) = job
+            if breaker is not None:
+                await breaker.acquire_async()
+            reason = None
+            try:
+                with waiting():
+                    page = await pool.checkout()
                 try:
-                    page.goto(f'https://www.google.com/search?q=intitle%3A%22{keyword}%22')
-                    page.wait_for_selector('#result-stats', timeout=10000)
-                    result_stats = page.locator('#result-stats').text_content()
-                    match = re.search(r'About ([\d,]+) results', result_stats)
-                    count = int(match.group(1).replace(',', '')) if match else 0
-                    
-                    results.append({
-                        'keyword': keyword,
-                        'searchType': 'intitle',
-                        'count': count
-                    })
-                    print(f'Retrying Keyword: "{keyword}", Type: "intitle", Count: {count}')
-                    
-                except Exception as error:
-                    print(f'Error retrying "{keyword}": {str(error)}')
-        
-        browser.close()
-    
-    # Save results as CSV
+                    with metrics.stage('query', search_type=search_type):
+                        return await query_count(pool, page, keyword, search_type, limiter)
+                finally:
+                    await pool.checkin(page)
+            except BaseException as e:
+                reason = failure_reason(e)
+                raise
+            finally:
+                if breaker is not None:
+                    breaker.release(reason)
+
+        # Failed queries come back after a backoff, ahead of fresh ones
+        scheduler = RetryScheduler(jobs)
+        try:
+            async for result in crawl(scheduler, fetch, concurrency=contexts, timeout=timeout):
+                index, (keyword, search_type) = result.job
+                if result.error:
+                    if scheduler.settle(result.job, result.reason):
+                        print(f'Error for "{keyword}" ({search_type}), will retry: {result.error}')
+                        continue
+                    attempts = scheduler.attempts[result.job]
+                    print(f'Giving up on "{keyword}" ({search_type}) after {attempts} attempt(s): {result.error}')
+                    emit(index, {'keyword': keyword, 'search_type': search_type, 'error': result.error,
+                                 'reason': result.reason, 'attempts': attempts})
+                    continue
+                scheduler.settle(result.job)
+                emit(index, {'keyword': keyword, 'search_type': search_type, 'count': result.value})
+                print(f'Keyword: "{keyword}", Type: "{search_type}", Count: {result.value}')
+        finally:
+            await pool.close()
+            await browser.close()
+            if limiter is not None:
+                limiter.close()
+
+async def start_crawler(keywords: Iterable[str], id: str, resume: Optional[str] = None,
+                        contexts: int = DEFAULT_CONTEXTS, timeout: float = DEFAULT_TIMEOUT,
+                        browser_name: str = 'firefox', lean: Optional[bool] = None) -> None:
+    """Start the crawler and process keywords.
+
+    Both operators of every keyword are queried, spread over ``contexts``
+    browser contexts. Each result is appended to a checkpoint as it
+    completes; with ``resume`` queries already in that run's checkpoint are
+    not searched again.
+    """
+    collected: Dict[int, dict] = {}
+    checkpoint, resumed = open_checkpoint(id, resume)
+    # Checkpoints written before both operators were queried used 'searchType'
+    completed = {(record['keyword'], record.get('search_type', record.get('searchType'))): record['count']
+                 for record in resumed}
+
+    def record(index, row):
+        collected[index] = row
+        if 'error' not in row:
+            checkpoint.append(row)
+
+    def pending_jobs():
+        index = 0
+        for chunk in batched(keywords, 500):
+            for job in ((keyword, search_type) for keyword in chunk for search_type in SEARCH_TYPES):
+                if job in completed:
+                    collected[index] = {'keyword': job[0], 'search_type': job[1], 'count': completed[job]}
+                else:
+                    yield index, job
+                index += 1
+
+    try:
+        await run_jobs(pending_jobs(), record, contexts=contexts, timeout=timeout, browser_name=browser_name,
+                       lean=lean_load_enabled() if lean is None else lean)
+    finally:
+        checkpoint.close()
+
+    rows = [collected[index] for index in sorted(collected)]
+    errors = [row for row in rows if 'error' in row]
+    if errors:
+        print(f'{len(errors)} of {len(rows)} queries failed')
+
+    # Save results as CSV, same schema as main.py (failed queries keep their reason)
     result_path = os.path.join(os.path.dirname(__file__), 'results', f'{id}.csv')
     os.makedirs(os.path.dirname(result_path), exist_ok=True)
-    
+
     with open(result_path, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=['keyword', 'searchType', 'count'])
+        writer = csv.DictWriter(file, fieldnames=['keyword', 'search_type', 'count', 'error'])
         writer.writeheader()
-        writer.writerows(results)
-    
+        writer.writerows({'keyword': row['keyword'], 'search_type': row['search_type'], 'count': row.get('count'),
+                          'error': row.get('reason', 'error') if 'error' in row else None} for row in rows)
+
     print(f'Results saved to {result_path}')
+    print(get_metrics().transfer_summary())
+    checkpoint.remove()
 
 def main():
     """Main function to run the crawler."""
-    # Get command line arguments
-    args = sys.argv[1:]
-    if len(args) < 1:
-        print('Error: ID is required to save the results.')
-        sys.exit(1)
-    
-    id = args[0]
-    input_keywords = args[1] if len(args) > 1 else None
-    input_csv_path = args[2] if len(args) > 2 else None
-    
-    print(f'Starting crawler with ID: {id}')
-    
-    keywords = fetch_keywords(input_csv_path, input_keywords)
-    if not keywords:
+    parser = argparse.ArgumentParser(usage='python main-pl.py <id> [input_keywords] [input_csv_path] [options]')
+    parser.add_argument('id')
+    parser.add_argument('input_keywords', nargs='?')
+    parser.add_argument('input_csv_path', nargs='?')
+    parser.add_argument('--contexts', type=int, default=DEFAULT_CONTEXTS,
+                        help='isolated browser contexts (concurrent queries) in the one browser process')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds allowed per query')
+    parser.add_argument('--browser', choices=BROWSERS, default='firefox')
+    parser.add_argument('--lean', action='store_true', default=None,
+                        help='abort images, fonts, CSS and trackers and stop loading once the count '
+                             'is shown (LEAN_LOAD)')
+    parser.add_argument('--resume', metavar='ID',
+                        help='skip queries already completed in the checkpoint of run ID')
+    args = parser.parse_args()
+
+    print(f'Starting crawler with ID: {args.id}')
+
+    keywords = fetch_keywords(args.input_csv_path, args.input_keywords)
+    first = next(keywords, None)
+    if first is None:
         print('No keywords provided. Exiting...')
-        sys.exit(1)
-    
-    print(f'Fetched Keywords: {", ".join(keywords)}')
-    start_crawler(keywords, id)
+        raise SystemExit(1)
+
+    print(f'Streaming keywords from: {args.input_csv_path or "argument list"}')
+    asyncio.run(start_crawler(itertools.chain([first], keywords), args.id, args.resume,
+                              contexts=args.contexts, timeout=args.timeout, browser_name=args.browser,
+                              lean=args.lean))
 
 if __name__ == '__main__':
     main()
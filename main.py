@@ -1,109 +1,284 @@
 import os
 import csv
-from DrissionPage import Chromium
-import requests
-from time import sleep
+import asyncio
+import argparse
+import functools
+import itertools
+from keyword_source import iter_keywords, batched
+from getbrowser import BrowserPool
+from serp import SEARCH_TYPES
+from fetch_backend import BACKENDS, get_backend
+from crawl_engine import crawl, DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT
+from sharding import run_sharded
+from serp_cache import get_cache
+from ratelimit import get_limiter
+from checkpoint import Checkpoint, open_checkpoint
+from metrics import configure, get_metrics, outcome_code
+from retry import RetryScheduler, guard as breaker_guard
+from planner import allintitle_min, cluster_key, pruned_count, skip_allintitle
+from planner import record as plan_record, report as plan_report
 
-# Fetch keywords either from a CSV file or a comma-separated string
+# Stream keywords from a CSV/text file (or '-' for stdin) and a comma-separated string
 def fetch_keywords(input_csv_path, input_keywords):
-    keywords = []
+    return iter_keywords(input_csv_path, input_keywords)
 
-    # If a CSV file path is provided, parse the CSV
-    if input_csv_path and os.path.exists(input_csv_path):
-        with open(input_csv_path, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            keywords = [row[0] for row in reader]
+# Crawl (index, (keyword, search_type)) jobs, calling emit(index, row) once per job.
+# ``then_jobs`` is a second wave crawled with the same warm browser; it is only
+# read once ``jobs`` are done, so a generator can plan it from their results.
+async def run_jobs(jobs, emit, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, auto_port=None,
+                   backend=None, then_jobs=None):
+    # One warm browser with a tab per concurrent worker (launched on first use,
+    # so the HTTP backend never starts it), paced by the host-wide limiter
+    pool = BrowserPool(tabs_per_browser=concurrency, auto_port=auto_port)
+    limiter = get_limiter()
+    fetcher = get_backend(backend, pool, limiter, concurrency)
 
-    # If keywords are provided as a string, split by commas
-    if input_keywords:
-        keywords.extend(input_keywords.split(','))
-    
-    return [keyword.strip() for keyword in keywords if keyword.strip()]
+    metrics = get_metrics()
+
+    def fetch(job):
+        index, (keyword, search_type) = job
+        with breaker_guard(), metrics.stage('query', search_type=search_type):
+            return fetcher.count(keyword, search_type)
+
+    try:
+        for wave in (jobs, then_jobs):
+            if wave is None:
+                continue
+            # Failed queries come back after a backoff, ahead of fresh ones
+            scheduler = RetryScheduler(wave)
+            async for result in crawl(scheduler, fetch, concurrency=concurrency, timeout=timeout):
+                index, (keyword, search_type) = result.job
+                if result.error:
+                    if scheduler.settle(result.job, result.reason):
+                        print(f"Error for '{keyword}' ({search_type}), will retry: {result.error}")
+                        continue
+                    attempts = scheduler.attempts[result.job]
+                    print(f"Giving up on '{keyword}' ({search_type}) after {attempts} attempt(s): {result.error}")
+                    metrics.outcome(result.code or 'error', keyword)
+                    emit(index, {"keyword": keyword, "search_type": search_type, "error": result.error,
+                                 "reason": result.reason, "attempts": attempts})
+                    continue
+                scheduler.settle(result.job)
+                metrics.outcome(outcome_code(count=result.value), keyword)
+                emit(index, {"keyword": keyword, "search_type": search_type, "count": result.value})
+                print(f'Keyword: "{keyword}", Type: "{search_type}", Count: {result.value}')
+    finally:
+        fetcher.close()
+        pool.close()
+        if limiter is not None:
+            limiter.close()
+
+# Entry point for one shard process in --workers mode
+def crawl_shard(shard, emit, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, checkpoint_id=None,
+                backend=None):
+    checkpoint = Checkpoint(checkpoint_id, part=os.getpid()) if checkpoint_id else None
+
+    def record(index, row):
+        emit(index, row)
+        if checkpoint is not None and "error" not in row:
+            checkpoint.append(row)
+
+    try:
+        asyncio.run(run_jobs(shard, record, concurrency=concurrency, timeout=timeout, auto_port=True,
+                             backend=backend))
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+def lost_job(job, reason):
+    keyword, search_type = job
+    return {"keyword": keyword, "search_type": search_type, "error": reason, "reason": "error"}
 
 # Start crawling using DrissionPage to scrape the search results count from Google
-async def start_crawler(keywords, id):
-    results = []
-    retry_list = []
-
-    # Initialize Drission for browser control (with Firefox by default)
-    browser = Chromium()
-
-
-    for keyword in keywords:
-        for search_type in ['intitle', 'allintitle']:
-            url = f"https://www.google.com/search?q={search_type}%3A%22{requests.utils.quote(keyword)}%22"
-            try:
-                # Fetch page content using Drission
-                page = await browser.get(url)
-
-                # Extract result stats from the page content
-                result_stats = page.ele('#result-stats')
-
-                match = None
-                if "About" in result_stats:
-                    match = result_stats.split('About')[1].split("results")[0].strip()
-                count = int(match.replace(',', '')) if match else 0
-
-                # Log the results
-                results.append({"keyword": keyword, "search_type": search_type, "count": count})
-                print(f'Keyword: "{keyword}", Type: "{search_type}", Count: {count}')
-            
-            except Exception as e:
-                print(f"Error for '{keyword}' ({search_type}): {str(e)}")
-                retry_list.append({"keyword": keyword, "search_type": search_type})  # Retry failed requests
-    
-    # Retry failed requests
-    if retry_list:
-        print(f"Retrying {len(retry_list)} failed requests...")
-        for item in retry_list:
-            keyword = item['keyword']
-            search_type = item['search_type']
-            url = f"https://www.google.com/search?q={search_type}%3A%22{requests.utils.quote(keyword)}%22"
-            try:
-                page = await drission.get(url)
-                result_stats = page.text()
-                match = None
-                if "About" in result_stats:
-                    match = result_stats.split('About')[1].split("results")[0].strip()
-                count = int(match.replace(',', '')) if match else 0
-                results.append({"keyword": keyword, "search_type": search_type, "count": count})
-                print(f"Retried Keyword: '{keyword}', Type: '{search_type}', Count: {count}")
-            except Exception as e:
-                print(f"Error retrying '{keyword}' ({search_type}): {str(e)}")
-
-    # Save results as CSV
+async def start_crawler(keywords, id, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, workers=1,
+                        cache=None, resume=None, backend=None):
+    collected = {}
+    cached_indexes = set()
+    pruned_indexes = set()
+    planned = []  # (position, keyword) in input order, for the allintitle wave
+    threshold = allintitle_min()
+
+    metrics = get_metrics()
+
+    # Every completed query is appended to a checkpoint; --resume skips those
+    with metrics.stage('checkpoint_load'):
+        checkpoint, resumed = open_checkpoint(id, resume)
+    completed = {(row["keyword"], row["search_type"]): row["count"] for row in resumed}
+
+    def record(index, row):
+        collected[index] = row
+        if "error" not in row:
+            checkpoint.append(row)
+
+    # Row index = 2 * keyword position + operator, so results keep input order.
+    # Counts from the checkpoint and the local cache are filled in directly;
+    # only the misses are yielded to the crawler, related keywords together.
+    def plan_jobs(chunk, search_type):
+        offset = SEARCH_TYPES.index(search_type)
+        cached = {}
+        if cache is not None and chunk:
+            with metrics.stage('cache_lookup'):
+                cached = cache.get_many([(keyword, search_type) for _, keyword in chunk])
+            metrics.incr('cache_hits', len(cached))
+        for position, keyword in sorted(chunk, key=lambda item: cluster_key(item[1])):
+            index, job = 2 * position + offset, (keyword, search_type)
+            if job in completed:
+                collected[index] = {"keyword": keyword, "search_type": search_type, "count": completed[job]}
+                plan_record(metrics, 'checkpoint')
+            elif job in cached:
+                collected[index] = {"keyword": keyword, "search_type": search_type, "count": cached[job]}
+                cached_indexes.add(index)
+                plan_record(metrics, 'cache')
+            else:
+                plan_record(metrics, 'navigation')
+                yield index, job
+
+    # First wave: intitle for every keyword, read as a stream
+    def intitle_jobs():
+        for chunk in batched(keywords, 500):
+            chunk = [(len(planned) + n, keyword) for n, keyword in enumerate(chunk)]
+            planned.extend(chunk)
+            yield from plan_jobs(chunk, 'intitle')
+
+    # Second wave: allintitle only where intitle did not already settle it
+    # (an intitle that failed every retry gives no count, so allintitle is searched)
+    def allintitle_jobs():
+        for chunk in batched(planned, 500):
+            needed = []
+            for position, keyword in chunk:
+                intitle = collected.get(2 * position)
+                count = intitle.get("count") if intitle is not None else None
+                if skip_allintitle(count, threshold):
+                    row = {"keyword": keyword, "search_type": "allintitle", "count": pruned_count(count)}
+                    if row["count"] is None:
+                        row["pruned"] = True  # intitle is only an upper bound: no count
+                    collected[2 * position + 1] = row
+                    pruned_indexes.add(2 * position + 1)
+                    plan_record(metrics, 'pruned')
+                else:
+                    needed.append((position, keyword))
+            yield from plan_jobs(needed, 'allintitle')
+
+    shard_errors = []
+    try:
+        if workers > 1:
+            # Shards are cut up front, so this mode reads all keywords first and
+            # runs one sharded pass per wave
+            shard_fn = functools.partial(crawl_shard, concurrency=concurrency, timeout=timeout,
+                                         checkpoint_id=id, backend=backend)
+            loop = asyncio.get_running_loop()
+            with metrics.stage('crawl'):
+                for wave in (intitle_jobs, allintitle_jobs):
+                    pending = list(wave())
+                    if not pending:
+                        continue
+                    fetched, errors = await loop.run_in_executor(
+                        None, run_sharded, [job for _, job in pending], shard_fn, workers, lost_job)
+                    collected.update(zip((index for index, _ in pending), fetched))
+                    shard_errors += errors
+        else:
+            with metrics.stage('crawl'):
+                await run_jobs(intitle_jobs(), record, concurrency=concurrency, timeout=timeout,
+                               backend=backend, then_jobs=allintitle_jobs())
+    finally:
+        checkpoint.close()
+    print(plan_report(metrics, len(planned)))
+
+    rows = [collected[index] for index in sorted(collected)]
+    if cache is not None:
+        print(f"{len(cached_indexes)} of {len(rows)} queries served from cache")
+        with metrics.stage('cache_store'):
+            cache.put_many((row["keyword"], row["search_type"], row["count"])
+                           for index, row in collected.items()
+                           if "error" not in row and index not in cached_indexes
+                           and index not in pruned_indexes)
+
+    errors = [row for row in rows if "error" in row]
+    if errors or shard_errors:
+        print(f"{len(errors)} of {len(rows)} queries failed")
+        for row in errors:
+            print(f"  '{row['keyword']}' ({row['search_type']}): {row.get('reason', 'error')}: {row['error']}")
+        for error in shard_errors:
+            print(f"  {error}")
+
+    # Save results as CSV; failed queries keep a row with an empty count and their failure reason,
+    # skipped allintitle searches without an exact count are marked 'pruned'
     result_path = os.path.join('results', f'{id}.csv')
     os.makedirs(os.path.dirname(result_path), exist_ok=True)
 
-    with open(result_path, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=["keyword", "search_type", "count"])
+    with metrics.stage('write_results'), open(result_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=["keyword", "search_type", "count", "error"])
         writer.writeheader()
-        writer.writerows(results)
+        writer.writerows({"keyword": row["keyword"], "search_type": row["search_type"], "count": row.get("count"),
+                          "error": "pruned" if row.get("pruned") else
+                                   row.get("reason", "error") if "error" in row else None} for row in rows)
 
     print(f"Results saved to {result_path}")
+    print(metrics.transfer_summary())
+    checkpoint.remove()
 
 # Main function to handle the command line input and orchestrate the crawler execution
 async def main():
-    import sys
-    if len(sys.argv) < 4:
-        print("Usage: python script.py <id> <input_keywords> <input_csv_path>")
-        return
-
-    id = sys.argv[1]
-    input_keywords = sys.argv[2]
-    input_csv_path = sys.argv[3] if len(sys.argv) > 3 else None
+    parser = argparse.ArgumentParser(usage="python script.py <id> <input_keywords> <input_csv_path> [options]")
+    parser.add_argument('id')
+    parser.add_argument('input_keywords')
+    parser.add_argument('input_csv_path', nargs='?')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='number of browser tabs crawling at the same time')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='seconds allowed per query')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='split keywords across N processes, each with its own browser')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='ignore the local SERP count cache (SERP_CACHE_* env vars)')
+    parser.add_argument('--backend', choices=BACKENDS,
+                        help="how pages are fetched: 'browser' (default, FETCH_BACKEND), 'http', "
+                             "or 'auto' (HTTP with browser fallback)")
+    parser.add_argument('--resume', metavar='ID',
+                        help='skip queries already completed in the checkpoint of run ID')
+    parser.add_argument('--allintitle-min', type=int,
+                        help='skip allintitle when intitle is below this (PLANNER_ALLINTITLE_MIN, default 1: '
+                             'only zero; 0 never skips)')
+    parser.add_argument('--lean', action='store_true',
+                        help='drop images, fonts, CSS and trackers and stop loading once the count '
+                             'is shown (LEAN_LOAD)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print a per-stage timing breakdown when the run ends')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve Prometheus metrics on this port (METRICS_PORT)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='append a JSON line per timed stage to PATH (METRICS_TRACE)')
+    args = parser.parse_args()
+    if args.lean:
+        os.environ['LEAN_LOAD'] = '1'  # inherited by shard processes
+    if args.allintitle_min is not None:
+        os.environ['PLANNER_ALLINTITLE_MIN'] = str(args.allintitle_min)
+    metrics = configure(args.metrics_port, args.trace)
 
+    id = args.id
     print(f"Starting crawler with ID: {id}")
-    keywords = fetch_keywords(input_csv_path, input_keywords)
+    keywords = fetch_keywords(args.input_csv_path, args.input_keywords)
 
-    if not keywords:
+    # Peek so an empty input still exits early without reading everything up front
+    first = next(keywords, None)
+    if first is None:
         print("No keywords provided. Exiting...")
         return
+    keywords = itertools.chain([first], keywords)
 
-    print(f"Fetched Keywords: {', '.join(keywords)}")
-    await start_crawler(keywords, id)
+    print(f"Streaming keywords from: {args.input_csv_path or 'argument list'}")
+    cache = None if args.no_cache else get_cache()
+    try:
+        await start_crawler(keywords, id, concurrency=args.concurrency, timeout=args.timeout,
+                            workers=args.workers, cache=cache, resume=args.resume,
+                            backend=args.backend)
+    finally:
+        if cache is not None:
+            cache.close()
+        if args.profile:
+            print(metrics.profile())
+        metrics.close()
 
 # Run the main function
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,251 @@
+"""Per-stage timers, counters and keyword outcome codes for the crawl pipeline.
+
+Code wraps each stage in ``get_metrics().stage('navigate')``; every stage
+keeps a count, total, max and latency histogram. Per-keyword results are
+counted with ``outcome('ok' | 'no_results' | 'blocked' | ...)``.
+
+Exporters, all optional:
+  METRICS_PORT   serve Prometheus text format on http://0.0.0.0:<port>/metrics
+  METRICS_TRACE  append one JSON line per timed stage to this file
+and ``profile()`` renders a per-stage breakdown for the crawlers' --profile flag.
+
+Shard processes (--workers) start with a fresh registry; sharding.run_sharded
+merges their snapshots back into the parent's.
+"""
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def outcome_code(error=None, count=None):
+    """Outcome code for one query: from the exception it raised, or its count."""
+    if error is None:
+        return 'no_results' if count == 0 else 'ok'
+    name = type(error).__name__
+    if name == 'BlockedError':
+        return 'blocked'
+    if name == 'FallbackRequired':
+        return 'fallback'
+    if isinstance(error, TimeoutError) or name == 'TimeoutError':
+        return 'timeout'
+    if isinstance(error, ValueError):
+        return 'parse_error'
+    return 'error'
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'fields', 'started')
+
+    def __init__(self, metrics, name, fields):
+        self.metrics = metrics
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.fields['error'] = exc_type.__name__
+        self.metrics.observe(self.name, elapsed, **self.fields)
+
+
+class Metrics:
+    """Thread-safe registry of stage timings, counters and outcome codes."""
+
+    def __init__(self, trace_path=None):
+        self._lock = threading.Lock()
+        self._stages = {}    # name -> [count, total, max, bucket counts]
+        self._counters = {}
+        self._outcomes = {}
+        self._trace = open(trace_path, 'a', buffering=1, encoding='utf-8') if trace_path else None
+        self._server = None
+        self.started = time.time()
+
+    def stage(self, name, **fields):
+        """Context manager timing one run of stage ``name``."""
+        return _Stage(self, name, fields)
+
+    def observe(self, name, seconds, **fields):
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = self._stages[name] = [0, 0.0, 0.0, [0] * (len(BUCKETS) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for n, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[3][n] += 1
+                    break
+            else:
+                entry[3][-1] += 1
+            if self._trace is not None:
+                event = {'stage': name, 'ts': round(time.time() - seconds, 6),
+                         'dur': round(seconds, 6), 'pid': os.getpid(),
+                         'tid': threading.get_ident()}
+                event.update(fields)
+                self._trace.write(json.dumps(event, default=str) + '\n')
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def outcome(self, code, keyword=None):
+        """Count one query/keyword ending with ``code``."""
+        with self._lock:
+            self._outcomes[code] = self._outcomes.get(code, 0) + 1
+            if self._trace is not None and keyword is not None:
+                self._trace.write(json.dumps({'outcome': code, 'keyword': keyword,
+                                              'ts': round(time.time(), 6), 'pid': os.getpid()}) + '\n')
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'stages': {name: {'count': e[0], 'sum': e[1], 'max': e[2], 'buckets': list(e[3])}
+                           for name, e in self._stages.items()},
+                'counters': dict(self._counters),
+                'outcomes': dict(self._outcomes),
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot from another process (a shard) into this registry."""
+        with self._lock:
+            for name, stats in snapshot.get('stages', {}).items():
+                entry = self._stages.get(name)
+                if entry is None:
+                    entry = self._stages[name] = [0, 0.0, 0.0, [0] * (len(BUCKETS) + 1)]
+                entry[0] += stats['count']
+                entry[1] += stats['sum']
+                entry[2] = max(entry[2], stats['max'])
+                entry[3] = [a + b for a, b in zip(entry[3], stats['buckets'])]
+            for target, source in ((self._counters, 'counters'), (self._outcomes, 'outcomes')):
+                for name, value in snapshot.get(source, {}).items():
+                    target[name] = target.get(name, 0) + value
+
+    def prometheus(self):
+        """Current values in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = ['# HELP kgr_stage_seconds Time spent per crawl pipeline stage.',
+                 '# TYPE kgr_stage_seconds histogram']
+        for name, stats in sorted(snapshot['stages'].items()):
+            cumulative = 0
+            for bound, hits in zip(BUCKETS + ('+Inf',), stats['buckets']):
+                cumulative += hits
+                lines.append(f'kgr_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'kgr_stage_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'kgr_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        lines += ['# HELP kgr_query_outcomes_total Finished queries by outcome code.',
+                  '# TYPE kgr_query_outcomes_total counter']
+        for code, value in sorted(snapshot['outcomes'].items()):
+            lines.append(f'kgr_query_outcomes_total{{outcome="{code}"}} {value}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines += [f'# TYPE kgr_{name}_total counter', f'kgr_{name}_total {value}']
+        return '\n'.join(lines) + '\n'
+
+    def profile(self):
+        """Per-stage breakdown table, slowest stage first."""
+        snapshot = self.snapshot()
+        wall = time.time() - self.started
+        lines = [f"Profile ({wall:.1f}s wall; stage time is summed over concurrent workers):",
+                 f"  {'stage':<18} {'calls':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'% wall':>7}"]
+        for name, stats in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['sum']):
+            mean = stats['sum'] / stats['count'] * 1000 if stats['count'] else 0.0
+            share = stats['sum'] / wall * 100 if wall else 0.0
+            lines.append(f"  {name:<18} {stats['count']:>7} {stats['sum']:>9.2f} {mean:>9.1f} "
+                         f"{stats['max'] * 1000:>9.1f} {share:>6.1f}%")
+        if snapshot['outcomes']:
+            outcomes = ', '.join(f"{code}={value}" for code, value in sorted(snapshot['outcomes'].items()))
+            lines.append(f"  outcomes: {outcomes}")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"  {name}: {value}")
+        return '\n'.join(lines)
+
+    def transfer_summary(self, stage='query'):
+        """One-line bytes and time per query, for the crawlers' run summaries."""
+        snapshot = self.snapshot()
+        stats = snapshot['stages'].get(stage)
+        if not stats or not stats['count']:
+            return "No queries were sent"
+        received = snapshot['counters'].get('bytes_received', 0)
+        return (f"{stats['count']} queries, {received / 2 ** 20:.1f} MiB transferred "
+                f"({received / stats['count'] / 1024:.0f} KiB/query), "
+                f"{stats['sum'] / stats['count']:.2f}s/query")
+
+    def serve(self, port, host='0.0.0.0'):
+        """Serve /metrics from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, int(port)), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+def _reset_after_fork():
+    # A forked shard must not share the parent's registry, trace handle or server
+    global _metrics, _metrics_lock
+    _metrics = None
+    _metrics_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_metrics():
+    """Registry shared by this process (a forked shard gets its own)."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(trace_path=os.getenv('METRICS_TRACE') or None)
+            port = os.getenv('METRICS_PORT')
+            # Only the process that owns the port serves it; shards report via merge()
+            if port and os.getenv('METRICS_SHARD') != '1':
+                try:
+                    _metrics.serve(port)
+                except OSError as e:
+                    print(f"Could not serve metrics on port {port}: {str(e)}")
+        return _metrics
+
+
+def configure(port=None, trace_path=None):
+    """Apply --metrics-port / --trace before the first get_metrics() call."""
+    if port:
+        os.environ['METRICS_PORT'] = str(port)
+    if trace_path:
+        os.environ['METRICS_TRACE'] = trace_path
+    return get_metrics()
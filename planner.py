@@ -0,0 +1,149 @@
+"""Query planning: decide which operator searches actually need a navigation.
+
+Before anything is crawled:
+  * counts already known (checkpoint, local cache, other batches of the same
+    batch group) are reused instead of searched again;
+  * ``allintitle`` is skipped when ``intitle`` came back below
+    ``allintitle_min()`` (PLANNER_ALLINTITLE_MIN, default 1: only when it is
+    0). allintitle results are a subset of intitle ones, so a 0 intitle
+    makes allintitle an exact 0; for a higher threshold a non-zero intitle
+    is only an upper bound, so the allintitle count is left blank (and the
+    row marked) rather than recorded as if it had been measured;
+  * each chunk of queries is ordered so related keywords sit together.
+
+Decisions are counted in the metrics registry (shards included) and
+``report()`` turns them into the navigations-saved line of the run summary.
+"""
+import os
+
+DEFAULT_ALLINTITLE_MIN = 1
+
+
+def allintitle_min():
+    return int(os.getenv('PLANNER_ALLINTITLE_MIN', DEFAULT_ALLINTITLE_MIN))
+
+
+def skip_allintitle(intitle, threshold):
+    """True when a known ``intitle`` count makes the allintitle search pointless."""
+    return intitle is not None and intitle < threshold
+
+
+def pruned_count(intitle):
+    """allintitle count implied by a skipped search: 0 after a 0 intitle, else unknown (None)."""
+    return 0 if intitle == 0 else None
+
+
+def cluster_key(keyword):
+    """Sort key that puts keywords sharing their head term and word set next to each other."""
+    tokens = keyword.split()
+    return (tokens[0] if tokens else '', sorted(tokens), keyword)
+
+
+def record(metrics, decision, count=1):
+    """Count one planner decision: 'checkpoint', 'cache', 'group', 'pruned' or 'navigation'."""
+    if count:
+        metrics.incr(f'plan_{decision}', count)
+
+
+def report(metrics, keywords, since=None):
+    """Summary line: how many of the 2-per-keyword searches were actually sent.
+
+    ``since`` is an earlier ``metrics.snapshot()`` to report only what came
+    after it (one batch of a long-running worker).
+    """
+    counters = dict(metrics.snapshot()['counters'])
+    for name, value in (since or {}).get('counters', {}).items():
+        counters[name] = counters.get(name, 0) - value
+    possible = 2 * keywords
+    sent = counters.get('plan_navigation', 0)
+    saved = max(0, possible - sent)
+    share = saved / possible * 100 if possible else 0.0
+    return (f"Planner: {keywords} keyword(s), {possible} possible searches; "
+            f"{counters.get('plan_checkpoint', 0)} from checkpoint, {counters.get('plan_cache', 0)} from cache, "
+            f"{counters.get('plan_group', 0)} from batch group, {counters.get('plan_pruned', 0)} allintitle skipped "
+            f"-> {sent} navigation(s), {saved} saved ({share:.0f}%)")
+
+
+class GroupIndex:
+    """Which batch of a group searches each keyword, shared through R2.
+
+    ``claim()`` takes every keyword of a chunk for this batch with one
+    conditional PUT each (progress.claim_keyword); keywords another batch
+    claimed first are moved to the end of the chunk. The owner ``record()``s
+    its counts once searched, and by the time this batch reaches a deferred
+    keyword ``keyword in index`` / ``index[keyword]`` (perform_search's
+    ``known``) usually finds them; if not, the keyword is searched here too.
+    A keyword costs one PUT (two for its owner) plus a GET per duplicate,
+    however many batches the group has.
+    """
+
+    def __init__(self, batch_group_id, batch_id, s3=None, bucket_name=None):
+        self.batch_group_id = batch_group_id
+        self.batch_id = batch_id
+        self.others = set()  # keywords another batch claimed first
+        self.counts = {}     # keyword -> counts read back from the index
+        self._s3, self._bucket_name = s3, bucket_name
+        self._failed = False
+
+    def __getstate__(self):
+        # Shard processes get the index without the client and open their own
+        state = dict(self.__dict__)
+        state['_s3'] = None
+        return state
+
+    def _client(self):
+        if self._s3 is None:
+            from storage import get_r2_client
+            self._s3, self._bucket_name = get_r2_client()
+        return self._s3, self._bucket_name
+
+    def claim(self, keywords):
+        """Claim ``keywords`` for this batch; returns them with other batches' keywords last."""
+        from progress import claim_keyword
+
+        mine, theirs = [], []
+        for keyword in keywords:
+            entry = None
+            if not self._failed:
+                try:
+                    entry = claim_keyword(self.batch_group_id, self.batch_id, keyword, *self._client())
+                except Exception as e:
+                    self._failed = True
+                    print(f"Error claiming keywords in batch group {self.batch_group_id}, "
+                          f"searching the rest here: {str(e)}")
+            if entry is not None and entry.get('batchId') != self.batch_id:
+                self.others.add(keyword)
+                theirs.append(keyword)
+            else:
+                mine.append(keyword)
+        return mine + theirs
+
+    def record(self, result):
+        """Publish the counts of a keyword this batch searched for the group's other batches."""
+        from progress import record_keyword
+
+        if (self._failed or result['keyword'] in self.others or 'error' in result
+                or result.get('intitle') is None or result.get('allintitle') is None):
+            return
+        try:
+            record_keyword(self.batch_group_id, self.batch_id, result, *self._client())
+        except Exception as e:
+            print(f"Error recording {result['keyword']!r} in batch group {self.batch_group_id}: {str(e)}")
+
+    def __contains__(self, keyword):
+        if keyword in self.counts:
+            return True
+        if keyword not in self.others:
+            return False
+        from progress import read_keyword
+        try:
+            entry = read_keyword(self.batch_group_id, keyword, *self._client())
+        except Exception:
+            return False
+        if not entry or entry.get('intitle') is None or entry.get('allintitle') is None:
+            return False  # its batch has not searched it (yet): search it here
+        self.counts[keyword] = {'intitle': entry['intitle'], 'allintitle': entry['allintitle']}
+        return True
+
+    def __getitem__(self, keyword):
+        return self.counts[keyword]
@@ -1,40 +1,154 @@
-import sys
-import json
-import time
 import os
-import boto3
-import re
-from getbrowser import setup_chrome
+import argparse
+import functools
+from keyword_source import batched, iter_keywords
+from getbrowser import BrowserPool, get_pool
+from serp import SEARCH_TYPES
+from fetch_backend import BACKENDS, BrowserBackend, get_backend
+from ratelimit import get_limiter
+from serp_cache import get_cache
+from sharding import run_sharded
+from checkpoint import Checkpoint, open_checkpoint
+from storage import RESULT_FORMATS, save_results, upload_results
+from progress import mark_batch_complete, refresh_rollup
+from metrics import configure, get_metrics, outcome_code
+from planner import GroupIndex, allintitle_min, cluster_key, pruned_count, skip_allintitle
+from planner import record as plan_record, report as plan_report
+from retry import RetryScheduler, failure_reason, guard as breaker_guard
+from events import ProgressReporter, finish_group, get_reporter
 from datetime import datetime
+from typing import Any, NamedTuple
 
-def main(keywords, batch_id, batch_group_id):
-    # Split keywords string into a list if it contains commas
-    keywords = keywords.split(",") if "," in keywords else [keywords]
-    
-    results = []
-    error_occurred = False
+class Services(NamedTuple):
+    """Per-process search clients a batch runs with: SERP cache, rate limiter, fetch backend."""
+    cache: Any
+    limiter: Any
+    fetcher: Any
 
+def open_services(backend=None):
+    limiter = get_limiter()
+    return Services(get_cache(), limiter, get_backend(backend, get_pool(), limiter))
+
+def close_services(services):
+    services.fetcher.close()
+    if services.cache is not None:
+        services.cache.close()
+    if services.limiter is not None:
+        services.limiter.close()
+
+def main(keywords, batch_id, batch_group_id, workers=1, resume=None, backend=None,
+         result_format=None, columnar=False, local=None, profile=False, group_dedupe=False):
+    try:
+        run_batch(keywords, batch_id, batch_group_id, workers=workers, resume=resume, backend=backend,
+                  result_format=result_format, columnar=columnar, local=local, group_dedupe=group_dedupe)
+    finally:
+        get_pool().close()
+        if profile:
+            print(get_metrics().profile())
+        get_metrics().close()
+
+def run_batch(keywords, batch_id, batch_group_id, workers=1, resume=None, backend=None,
+              result_format=None, columnar=False, local=None, services=None, group_dedupe=False):
+    """Search one batch and publish its results; returns True if anything failed.
+
+    ``services`` lets a long-running caller (worker.py) reuse warm clients
+    across batches; they are left open. Otherwise they are opened and closed here.
+    With ``group_dedupe`` each keyword is claimed in the group's shared index
+    (planner.GroupIndex); one claimed by another batch is searched last and
+    its counts copied from that batch instead of searched again.
+    """
+    metrics = get_metrics()
+    before = metrics.snapshot()
+    # Comma-separated keywords, or '-' to stream one keyword per line from stdin;
+    # normalized and de-duplicated as they are read. A list is taken as already normalized.
+    if keywords == '-':
+        keywords = iter_keywords('-')
+    elif isinstance(keywords, str):
+        # Already in memory: listing it gives progress events their total up front
+        keywords = list(iter_keywords(input_keywords=keywords))
+    if workers > 1:
+        keywords = list(keywords)  # shards are cut up front, so this mode reads all keywords first
+
+    # Each finished keyword is checkpointed; --resume skips those already done
+    checkpoint, resumed = open_checkpoint(batch_id, resume)
+    completed = {result['keyword']: result for result in resumed}
+    # Per-keyword progress for events.py serve, so the front end need not poll R2
+    reporter = get_reporter(batch_group_id, batch_id)
+    if reporter is not None:
+        reporter.start(len(keywords) if isinstance(keywords, list) else None)
+
+    owned = None
     try:
-        for keyword in keywords:
-            try:
-                result = perform_search(keyword.strip())  # Ensure each keyword is stripped of leading/trailing spaces
-                result['timestamp'] = datetime.utcnow().isoformat()
-                results.append(result)
-            except Exception as e:
-                print(f"Error processing keyword {keyword}: {str(e)}")
-                results.append({
-                    'keyword': keyword,
-                    'error': str(e),
-                    'timestamp': datetime.utcnow().isoformat()
-                })
-                error_occurred = True
-
-        with open('results.json', 'w') as f:
-            print('Results:', results)
-            json.dump(results, f)
-
-        upload_results_to_r2(batch_id)
-        update_batch_group_status(batch_group_id)
+        known = GroupIndex(batch_group_id, batch_id) if group_dedupe and not local else None
+
+        if workers > 1:
+            pending = [keyword for keyword in keywords if keyword not in completed]
+            if known is not None:
+                pending = known.claim(pending)
+            plan_record(metrics, 'checkpoint', 2 * (len(keywords) - len(pending)))
+            if reporter is not None:
+                for keyword in keywords:
+                    if keyword in completed:
+                        reporter.keyword(completed[keyword])
+            shard_fn = functools.partial(search_shard, checkpoint_id=batch_id, backend=backend, known=known,
+                                         batch_ids=(batch_group_id, batch_id) if reporter is not None else None)
+            fetched, shard_errors = run_sharded(pending, shard_fn, workers, on_lost=lost_keyword)
+            completed.update(zip(pending, fetched))
+            if known is not None:
+                for result in fetched:
+                    known.record(result)
+            results = [completed[keyword] for keyword in keywords]
+        else:
+            if services is None:
+                services = owned = open_services(backend)
+            results = []
+            for chunk in batched(keywords, 500):
+                # Related keywords are searched together; results keep input order.
+                # Failed keywords come back after a backoff, between fresh ones.
+                searched = {}
+                order = sorted(chunk, key=cluster_key)
+                if known is not None:
+                    # Keywords another batch claimed go last, by when their counts are in
+                    order = known.claim([keyword for keyword in order if keyword not in completed]) + \
+                        [keyword for keyword in order if keyword in completed]
+                scheduler = RetryScheduler(order)
+                for keyword in scheduler:
+                    result = completed.get(keyword)
+                    if result is not None:
+                        plan_record(metrics, 'checkpoint', 2)
+                        scheduler.settle(keyword)
+                    else:
+                        result = search_keyword(keyword, cache=services.cache, limiter=services.limiter,
+                                                backend=services.fetcher, known=known)
+                        if scheduler.settle(keyword, result.get('reason')):
+                            continue
+                        if 'error' in result:
+                            result['attempts'] = scheduler.attempts[keyword]
+                        else:
+                            checkpoint.append(result)
+                            if known is not None:
+                                known.record(result)
+                    searched[keyword] = result
+                    if reporter is not None:
+                        reporter.keyword(result)
+                results.extend(searched[keyword] for keyword in chunk)
+            shard_errors = []
+        error_occurred = bool(shard_errors) or any('error' in result for result in results)
+
+        print(f"Results: {len(results)} keyword(s), errors: {error_occurred}")
+        print(plan_report(metrics, len(results), since=before))
+        print(get_metrics().transfer_summary())
+        if local:
+            # Offline run (benchmarks, debugging): no R2 upload, no batch-group status
+            save_results(batch_id, results, local, result_format)
+            if reporter is not None:
+                reporter.finish(len(results), error_occurred)
+        else:
+            upload_results_to_r2(batch_id, results, result_format, columnar)
+            update_batch_group_status(batch_group_id, batch_id, error=error_occurred, keywords=len(results),
+                                      reporter=reporter)
+        checkpoint.remove()
+        return error_occurred
 
     except Exception as e:
         print(f"Fatal error in main: {str(e)}")
@@ -42,111 +156,202 @@ def main(keywords, batch_id, batch_group_id):
             'error': str(e),
             'timestamp': datetime.utcnow().isoformat()
         }]
-        with open('results.json', 'w') as f:
-            json.dump(error_results, f)
-        upload_results_to_r2(batch_id)
-        update_batch_group_status(batch_group_id, error=True)
-
-def perform_search(keyword):
-    browser = setup_chrome()
-    driver = browser.new_tab()
+        if local:
+            save_results(batch_id, error_results, local, result_format)
+            if reporter is not None:
+                reporter.finish(has_errors=True)
+        else:
+            upload_results_to_r2(batch_id, error_results, result_format)
+            update_batch_group_status(batch_group_id, batch_id, error=True, reporter=reporter)
+        return True
+    finally:
+        checkpoint.close()
+        if owned is not None:
+            close_services(owned)
 
+def search_keyword(keyword, pool=None, cache=None, limiter=None, backend=None, known=None):
+    metrics = get_metrics()
     try:
-        # Perform the first search
-        search_query = f'intitle:"{keyword}"'
-        driver.get(f'https://www.google.com/search?q={search_query}')
-        time.sleep(2)  # Add delay to respect rate limits
-        element = driver.ele('#result-stats')
-        intitle_count = extract_count(element.text)
-
-        # Perform the second search
-        search_query = f'allintitle:"{keyword}"'
-        driver.get(f'https://www.google.com/search?q={search_query}')
-        time.sleep(2)  # Add delay to respect rate limits
-        element = driver.ele('#result-stats')
-        allintitle_count = extract_count(element.text)
-
+        with metrics.stage('keyword'):
+            result = perform_search(keyword, pool, cache, limiter, backend, known)
+        metrics.outcome('no_results' if 0 in (result['intitle'], result['allintitle']) else 'ok', keyword)
+        result['timestamp'] = datetime.utcnow().isoformat()
+        return result
+    except Exception as e:
+        print(f"Error processing keyword {keyword}: {str(e)}")
+        metrics.outcome(outcome_code(e), keyword)
         return {
-            'keyword': keyword, 
-            'intitle': intitle_count, 
-            'allintitle': allintitle_count
+            'keyword': keyword,
+            'error': str(e),
+            'reason': failure_reason(e),
+            'timestamp': datetime.utcnow().isoformat()
         }
-    finally:
-        try:
-            driver.close()
-        except:
-            pass
-
-def extract_count(result_stats):
-    # Use regex to find the number in the result stats text
-    match = re.search(r'About ([\d,]+) results', result_stats)
-    if match:
-        return int(match.group(1).replace(',', ''))  # Convert to integer
-    return 0
-
-def get_r2_client():
-    # Get environment variables
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID')
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY')
-    bucket_name = os.getenv('R2_BUCKET_NAME')
-    endpoint_url = os.getenv('R2_ENDPOINT_URL')
-
-    if not all([access_key_id, secret_access_key, bucket_name, endpoint_url]):
-        raise ValueError("One or more environment variables are missing")
-
-    # Initialize the s3 client with the R2 endpoint
-    return boto3.client(
-        's3',
-        endpoint_url=endpoint_url,
-        aws_access_key_id=access_key_id,
-        aws_secret_access_key=secret_access_key
-    ), bucket_name
-
-def upload_results_to_r2(batch_id):
-    s3, bucket_name = get_r2_client()
-
-    # Read the results from the file
-    with open('results.json', 'rb') as f:
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=f'results/{batch_id}.json',
-            Body=f
-        )
-
-def update_batch_group_status(batch_group_id, error=False):
+
+def search_shard(shard, emit, checkpoint_id=None, backend=None, known=None, batch_ids=None):
+    # Runs in its own process (--workers mode) with its own browser; with
+    # ``batch_ids`` (batch_group_id, batch_id) it publishes its own progress events
+    pool = BrowserPool(auto_port=True)
+    reporter = ProgressReporter(*batch_ids) if batch_ids else None
+    cache = get_cache()
+    limiter = get_limiter()
+    fetcher = get_backend(backend, pool, limiter)
+    checkpoint = Checkpoint(checkpoint_id, part=os.getpid()) if checkpoint_id else None
     try:
-        s3, bucket_name = get_r2_client()
+        scheduler = RetryScheduler(shard)
+        for job in scheduler:
+            index, keyword = job
+            result = search_keyword(keyword, pool, cache, limiter, fetcher, known)
+            if scheduler.settle(job, result.get('reason')):
+                continue
+            if 'error' in result:
+                result['attempts'] = scheduler.attempts[job]
+            emit(index, result)
+            if reporter is not None:
+                reporter.keyword(result)
+            if checkpoint is not None and 'error' not in result:
+                checkpoint.append(result)
+    finally:
+        if reporter is not None:
+            reporter.flush()
+        fetcher.close()
+        pool.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if cache is not None:
+            cache.close()
+        if limiter is not None:
+            limiter.close()
+
+def lost_keyword(keyword, reason):
+    return {
+        'keyword': keyword,
+        'error': reason,
+        'reason': 'error',
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def perform_search(keyword, pool=None, cache=None, limiter=None, backend=None, known=None):
+    # Only navigate for operators without a count from the batch group or the cache
+    metrics = get_metrics()
+    if known is not None and keyword in known:
+        plan_record(metrics, 'group', 2)
+        return {'keyword': keyword, 'intitle': known[keyword]['intitle'],
+                'allintitle': known[keyword]['allintitle']}
+    counts = {}
+    if cache is not None:
+        with metrics.stage('cache_lookup'):
+            counts = {search_type: count for (_, search_type), count
+                      in cache.get_many([(keyword, t) for t in SEARCH_TYPES]).items()}
+        metrics.incr('cache_hits', len(counts))
+        plan_record(metrics, 'cache', len(counts))
+    missing = [search_type for search_type in SEARCH_TYPES if search_type not in counts]
+    threshold = allintitle_min()
+
+    if missing and backend is None:
+        backend = BrowserBackend(pool, limiter)
+    for search_type in missing:
+        # allintitle hits are a subset of intitle ones: a (near) zero intitle settles it
+        if search_type == 'allintitle' and skip_allintitle(counts.get('intitle'), threshold):
+            counts[search_type] = pruned_count(counts['intitle'])
+            plan_record(metrics, 'pruned')
+            continue
+        # Paced by the host-wide limiter; waits for #result-stats instead of sleeping
+        plan_record(metrics, 'navigation')
+        with breaker_guard(), metrics.stage('query', search_type=search_type):
+            counts[search_type] = backend.count(keyword, search_type)
+        if cache is not None:
+            with metrics.stage('cache_store'):
+                cache.put(keyword, search_type, counts[search_type])
 
-        # Get current batch group status
+    result = {
+        'keyword': keyword, 
+        'intitle': counts['intitle'], 
+        'allintitle': counts['allintitle']
+    }
+    if result['allintitle'] is None:
+        result['allintitle_max'] = counts['intitle']  # skipped: only the intitle upper bound is known
+    return result
+
+def upload_results_to_r2(batch_id, results, result_format=None, columnar=False):
+    # Streamed straight from memory to R2 through the shared client, no results.json on disk
+    upload_results(batch_id, results, result_format)
+    if columnar:
         try:
-            response = s3.get_object(
-                Bucket=bucket_name,
-                Key=f'batch-groups/{batch_group_id}.json'
-            )
-            batch_group = json.loads(response['Body'].read().decode('utf-8'))
-        except s3.exceptions.NoSuchKey:
-            print(f"Warning: Batch group {batch_group_id} not found")
-            return
-
-        # Update completed batches count
-        batch_group['completedBatches'] += 1
-        if error:
-            batch_group['hasErrors'] = True
-
-        # Save updated status
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=f'batch-groups/{batch_group_id}.json',
-            Body=json.dumps(batch_group)
-        )
-        
-        print(f"Updated batch group status: {batch_group_id}")
+            upload_results(batch_id, results, 'parquet')
+        except Exception as e:
+            print(f"Error uploading columnar results: {str(e)}")
+
+def update_batch_group_status(batch_group_id, batch_id, error=False, keywords=None, reporter=None):
+    """Write the batch's marker and refresh the group rollup; False if the marker was not written.
+
+    The rollup is derived from all markers, so a failed refresh is caught up
+    by the next batch's and does not fail the batch. ``reporter`` is finished
+    first, so the batch's ``batch_done`` precedes the ``group_done`` published
+    once the rollup counts every batch.
+    """
+    metrics = get_metrics()
+    if reporter is not None:
+        reporter.finish(keywords, error)
+    try:
+        # Own marker first, then publish a rollup derived from all markers
+        with metrics.stage('status_marker'):
+            mark_batch_complete(batch_group_id, batch_id, error=error, keywords=keywords)
+    except Exception as e:
+        print(f"Error updating batch group status: {str(e)}")
+        return False
+    try:
+        with metrics.stage('status_rollup'):
+            rollup = refresh_rollup(batch_group_id)
+        if rollup is not None:
+            print(f"Updated batch group status: {batch_group_id}")
+            total = rollup.get('totalBatches')
+            if total is not None and rollup.get('completedBatches', 0) >= total:
+                finish_group(batch_group_id, total, rollup.get('hasErrors'))
     except Exception as e:
         print(f"Error updating batch group status: {str(e)}")
+    return True
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python script.py <keywords> <batch_id> <batch_group_id>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(usage="python script.py <keywords> <batch_id> <batch_group_id> [options]")
+    parser.add_argument('keywords')
+    parser.add_argument('batch_id')
+    parser.add_argument('batch_group_id')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='split keywords across N processes, each with its own browser')
+    parser.add_argument('--backend', choices=BACKENDS,
+                        help="how pages are fetched: 'browser' (default, FETCH_BACKEND), 'http', "
+                             "or 'auto' (HTTP with browser fallback)")
+    parser.add_argument('--format', dest='result_format', choices=RESULT_FORMATS,
+                        help="format of results/<batch_id>.*: 'json' (default, RESULTS_FORMAT), "
+                             "'ndjson.gz' or 'parquet'")
+    parser.add_argument('--columnar', action='store_true',
+                        help='also upload a Parquet copy of the results (needs pyarrow)')
+    parser.add_argument('--local', metavar='DIR',
+                        help='write results to DIR/<batch_id>.* and skip R2 and the batch-group status')
+    parser.add_argument('--resume', metavar='ID',
+                        help='skip keywords already completed in the checkpoint of batch ID')
+    parser.add_argument('--group-dedupe', action='store_true',
+                        help="search each keyword once per batch group: keywords another batch "
+                             "claimed in the group's R2 index reuse its counts")
+    parser.add_argument('--allintitle-min', type=int,
+                        help='skip allintitle when intitle is below this (PLANNER_ALLINTITLE_MIN, default 1: '
+                             'only zero; 0 never skips)')
+    parser.add_argument('--lean', action='store_true',
+                        help='drop images, fonts, CSS and trackers and stop loading once the count '
+                             'is shown (LEAN_LOAD)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print a per-stage timing breakdown when the batch ends')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve Prometheus metrics on this port (METRICS_PORT)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='append a JSON line per timed stage to PATH (METRICS_TRACE)')
+    args = parser.parse_args()
+    if args.lean:
+        os.environ['LEAN_LOAD'] = '1'  # inherited by shard processes
+    if args.allintitle_min is not None:
+        os.environ['PLANNER_ALLINTITLE_MIN'] = str(args.allintitle_min)
+    configure(args.metrics_port, args.trace)
 
-    main(sys.argv[1], sys.argv[2], sys.argv[3])
+    main(args.keywords, args.batch_id, args.batch_group_id, workers=args.workers, resume=args.resume,
+         backend=args.backend, result_format=args.result_format, columnar=args.columnar,
+         local=args.local, profile=args.profile, group_dedupe=args.group_dedupe)
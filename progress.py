@@ -0,0 +1,189 @@
+"""Batch-group progress tracking without read-modify-write races.
+
+Every finished batch writes its own marker object,
+``batch-groups/<group>/batches/<batch>.json``, so concurrent batches never
+touch the same key and a re-run batch is counted once. The group object
+``batch-groups/<group>.json`` that the front end polls is a rollup derived
+from the markers: it is rewritten with an ETag-conditional PUT and only
+ever moves forward, so a slow writer holding an older view cannot roll the
+count back. That needs a botocore with conditional writes (IfMatch on
+put_object); with an older one the rollup is not published at all and
+readers fall back to ``aggregate``.
+
+With group dedupe, ``batch-groups/<group>/keywords/<digest>.json`` records
+which batch of the group claimed a keyword and, once it has searched it,
+the counts it found (``claim_keyword`` / ``record_keyword``).
+"""
+import json
+import hashlib
+import time
+import random
+from datetime import datetime
+from storage import get_r2_client
+
+MAX_ROLLUP_ATTEMPTS = 8
+# A lost conditional-write race: S3's 412, or R2's 409 for concurrent writes
+CONFLICT_CODES = ('PreconditionFailed', '412', 'ConditionalRequestConflict', '409')
+
+
+def _group_key(batch_group_id):
+    return f'batch-groups/{batch_group_id}.json'
+
+
+def _marker_prefix(batch_group_id):
+    return f'batch-groups/{batch_group_id}/batches/'
+
+
+def _error_prefix(batch_group_id):
+    return f'batch-groups/{batch_group_id}/errors/'
+
+
+def _keyword_key(batch_group_id, keyword):
+    digest = hashlib.sha1(keyword.encode('utf-8')).hexdigest()
+    return f'batch-groups/{batch_group_id}/keywords/{digest}.json'
+
+
+def _is_status(error, *codes):
+    response = getattr(error, 'response', None) or {}
+    return (response.get('Error', {}).get('Code') in codes or
+            str(response.get('ResponseMetadata', {}).get('HTTPStatusCode')) in codes)
+
+
+def mark_batch_complete(batch_group_id, batch_id, error=False, keywords=None, s3=None, bucket_name=None):
+    """Write this batch's completion marker (idempotent per batch id)."""
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    marker = {
+        'batchId': batch_id,
+        'hasErrors': bool(error),
+        'completedAt': datetime.utcnow().isoformat(),
+    }
+    if keywords is not None:
+        marker['keywords'] = keywords
+    # The error flag also gets its own key so aggregation needs listings only
+    error_key = _error_prefix(batch_group_id) + batch_id
+    if error:
+        s3.put_object(Bucket=bucket_name, Key=error_key, Body=b'')
+    else:
+        s3.delete_object(Bucket=bucket_name, Key=error_key)  # a clean re-run clears it
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=_marker_prefix(batch_group_id) + f'{batch_id}.json',
+        Body=json.dumps(marker),
+        ContentType='application/json',
+    )
+
+
+def _count_keys(s3, bucket_name, prefix):
+    count = 0
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        count += page.get('KeyCount', len(page.get('Contents', [])))
+    return count
+
+
+def aggregate(batch_group_id, s3=None, bucket_name=None):
+    """Group status from key listings alone: (completed_batches, has_errors).
+
+    One LIST call covers up to 1000 batches; no marker bodies are read.
+    """
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    completed = _count_keys(s3, bucket_name, _marker_prefix(batch_group_id))
+    has_errors = _count_keys(s3, bucket_name, _error_prefix(batch_group_id)) > 0
+    return completed, has_errors
+
+
+def refresh_rollup(batch_group_id, s3=None, bucket_name=None):
+    """Recompute the group object from the markers; returns the rollup or None."""
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    for attempt in range(MAX_ROLLUP_ATTEMPTS):
+        try:
+            response = s3.get_object(Bucket=bucket_name, Key=_group_key(batch_group_id))
+        except s3.exceptions.NoSuchKey:
+            print(f"Warning: Batch group {batch_group_id} not found")
+            return None
+        etag = response['ETag']
+        batch_group = json.loads(response['Body'].read().decode('utf-8'))
+
+        completed, has_errors = aggregate(batch_group_id, s3, bucket_name)
+        if completed <= batch_group.get('completedBatches', 0) and \
+                (not has_errors or batch_group.get('hasErrors')):
+            return batch_group  # someone already published an equal or newer view
+
+        batch_group['completedBatches'] = max(completed, batch_group.get('completedBatches', 0))
+        batch_group['hasErrors'] = bool(batch_group.get('hasErrors')) or has_errors
+        try:
+            _put_if_match(s3, bucket_name, _group_key(batch_group_id), batch_group, etag)
+            return batch_group
+        except Exception as e:
+            # R2 answers a conditional write racing another one with 409 instead of 412
+            if not _is_status(e, *CONFLICT_CODES):
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))  # lost the race; re-read and retry
+    raise RuntimeError(f"Could not update batch group {batch_group_id} after {MAX_ROLLUP_ATTEMPTS} attempts")
+
+
+def _put_if_match(s3, bucket_name, key, body, etag):
+    try:
+        s3.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(body), ContentType='application/json',
+                      IfMatch=etag)
+    except Exception as e:
+        # Never fall back to an unconditional write: that is the lost update
+        # this module exists to prevent. aggregate() still reads the markers.
+        if type(e).__name__ != 'ParamValidationError':
+            raise
+        raise RuntimeError("Conditional PUT (IfMatch) is not supported by this botocore; "
+                           "upgrade boto3/botocore to publish batch-group progress") from e
+
+
+def claim_keyword(batch_group_id, batch_id, keyword, s3=None, bucket_name=None):
+    """Claim ``keyword`` for ``batch_id`` unless another batch of the group has; returns the entry on record.
+
+    One conditional PUT; a GET only when the keyword was already claimed.
+    The entry is None if a racing claim has not landed yet.
+    """
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    entry = {'keyword': keyword, 'batchId': batch_id}
+    try:
+        s3.put_object(Bucket=bucket_name, Key=_keyword_key(batch_group_id, keyword), Body=json.dumps(entry),
+                      ContentType='application/json', IfNoneMatch='*')
+        return entry
+    except Exception as e:
+        if not _is_status(e, *CONFLICT_CODES):
+            raise
+    return read_keyword(batch_group_id, keyword, s3, bucket_name)
+
+
+def record_keyword(batch_group_id, batch_id, result, s3=None, bucket_name=None):
+    """Store the counts ``batch_id`` found for a keyword it claimed."""
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    entry = {'keyword': result['keyword'], 'batchId': batch_id,
+             'intitle': result['intitle'], 'allintitle': result['allintitle']}
+    s3.put_object(Bucket=bucket_name, Key=_keyword_key(batch_group_id, result['keyword']),
+                  Body=json.dumps(entry), ContentType='application/json')
+
+
+def read_keyword(batch_group_id, keyword, s3=None, bucket_name=None):
+    """The group's index entry for ``keyword``, or None if no batch claimed it."""
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=_keyword_key(batch_group_id, keyword))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+
+def read_status(batch_group_id, s3=None, bucket_name=None):
+    """The published rollup (one small GET), or None if the group is unknown."""
+    if s3 is None:
+        s3, bucket_name = get_r2_client()
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=_group_key(batch_group_id))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read().decode('utf-8'))
@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+import threading
+
+DEFAULT_STATE_PATH = os.path.join('.cache', 'rate_limit.sqlite3')
+DEFAULT_RATE = 0.5          # queries per second to start from
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_MAX_RATE = 5.0
+DEFAULT_BURST = 2.0
+DEFAULT_INCREASE = 0.05     # qps added per successful query
+DEFAULT_DECREASE = 0.5      # rate multiplier on a block or slow response
+DEFAULT_SLOW_SECONDS = 8.0
+DEFAULT_COOLDOWN = 5.0      # seconds between two multiplicative decreases
+
+
+class RateLimiter:
+    """Host-wide token bucket whose rate adapts AIMD-style to feedback.
+
+    Bucket state lives in a small SQLite file, so every thread and process
+    on the host that opens the same path draws from the same bucket. Call
+    ``acquire()`` before each navigation and ``report()`` after it: each
+    success raises the rate by ``increase`` qps, while a block or a response
+    slower than ``slow_seconds`` multiplies it by ``decrease`` (at most once
+    per ``cooldown`` seconds, so one burst of failures counts once).
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH, name='google', rate=DEFAULT_RATE,
+                 min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE, burst=DEFAULT_BURST,
+                 increase=DEFAULT_INCREASE, decrease=DEFAULT_DECREASE,
+                 slow_seconds=DEFAULT_SLOW_SECONDS, cooldown=DEFAULT_COOLDOWN):
+        self.path = path
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                rate REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                decreased_at REAL NOT NULL DEFAULT 0
+            )''')
+        self._conn.execute(
+            'INSERT OR IGNORE INTO buckets (name, rate, tokens, updated_at) VALUES (?, ?, ?, ?)',
+            (name, min(max(rate, min_rate), max_rate), 1.0, time.time()))
+
+    def _transaction(self, update):
+        # BEGIN IMMEDIATE takes the write lock up front, serialising processes
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rate, tokens, updated_at, decreased_at = self._conn.execute(
+                    'SELECT rate, tokens, updated_at, decreased_at FROM buckets WHERE name = ?',
+                    (self.name,)).fetchone()
+                now = time.time()
+                tokens = min(self.burst, tokens + max(0.0, now - updated_at) * rate)
+                rate, tokens, decreased_at, result = update(now, rate, tokens, decreased_at)
+                self._conn.execute(
+                    'UPDATE buckets SET rate = ?, tokens = ?, updated_at = ?, decreased_at = ? WHERE name = ?',
+                    (rate, tokens, now, decreased_at, self.name))
+                self._conn.execute('COMMIT')
+                return result
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds to wait."""
+        def update(now, rate, tokens, decreased_at):
+            if tokens >= 1.0:
+                return rate, tokens - 1.0, decreased_at, 0.0
+            return rate, tokens, decreased_at, (1.0 - tokens) / rate
+        return self._transaction(update)
+
+    def acquire(self, timeout=None):
+        """Block until a token is available; returns seconds spent waiting."""
+        started = time.monotonic()
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return time.monotonic() - started
+            if timeout is not None and time.monotonic() - started + wait > timeout:
+                raise TimeoutError("Rate limiter did not grant a slot in time")
+            time.sleep(wait)
+
+    def report(self, blocked=False, elapsed=None):
+        """Feed back the outcome of one query; returns the new rate."""
+        congested = blocked or (elapsed is not None and elapsed > self.slow_seconds)
+
+        def update(now, rate, tokens, decreased_at):
+            if congested:
+                if now - decreased_at >= self.cooldown:
+                    rate = max(self.min_rate, rate * self.decrease)
+                    decreased_at = now
+                    tokens = min(tokens, 0.0)  # pause everyone briefly
+            else:
+                rate = min(self.max_rate, rate + self.increase)
+            return rate, tokens, decreased_at, rate
+        return self._transaction(update)
+
+    def pause(self, seconds):
+        """Hold every caller on the host for ``seconds``, then restart from the minimum rate."""
+        def update(now, rate, tokens, decreased_at):
+            # The next token appears after ``seconds`` at min_rate
+            return self.min_rate, min(tokens, 1.0 - seconds * self.min_rate), now, None
+        self._transaction(update)
+
+    @property
+    def rate(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT rate FROM buckets WHERE name = ?', (self.name,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_limiter():
+    """Limiter configured from RATE_LIMIT_* env vars, or None if RATE_LIMIT=off."""
+    if os.getenv('RATE_LIMIT', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    return RateLimiter(
+        path=os.getenv('RATE_LIMIT_PATH', DEFAULT_STATE_PATH),
+        rate=float(os.getenv('RATE_LIMIT_QPS', DEFAULT_RATE)),
+        min_rate=float(os.getenv('RATE_LIMIT_MIN_QPS', DEFAULT_MIN_RATE)),
+        max_rate=float(os.getenv('RATE_LIMIT_MAX_QPS', DEFAULT_MAX_RATE)),
+    )
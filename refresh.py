@@ -0,0 +1,151 @@
+"""Staleness-aware refresh planning for recurring keyword portfolios.
+
+Re-checking a portfolio on a schedule used to re-query every keyword, whether
+its counts move every day or have sat at 0 for months. ``plan`` reads the
+history store instead and, per keyword:
+
+  volatility  how fast its counts drift: mean |change of log(1 + count)| per
+              day over its last runs, the most volatile operator counting,
+              shrunk towards DEFAULT_VOLATILITY while there are few runs
+  interval    days until the expected drift reaches ``tolerance`` (0.05 is
+              about 5%), clamped to [min_days, max_days]
+  priority    age of the stalest operator / interval; due at 1 or more,
+              never-crawled keywords first
+
+Due keywords are emitted most overdue first while the per-run query budget
+lasts (2 queries per keyword, 1 when the planner will skip allintitle
+after a near-zero intitle); a keyword that no longer fits is skipped and
+cheaper ones further down still use up the rest. The list is one keyword per line, ready for the
+existing entry points:
+
+    python history_store.py compact
+    python refresh.py plan portfolio.csv --budget 400 --output due.txt
+    python main.py <run_id> "" due.txt
+    python process_keywords.py - <batch_id> <batch_group_id> < due.txt
+"""
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from keyword_source import iter_keywords
+from history_store import DEFAULT_HISTORY_DIR, HistoryStore
+from planner import allintitle_min, skip_allintitle
+
+DEFAULT_TOLERANCE = 0.05
+DEFAULT_VOLATILITY = 0.05  # per day, assumed for keywords with little history
+DEFAULT_MIN_DAYS = 1.0
+DEFAULT_MAX_DAYS = 90.0
+RECENT_RUNS = 10  # changes per operator used for the volatility estimate
+PRIOR_WEIGHT = 1.0  # how many observed changes the prior is worth
+REPORT_COLUMNS = ['keyword', 'runs', 'volatility', 'interval_days', 'age_days', 'priority', 'cost', 'planned']
+
+
+def volatility(history, prior=DEFAULT_VOLATILITY):
+    """History rows -> DataFrame[keyword, runs, volatility, last_fetched_at, intitle]."""
+    rows = history.sort_values(['keyword', 'search_type', 'fetched_at'], kind='stable')
+    rows = rows.assign(level=np.log1p(rows['count'].astype(float)),
+                       fetched_at=pd.to_datetime(rows['fetched_at'], utc=True))
+    groups = rows.groupby(['keyword', 'search_type'], sort=False)
+    days = groups['fetched_at'].diff().dt.total_seconds() / 86400
+    rows = rows.assign(rate=groups['level'].diff().abs() / days.where(days > 0))
+
+    rates = rows.dropna(subset=['rate']).groupby(['keyword', 'search_type']).tail(RECENT_RUNS)
+    per_type = rates.groupby(['keyword', 'search_type'])['rate'].agg(['sum', 'count'])
+    # Shrink towards the prior: one change observed says little about the next
+    per_type['volatility'] = (per_type['sum'] + PRIOR_WEIGHT * prior) / (per_type['count'] + PRIOR_WEIGHT)
+
+    by_keyword = rows.groupby('keyword').agg(runs=('run_id', 'nunique'))
+    # Both operators must be fresh: the stalest one sets the age
+    by_keyword['last_fetched_at'] = groups['fetched_at'].max().groupby('keyword').min()
+    by_keyword['volatility'] = per_type['volatility'].groupby('keyword').max()
+    by_keyword['volatility'] = by_keyword['volatility'].fillna(prior)
+    latest = rows.drop_duplicates(['keyword', 'search_type'], keep='last')
+    by_keyword['intitle'] = latest[latest['search_type'] == 'intitle'].set_index('keyword')['count']
+    return by_keyword.reset_index()
+
+
+def plan(keywords, store, budget, now=None, tolerance=DEFAULT_TOLERANCE, min_days=DEFAULT_MIN_DAYS,
+         max_days=DEFAULT_MAX_DAYS, fill=False, prior=DEFAULT_VOLATILITY):
+    """Score the portfolio and pick keywords within ``budget`` queries; returns the report frame."""
+    keywords = list(dict.fromkeys(keywords))
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    history = store.join(keywords, table='all') if keywords else None
+    frame = pd.DataFrame({'keyword': keywords})
+    if history is not None and len(history):
+        frame = frame.merge(volatility(history, prior), on='keyword', how='left')
+    else:
+        frame = frame.assign(runs=np.nan, last_fetched_at=pd.NaT, volatility=np.nan, intitle=np.nan)
+
+    frame['runs'] = frame['runs'].fillna(0).astype(int)
+    frame['interval_days'] = (tolerance / frame['volatility'].clip(lower=1e-9)).clip(min_days, max_days)
+    frame['age_days'] = (now - pd.to_datetime(frame['last_fetched_at'], utc=True)).dt.total_seconds() / 86400
+    frame['priority'] = (frame['age_days'] / frame['interval_days']).fillna(np.inf)  # never crawled: inf
+    threshold = allintitle_min()
+    frame['cost'] = [1 if skip_allintitle(None if pd.isna(count) else count, threshold) else 2
+                     for count in frame['intitle']]
+
+    # Most overdue first; ties (never crawled) keep portfolio order
+    frame = frame.sort_values('priority', ascending=False, kind='stable').reset_index(drop=True)
+    eligible = frame['priority'] >= 1.0 if not fill else pd.Series(True, index=frame.index)
+    planned, left = [], budget
+    for is_eligible, cost in zip(eligible, frame['cost']):
+        # Greedy: skip what no longer fits rather than stopping at it
+        take = bool(is_eligible) and cost <= left
+        left -= cost if take else 0
+        planned.append(take)
+    frame['planned'] = planned
+    return frame
+
+
+def summary(frame, budget):
+    planned = frame[frame['planned']]
+    due = int((frame['priority'] >= 1.0).sum())
+    never = int(np.isinf(frame['priority']).sum())
+    full = 2 * len(frame)
+    queries = int(planned['cost'].sum())
+    share = queries / full * 100 if full else 0.0
+    return (f"Refresh plan: {len(planned)} of {len(frame)} keyword(s), {queries} of {budget} budgeted queries "
+            f"({share:.0f}% of a full re-check); {due} due ({never} never crawled), "
+            f"{due - int((planned['priority'] >= 1.0).sum())} due but over budget")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan which portfolio keywords to re-check this run')
+    parser.add_argument('--dir', default=DEFAULT_HISTORY_DIR, help='history store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan', help='prioritized keyword list within a query budget')
+    plan_parser.add_argument('portfolio', help="keyword CSV/text file, or '-' for stdin")
+    plan_parser.add_argument('--budget', type=int, required=True, help='queries this run may spend')
+    plan_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                             help='acceptable drift in log(1 + count) before a re-check (0.05 ~ 5%%)')
+    plan_parser.add_argument('--min-days', type=float, default=DEFAULT_MIN_DAYS)
+    plan_parser.add_argument('--max-days', type=float, default=DEFAULT_MAX_DAYS)
+    plan_parser.add_argument('--fill', action='store_true',
+                             help='spend leftover budget on the stalest keywords that are not yet due')
+    plan_parser.add_argument('--now', help='plan as of this ISO timestamp (default: now)')
+    plan_parser.add_argument('--output', help='keyword list, one per line (default: stdout)')
+    plan_parser.add_argument('--report', help='also write the per-keyword scores to this CSV')
+    args = parser.parse_args()
+
+    store = HistoryStore(args.dir)
+    now = None
+    if args.now:
+        now = pd.Timestamp(args.now)
+        now = now.tz_localize('UTC') if now.tzinfo is None else now.tz_convert('UTC')
+    frame = plan(iter_keywords(args.portfolio), store, args.budget, now=now, tolerance=args.tolerance,
+                 min_days=args.min_days, max_days=args.max_days, fill=args.fill)
+    planned = frame.loc[frame['planned'], 'keyword']
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.writelines(f'{keyword}\n' for keyword in planned)
+    else:
+        sys.stdout.writelines(f'{keyword}\n' for keyword in planned)
+    if args.report:
+        frame[REPORT_COLUMNS].to_csv(args.report, index=False)
+    print(summary(frame, args.budget), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
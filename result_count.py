@@ -0,0 +1,131 @@
+"""Result-count extraction for Google SERPs in the locales the site serves.
+
+Counts are read straight from raw HTML (bytes or str): the ``#result-stats``
+node is located with one byte search that stops at it, only that fragment
+is decoded, and a precompiled per-locale pattern pulls out the number. Pages without the node
+are checked for Google's "no results" message so that a genuine zero is
+told apart from a page that simply failed to load.
+"""
+import re
+import html
+
+LOCALES = ('en', 'de', 'zh', 'fr', 'es', 'ja')
+
+# Digits grouped by ',' '.' apostrophes, or (thin/no-break) spaces
+_NUMBER = r"(\d{1,3}(?:[,.'\u2019\u00a0\u2009\u202f ]\d{3})+|\d+)"
+
+# Words that follow the number, per locale
+_RESULT_WORDS = {
+    'en': r'\s+results?\b',
+    'de': r'\s+Ergebnis(?:se)?\b',
+    'zh': r'\s*(?:条|條|項|项|个|個)?\s*(?:结果|結果)',
+    'fr': r'\s+résultats?\b',
+    'es': r'\s+resultados?\b',
+    'ja': r'\s*件',
+}
+_COUNT_PATTERNS = {locale: re.compile(_NUMBER + words, re.I) for locale, words in _RESULT_WORDS.items()}
+# One pass over the text for all locales at once
+_ANY_COUNT = re.compile(_NUMBER + '(?:' + '|'.join(_RESULT_WORDS.values()) + ')', re.I)
+
+_NO_RESULTS_PHRASES = {
+    'en': ('did not match any documents', 'No results found for'),
+    'de': ('ergab keine Treffer', 'Keine Ergebnisse'),
+    'zh': ('找不到和您查询的', '找不到符合搜尋字詞', '沒有任何文件符合'),
+    'fr': ('ne correspond à aucun document',),
+    'es': ('no obtuvo ningún resultado', 'no ha obtenido ningún resultado'),
+    'ja': ('に一致する情報は見つかりませんでした',),
+}
+_NO_RESULTS = {locale: tuple(phrase.encode('utf-8') for phrase in phrases)
+               for locale, phrases in _NO_RESULTS_PHRASES.items()}
+_NO_RESULTS_TEXT = re.compile('|'.join(re.escape(phrase) for phrases in _NO_RESULTS_PHRASES.values()
+                                       for phrase in phrases), re.I)
+
+_CONSENT_MARKERS = (b'action="https://consent.google', b'consent.google.com/save')
+_CAPTCHA_MARKERS = (b'id="captcha-form"', b'unusual traffic')
+
+_STATS_ANCHOR = b'result-stats'
+_STATS_ID_PREFIXES = (b'id="', b"id='", b'id=')
+_LANG_ATTR = re.compile(rb'<html[^>]*\blang="?([a-zA-Z]{2})', re.I)
+_TAG = re.compile(r'<[^>]+>')
+_NON_DIGIT = re.compile(r'\D')
+
+
+def _as_bytes(data):
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def detect_locale(data):
+    """Locale from the page's ``<html lang>`` attribute, or None if unsupported."""
+    match = _LANG_ATTR.search(_as_bytes(data)[:4096])
+    if match:
+        locale = match.group(1).decode('ascii').lower()
+        if locale in _COUNT_PATTERNS:
+            return locale
+    return None
+
+
+def extract_count(text, locale=None):
+    """Number in a result-stats text such as "About 1,230 results" or
+    "Ungefähr 4.720.000 Ergebnisse"; 0 for Google's "did not match any
+    documents" message; None when no count is present.
+
+    The locale's pattern is tried first, then all supported locales.
+    """
+    if not text:
+        return None
+    match = None
+    if locale in _COUNT_PATTERNS:
+        match = _COUNT_PATTERNS[locale].search(text)
+    if match is None:
+        match = _ANY_COUNT.search(text)
+    if match is None:
+        return 0 if _NO_RESULTS_TEXT.search(text) else None
+    return int(_NON_DIGIT.sub('', match.group(1)))
+
+
+def stats_text(data):
+    """Decoded text of the ``#result-stats`` node in raw HTML, or None."""
+    data = _as_bytes(data)
+    # One substring search for the bare anchor, stopping at the node, rather than
+    # a regex (or one search per quoting of the id) over the whole page
+    position = data.find(_STATS_ANCHOR)
+    while position >= 0 and not any(data.endswith(prefix, 0, position) for prefix in _STATS_ID_PREFIXES):
+        position = data.find(_STATS_ANCHOR, position + len(_STATS_ANCHOR))  # e.g. a #result-stats CSS rule
+    if position < 0:
+        return None
+    start = data.find(b'>', position) + 1
+    end = data.find(b'</div>', start)
+    if start <= 0 or end < 0:
+        return None
+    fragment = data[start:end].decode('utf-8', 'replace')
+    return html.unescape(_TAG.sub(' ', fragment))
+
+
+def is_no_results(data, locale=None):
+    """True when the page is Google's "did not match any documents" page."""
+    data = _as_bytes(data)
+    locale = locale or detect_locale(data)
+    locales = [locale] if locale in _NO_RESULTS else list(_NO_RESULTS)
+    return any(data.find(phrase) >= 0 for name in locales for phrase in _NO_RESULTS[name])
+
+
+def is_consent_page(data):
+    """True for Google's cookie-consent interstitial."""
+    data = _as_bytes(data)
+    return any(data.find(marker) >= 0 for marker in _CONSENT_MARKERS)
+
+
+def is_captcha_page(data):
+    """True for the CAPTCHA / "unusual traffic" block page."""
+    data = _as_bytes(data)
+    return any(data.find(marker) >= 0 for marker in _CAPTCHA_MARKERS)
+
+
+def count_from_html(data, locale=None):
+    """Result count from a raw SERP page; 0 for a no-results page, None if unreadable."""
+    data = _as_bytes(data)
+    locale = locale or detect_locale(data)
+    text = stats_text(data)
+    if text is None:
+        return 0 if is_no_results(data, locale) else None
+    return extract_count(text, locale)
@@ -0,0 +1,30 @@
+import csv
+
+# Header spellings used by the different crawlers' CSV output
+KEYWORD_COLUMNS = ('keyword', 'Keyword')
+TYPE_COLUMNS = ('search_type', 'searchType', 'Search Type')
+COUNT_COLUMNS = ('count', 'Count')
+
+
+def _first(record, columns):
+    for column in columns:
+        if record.get(column) is not None:
+            return record[column]
+    return None
+
+
+def read_result_csv(path):
+    """Yield (keyword, search_type, count) from a crawler results CSV.
+
+    Accepts the headers written by main.py, main-pl.py and the committed
+    ``Keyword,Search Type,Count`` files; rows without a numeric count are
+    skipped.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        for record in csv.DictReader(file):
+            keyword = _first(record, KEYWORD_COLUMNS)
+            search_type = _first(record, TYPE_COLUMNS)
+            count = _first(record, COUNT_COLUMNS)
+            if not keyword or not search_type or not count or not count.strip().isdigit():
+                continue
+            yield keyword, search_type.strip(), int(count)
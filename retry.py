@@ -0,0 +1,318 @@
+"""Retry scheduling for failed queries: classify, back off, and stop while Google is blocking.
+
+Every failed query gets a reason:
+  timeout       no answer within the per-query timeout
+  no_stats      the page loaded without #result-stats
+  consent       Google's consent wall instead of results
+  captcha       CAPTCHA / "unusual traffic" page
+  rate_limited  HTTP 429
+  parse_error   #result-stats we could not read (not retried: it would read the same)
+  error         anything else (network errors, a crashed tab)
+
+``RetryScheduler`` is the job source of a crawl: failed jobs come back after
+an exponential backoff with jitter and are handed out ahead of fresh work
+once due, instead of waiting for a tail pass. ``CircuitBreaker`` watches the
+share of recent queries that were blocked; above the threshold it holds every
+query of the process (and, through the shared rate limiter, of the host) for
+a cooldown, then lets them back in one at a time.
+
+Settings: RETRY_MAX_ATTEMPTS (3), RETRY_BASE_DELAY (2s), RETRY_MAX_DELAY (60s),
+BREAKER=off, BREAKER_THRESHOLD (0.5), BREAKER_WINDOW (20), BREAKER_COOLDOWN (30s).
+"""
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextlib
+from collections import deque
+from metrics import get_metrics
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_WINDOW = 20
+DEFAULT_COOLDOWN = 30.0
+DEFAULT_MAX_COOLDOWN = 600.0
+
+RETRYABLE = frozenset(('timeout', 'no_stats', 'consent', 'captcha', 'rate_limited', 'error'))
+BLOCK_REASONS = frozenset(('captcha', 'rate_limited'))
+
+_DONE = object()
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def failure_reason(error):
+    """Reason code (see module docstring) for the exception a query raised."""
+    reason = getattr(error, 'reason', None)
+    if isinstance(reason, str):
+        return reason
+    name = type(error).__name__
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, asyncio.CancelledError)) or 'Timeout' in name:
+        return 'timeout'
+    if isinstance(error, ValueError):
+        return 'parse_error'
+    return 'error'
+
+
+class RetryPolicy:
+    """Which failures are retried, how often, and how long to wait before each retry."""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, reason, attempts):
+        """``attempts`` is the number of tries made so far, the failed one included."""
+        return reason in RETRYABLE and attempts < self.max_attempts
+
+    def delay(self, attempts, reason=None):
+        # Blocks start further up the curve; jitter keeps retries from arriving in lockstep
+        exponent = attempts - 1 + (2 if reason in BLOCK_REASONS else 0)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** exponent)
+        return random.uniform(ceiling / 2, ceiling)
+
+
+def get_retry_policy():
+    return RetryPolicy(
+        max_attempts=int(os.getenv('RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)),
+        base_delay=float(os.getenv('RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)),
+        max_delay=float(os.getenv('RETRY_MAX_DELAY', DEFAULT_MAX_DELAY)),
+    )
+
+
+class RetryScheduler:
+    """Job source that mixes due retries into a stream of fresh jobs.
+
+    Iterate it (``for`` or ``async for``) in place of the jobs and call
+    ``settle(job, reason)`` once per outcome; iteration ends when the fresh
+    jobs are exhausted and every job has either succeeded or failed for good.
+    Jobs must be hashable and unique.
+    """
+
+    def __init__(self, jobs, policy=None):
+        self.policy = policy or get_retry_policy()
+        self.attempts = {}  # job -> tries made so far
+        self.retried = 0
+        self._fresh = iter(jobs)
+        self._due = []  # (due, seq, job)
+        self._seq = itertools.count()
+        self._outstanding = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._async_wake = None
+
+    def settle(self, job, reason=None):
+        """Record a job's outcome; True if it was rescheduled, False if it is final."""
+        with self._lock:
+            self._outstanding -= 1
+            attempts = self.attempts[job] = self.attempts.get(job, 0) + 1
+            retry = reason is not None and self.policy.should_retry(reason, attempts)
+            if retry:
+                due = time.monotonic() + self.policy.delay(attempts, reason)
+                heapq.heappush(self._due, (due, next(self._seq), job))
+                self.retried += 1
+        if retry:
+            get_metrics().incr('retries')
+        self._wake.set()
+        if self._async_wake is not None:
+            self._async_wake.set()
+        return retry
+
+    def _next(self):
+        """(job, None) to run now, (None, seconds) to wait (None: until a settle), or (_DONE, None)."""
+        with self._lock:
+            if self._due and self._due[0][0] <= time.monotonic():
+                self._outstanding += 1
+                return heapq.heappop(self._due)[2], None
+        if self._fresh is not None:
+            job = next(self._fresh, _DONE)
+            if job is not _DONE:
+                with self._lock:
+                    self._outstanding += 1
+                return job, None
+            self._fresh = None
+        with self._lock:
+            if self._due:
+                return None, max(0.0, self._due[0][0] - time.monotonic())
+            if self._outstanding:
+                return None, None
+            return _DONE, None
+
+    def __iter__(self):
+        while True:
+            self._wake.clear()
+            job, wait = self._next()
+            if job is _DONE:
+                return
+            if job is not None:
+                yield job
+            else:
+                self._wake.wait(wait)
+
+    async def _aiter(self):
+        self._async_wake = asyncio.Event()
+        while True:
+            self._async_wake.clear()
+            job, wait = self._next()
+            if job is _DONE:
+                return
+            if job is not None:
+                yield job
+                continue
+            try:
+                await asyncio.wait_for(self._async_wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def __aiter__(self):
+        return self._aiter()
+
+
+class CircuitBreaker:
+    """Holds all queries when too many recent ones were blocked, then resumes gradually.
+
+    closed     queries run freely; the outcomes of the last ``window`` are kept
+               and when ``threshold`` of them (at least 5) were blocks it opens
+    open       every query waits ``cooldown`` seconds, doubling on each trip
+               that follows a failed recovery; the host's rate limiter is paused
+               as well and restarts from its minimum rate
+    half_open  one query at a time, one more slot per success; after ``ramp``
+               successes it closes, a block sends it back to open
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW, cooldown=DEFAULT_COOLDOWN,
+                 max_cooldown=DEFAULT_MAX_COOLDOWN, min_samples=5, ramp=8):
+        self.threshold = threshold
+        self.min_samples = min(min_samples, window)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.ramp = ramp
+        self.state = 'closed'
+        self.trips = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._open_until = 0.0
+        self._failed_recoveries = 0
+        self._slots = 0
+        self._in_flight = 0
+
+    def try_acquire(self):
+        """Take a query slot if allowed; otherwise return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'open':
+                if now < self._open_until:
+                    return self._open_until - now
+                self.state, self._slots = 'half_open', 1
+                print("Circuit breaker half-open: resuming one query at a time")
+            if self.state == 'half_open' and self._in_flight >= self._slots:
+                return 0.25
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self):
+        from crawl_engine import waiting  # a hold is not part of the query's timeout
+        with waiting():
+            while True:
+                wait = self.try_acquire()
+                if wait <= 0:
+                    return
+                time.sleep(wait)
+
+    async def acquire_async(self):
+        from crawl_engine import waiting
+        with waiting():
+            while True:
+                wait = self.try_acquire()
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def release(self, reason=None):
+        """Give the slot back with the query's failure reason (None on success)."""
+        blocked = reason in BLOCK_REASONS
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if self.state == 'closed':
+                self._recent.append(blocked)
+                if (len(self._recent) >= self.min_samples and
+                        sum(self._recent) >= self.threshold * len(self._recent)):
+                    self._trip(f"{sum(self._recent)} of the last {len(self._recent)} queries blocked")
+            elif self.state == 'half_open':
+                if blocked:
+                    self._failed_recoveries += 1
+                    self._trip("blocked again while resuming")
+                elif reason is None:
+                    self._slots += 1
+                    if self._slots > self.ramp:
+                        self.state, self._failed_recoveries = 'closed', 0
+                        print("Circuit breaker closed: back to full speed")
+            # Outcomes of queries started before an open are ignored
+
+    @contextlib.contextmanager
+    def guard(self):
+        """Run the body as one query slot, classifying whatever it raises."""
+        self.acquire()
+        reason = None
+        try:
+            yield
+        except BaseException as e:
+            reason = failure_reason(e)
+            raise
+        finally:
+            self.release(reason)
+
+    def _trip(self, why):
+        seconds = min(self.max_cooldown, self.cooldown * 2 ** self._failed_recoveries)
+        self.state = 'open'
+        self._open_until = time.monotonic() + seconds
+        self._recent.clear()
+        self.trips += 1
+        get_metrics().incr('breaker_trips')
+        print(f"Circuit breaker open ({why}): pausing all queries for {seconds:.1f}s")
+        from ratelimit import get_limiter
+        limiter = get_limiter()
+        if limiter is not None:
+            try:
+                limiter.pause(seconds)
+            finally:
+                limiter.close()
+
+
+def _reset_after_fork():
+    # A forked shard starts with a closed breaker of its own
+    global _breaker, _breaker_lock
+    _breaker = None
+    _breaker_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_breaker():
+    """Breaker shared by every query of this process, or None if BREAKER=off."""
+    global _breaker
+    if os.getenv('BREAKER', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                threshold=float(os.getenv('BREAKER_THRESHOLD', DEFAULT_THRESHOLD)),
+                window=int(os.getenv('BREAKER_WINDOW', DEFAULT_WINDOW)),
+                cooldown=float(os.getenv('BREAKER_COOLDOWN', DEFAULT_COOLDOWN)),
+            )
+        return _breaker
+
+
+def guard():
+    """``get_breaker().guard()``, or a no-op when the breaker is off."""
+    breaker = get_breaker()
+    return breaker.guard() if breaker is not None else contextlib.nullcontext()
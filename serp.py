@@ -0,0 +1,112 @@
+import os
+import time
+from urllib.parse import quote
+from result_count import extract_count, is_captcha_page, is_consent_page, is_no_results
+from metrics import get_metrics
+from crawl_engine import waiting
+
+SEARCH_TYPES = ('intitle', 'allintitle')
+# Overridable so benchmarks can point the crawlers at a local fake SERP server
+SEARCH_URL = os.getenv('SERP_BASE_URL', 'https://www.google.com/search')
+STATS_TIMEOUT = 10.0  # seconds to wait for #result-stats after navigating
+
+# Lean loads (LEAN_LOAD=1 / --lean): #result-stats is in the server-rendered
+# HTML, so images, fonts, stylesheets, media, Google's JS bundles and
+# beacons/trackers are dropped and loading is stopped once the node is there
+LEAN_BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font', 'stylesheet', 'texttrack', 'manifest',
+                               'websocket', 'eventsource')
+LEAN_BLOCKED_URLS = (
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.svg*', '*.ico*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.css*', '*.mp4*', '*.webm*',
+    '*/xjs/*', '*/og/_/*', '*encrypted-tbn*', '*/gen_204*', '*/client_204*', '*/log?*',
+    '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+)
+# Bytes the page and its sub-resources took over the wire (Resource Timing)
+TRANSFER_SIZE_JS = ("return performance.getEntriesByType('navigation')"
+                    ".concat(performance.getEntriesByType('resource'))"
+                    ".reduce((total, entry) => total + (entry.transferSize || 0), 0);")
+
+
+def lean_load_enabled():
+    return os.getenv('LEAN_LOAD', '').lower() in ('1', 'true', 'on', 'yes')
+
+
+class BlockedError(Exception):
+    """Google answered with a CAPTCHA/"unusual traffic" page (or a 429) instead of results."""
+
+    def __init__(self, message='', reason='captcha'):
+        super().__init__(message)
+        self.reason = reason  # retry.failure_reason code
+
+
+class MissingStatsError(ValueError):
+    """The results page loaded without a #result-stats element (consent wall, odd layout)."""
+
+    def __init__(self, message='', reason='no_stats'):
+        super().__init__(message)
+        self.reason = reason
+
+def build_search_url(keyword, search_type):
+    """Google search URL for an ``intitle``/``allintitle`` exact-phrase query."""
+    return f"{SEARCH_URL}?q={search_type}%3A%22{quote(keyword)}%22"
+
+def is_blocked(tab):
+    url = tab.url or ''
+    if '/sorry/' in url:
+        return True
+    return is_captcha_page(tab.html or '')
+
+def query_count(pool, tab, keyword, search_type, limiter=None, timeout=STATS_TIMEOUT):
+    """Run one query on ``tab`` and return the parsed result count.
+
+    Waits for ``#result-stats`` to appear (up to ``timeout``) instead of a
+    fixed sleep, and paces navigations through ``limiter`` when given,
+    reporting blocks and slow responses back to it.
+    """
+    metrics = get_metrics()
+    if limiter is not None:
+        with waiting(), metrics.stage('rate_limit_wait'):
+            limiter.acquire()
+    started = time.monotonic()
+    with metrics.stage('navigate'):
+        pool.navigate(tab, build_search_url(keyword, search_type))
+    with metrics.stage('wait_stats'):
+        element = tab.ele('#result-stats', timeout=timeout)
+    elapsed = time.monotonic() - started
+    if not element:
+        blocked = is_blocked(tab)
+        if limiter is not None:
+            limiter.report(blocked=blocked, elapsed=elapsed)
+        if blocked:
+            raise BlockedError("Google returned a CAPTCHA / unusual traffic page")
+        html = tab.html or ''
+        if is_no_results(html):
+            return 0
+        if 'consent.google.' in (tab.url or '') or is_consent_page(html):
+            raise MissingStatsError("Google showed its consent page", reason='consent')
+        raise MissingStatsError("No #result-stats on the results page")
+    if limiter is not None:
+        limiter.report(elapsed=elapsed)
+    if getattr(pool, 'lean', False):
+        tab.stop_loading()  # the count is on screen; skip the rest of the page
+    with metrics.stage('parse'):
+        count = extract_count(element.text)
+    try:
+        metrics.incr('bytes_received', int(tab.run_js(TRANSFER_SIZE_JS) or 0))
+    except Exception:
+        pass
+    if count is None:
+        raise ValueError(f"Unrecognised result stats: {element.text!r}")
+    return count
+
+def fetch_count(pool, keyword, search_type, limiter=None, timeout=None):
+    """Run one query on a pooled tab and return the parsed result count.
+
+    ``timeout`` bounds the wait for a tab; None means the pool's checkout_timeout.
+    """
+    with waiting():
+        tab = pool.checkout(timeout)
+    try:
+        return query_count(pool, tab, keyword, search_type, limiter)
+    finally:
+        pool.checkin(tab)
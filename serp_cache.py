@@ -0,0 +1,171 @@
+import os
+import sys
+import glob
+import time
+import sqlite3
+import threading
+from keyword_source import normalize_keyword
+from result_files import read_result_csv
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'serp_counts.sqlite3')
+DEFAULT_TTL = 7 * 24 * 3600      # seconds
+DEFAULT_MAX_ENTRIES = 200000
+
+
+class SerpCache:
+    """SQLite-backed cache of result counts keyed by (keyword, operator).
+
+    Entries older than ``ttl`` seconds are treated as misses, and the table is
+    trimmed to the ``max_entries`` most recently fetched rows. The database
+    can be shared by several threads and processes on one host.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS serp_counts (
+                keyword TEXT NOT NULL,
+                search_type TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (keyword, search_type)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS serp_counts_fetched_at ON serp_counts (fetched_at)')
+        self._conn.commit()
+
+    def get(self, keyword, search_type):
+        """Cached count, or None when missing or expired."""
+        return self.get_many([(keyword, search_type)]).get((keyword, search_type))
+
+    def get_many(self, pairs):
+        """Bulk lookup; returns {(keyword, search_type): count} for fresh hits only."""
+        wanted = {}
+        for keyword, search_type in pairs:
+            wanted.setdefault((normalize_keyword(keyword), search_type), []).append((keyword, search_type))
+        if not wanted:
+            return {}
+        cutoff = time.time() - self.ttl
+        hits = {}
+        keys = list(wanted)
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 400):
+                chunk = keys[start:start + 400]
+                clause = ' OR '.join(['(keyword = ? AND search_type = ?)'] * len(chunk))
+                params = [value for key in chunk for value in key]
+                rows = self._conn.execute(
+                    f'SELECT keyword, search_type, count FROM serp_counts '
+                    f'WHERE fetched_at >= ? AND ({clause})', [cutoff] + params)
+                for keyword, search_type, count in rows:
+                    for original in wanted[(keyword, search_type)]:
+                        hits[original] = count
+        return hits
+
+    def put(self, keyword, search_type, count, fetched_at=None):
+        self.put_many([(keyword, search_type, count, fetched_at)])
+
+    def put_many(self, rows, only_newer=False):
+        """Store (keyword, search_type, count[, fetched_at]) rows."""
+        now = time.time()
+        values = []
+        for row in rows:
+            keyword, search_type, count = row[:3]
+            fetched_at = row[3] if len(row) > 3 and row[3] is not None else now
+            values.append((normalize_keyword(keyword), search_type, int(count), fetched_at))
+        if not values:
+            return
+        statement = '''
+            INSERT INTO serp_counts (keyword, search_type, count, fetched_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (keyword, search_type) DO UPDATE
+            SET count = excluded.count, fetched_at = excluded.fetched_at'''
+        if only_newer:
+            statement += ' WHERE excluded.fetched_at >= serp_counts.fetched_at'
+        with self._lock:
+            self._conn.executemany(statement, values)
+            self._conn.commit()
+            self._writes += len(values)
+            if self._writes >= 1000:
+                self._evict()
+
+    def evict(self):
+        """Drop expired rows and trim to ``max_entries``; returns rows removed."""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self):
+        self._writes = 0
+        removed = self._conn.execute(
+            'DELETE FROM serp_counts WHERE fetched_at < ?', (time.time() - self.ttl,)).rowcount
+        removed += self._conn.execute('''
+            DELETE FROM serp_counts WHERE rowid IN (
+                SELECT rowid FROM serp_counts ORDER BY fetched_at DESC LIMIT -1 OFFSET ?
+            )''', (self.max_entries,)).rowcount
+        self._conn.commit()
+        return removed
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM serp_counts').fetchone()[0]
+
+    def warm_from_csv(self, paths, skip_zero=True):
+        """Load counts from crawler CSV output files, newest file winning.
+
+        The file's modification time is used as the fetch time. Zero counts
+        are skipped by default because older crawlers wrote 0 whenever the
+        result stats could not be parsed.
+        """
+        loaded = 0
+        for path in sorted(paths, key=os.path.getmtime):
+            fetched_at = os.path.getmtime(path)
+            rows = [(keyword, search_type, count, fetched_at)
+                    for keyword, search_type, count in read_result_csv(path)
+                    if count or not skip_zero]
+            self.put_many(rows, only_newer=True)
+            loaded += len(rows)
+        return loaded
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_cache():
+    """Cache configured from SERP_CACHE_* env vars, or None if SERP_CACHE=off."""
+    if os.getenv('SERP_CACHE', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    return SerpCache(
+        path=os.getenv('SERP_CACHE_PATH', DEFAULT_CACHE_PATH),
+        ttl=float(os.getenv('SERP_CACHE_TTL', DEFAULT_TTL)),
+        max_entries=int(os.getenv('SERP_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+    )
+
+
+def main():
+    """python serp_cache.py warm [files...] | stats | evict"""
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache = get_cache() or SerpCache(os.getenv('SERP_CACHE_PATH', DEFAULT_CACHE_PATH))
+    try:
+        if command == 'warm':
+            paths = sys.argv[2:] or glob.glob(os.path.join('results', '*.csv'))
+            print(f"Loaded {cache.warm_from_csv(paths)} counts from {len(paths)} file(s)")
+        elif command == 'evict':
+            print(f"Evicted {cache.evict()} entries")
+        elif command == 'stats':
+            print(f"{cache.path}: {len(cache)} entries")
+        else:
+            print(main.__doc__)
+            sys.exit(1)
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import tempfile
+import multiprocessing
+from metrics import get_metrics
+
+def split_shards(items, workers):
+    """Split ``items`` into at most ``workers`` contiguous shards of (index, item) pairs."""
+    indexed = list(enumerate(items))
+    count = max(1, min(int(workers), len(indexed)))
+    size, extra = divmod(len(indexed), count)
+    shards = []
+    start = 0
+    for n in range(count):
+        end = start + size + (1 if n < extra else 0)
+        shards.append(indexed[start:end])
+        start = end
+    return [shard for shard in shards if shard]
+
+def _run_shard(shard_fn, shard, spool_path):
+    os.environ['METRICS_SHARD'] = '1'
+    metrics = get_metrics()
+    # Every record is flushed as soon as it is produced so a crash keeps it
+    try:
+        with open(spool_path, 'w', encoding='utf-8') as spool:
+            def emit(index, record):
+                spool.write(json.dumps({'index': index, 'record': record}) + '\n')
+                spool.flush()
+            shard_fn(shard, emit)
+    finally:
+        # Hand this shard's timings back to the parent
+        with open(spool_path + '.metrics', 'w', encoding='utf-8') as file:
+            json.dump(metrics.snapshot(), file)
+        metrics.close()
+
+def _merge_metrics(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            get_metrics().merge(json.load(file))
+    except (OSError, ValueError):
+        pass
+
+def _read_spool(spool_path):
+    records = {}
+    if not os.path.exists(spool_path):
+        return records
+    with open(spool_path, 'r', encoding='utf-8') as spool:
+        for line in spool:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # torn last line from a killed process
+            records[entry['index']] = entry['record']
+    return records
+
+def run_sharded(items, shard_fn, workers, on_lost=None):
+    """Run ``shard_fn(shard, emit)`` over shards of ``items`` in separate processes.
+
+    ``shard_fn`` must be picklable and call ``emit(index, record)`` once per
+    (index, item) pair it is given. Records are merged back in input order.
+    If a shard process dies, the records it already emitted are kept and
+    ``on_lost(item, reason)`` supplies a record for each item it never
+    finished, so every item has exactly one record (unfinished items are
+    dropped when ``on_lost`` is None).
+
+    Returns ``(records, errors)`` where ``errors`` lists failed shards.
+    """
+    shards = split_shards(items, workers)
+    errors = []
+    merged = {}
+    with tempfile.TemporaryDirectory(prefix='kgr-shards-') as spool_dir:
+        processes = []
+        for n, shard in enumerate(shards):
+            spool_path = os.path.join(spool_dir, f'shard-{n}.jsonl')
+            process = multiprocessing.Process(
+                target=_run_shard, args=(shard_fn, shard, spool_path), name=f'shard-{n}')
+            process.start()
+            processes.append((n, shard, spool_path, process))
+        print(f"Started {len(processes)} shard process(es) for {len(items)} item(s)")
+
+        for n, shard, spool_path, process in processes:
+            process.join()
+            records = _read_spool(spool_path)
+            _merge_metrics(spool_path + '.metrics')
+            merged.update(records)
+            missing = [(index, item) for index, item in shard if index not in records]
+            if process.exitcode != 0 or missing:
+                reason = f"shard {n} exited with code {process.exitcode}"
+                errors.append(f"{reason} ({len(missing)} of {len(shard)} item(s) unfinished)")
+                print(f"Error: {errors[-1]}")
+                if on_lost is not None:
+                    for index, item in missing:
+                        merged[index] = on_lost(item, reason)
+
+    return [merged[index] for index in sorted(merged)], errors
@@ -0,0 +1,232 @@
+"""Result storage on R2 (or any S3-compatible endpoint).
+
+One boto3 client with a pooled connection set is created per process and
+reused by every upload and status update. Results are serialised straight
+into the upload stream, optionally gzip-compressed, and sent as a multipart
+upload once they outgrow a single part, so no intermediate file is written.
+
+Point R2_ENDPOINT_URL at a local S3 stand-in (MinIO, ``moto_server``) to
+exercise this without touching the real bucket.
+"""
+import io
+import os
+import gzip
+import json
+import itertools
+import threading
+from metrics import get_metrics
+
+RESULT_FORMATS = ('json', 'ndjson.gz', 'parquet')
+DEFAULT_RESULT_FORMAT = 'json'
+PART_SIZE = 8 * 1024 * 1024  # S3 requires >= 5 MiB for all but the last part
+PARQUET_ROW_GROUP = 50000
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_r2_client():
+    """The process-wide (client, bucket_name) pair, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import boto3
+            from botocore.config import Config
+
+            access_key_id = os.getenv('R2_ACCESS_KEY_ID')
+            secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY')
+            bucket_name = os.getenv('R2_BUCKET_NAME')
+            endpoint_url = os.getenv('R2_ENDPOINT_URL')
+
+            if not all([access_key_id, secret_access_key, bucket_name, endpoint_url]):
+                raise ValueError("One or more environment variables are missing")
+
+            config = Config(
+                max_pool_connections=int(os.getenv('R2_MAX_CONNECTIONS', '20')),
+                retries={'max_attempts': 5, 'mode': 'standard'},
+                s3={'addressing_style': os.getenv('R2_ADDRESSING_STYLE', 'auto')},
+            )
+            client = boto3.client(
+                's3',
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                config=config,
+            )
+            _client = (client, bucket_name)
+        return _client
+
+
+class StreamingUpload:
+    """File-like writer that streams bytes to one object.
+
+    Data is buffered up to ``part_size``; small objects become a single
+    ``put_object``, larger ones a multipart upload that is aborted if the
+    writer is closed after an error.
+    """
+
+    def __init__(self, key, content_type='application/octet-stream', content_encoding=None,
+                 part_size=PART_SIZE, s3=None, bucket_name=None):
+        if s3 is None:
+            s3, bucket_name = get_r2_client()
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.extra = {'ContentType': content_type}
+        if content_encoding:
+            self.extra['ContentEncoding'] = content_encoding
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body):
+        if self._upload_id is None:
+            self._upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, **self.extra)['UploadId']
+        number = len(self._parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=body)
+        self._parts.append({'PartNumber': number, 'ETag': response['ETag']})
+
+    def close(self):
+        if self._upload_id is None:
+            self.s3.put_object(Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer), **self.extra)
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id,
+                MultipartUpload={'Parts': self._parts})
+        self._buffer = bytearray()
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _write_json(upload, records):
+    # Same JSON array the front end has always read, written record by record
+    upload.write(b'[')
+    for n, record in enumerate(records):
+        upload.write((', ' if n else '').encode('utf-8') + json.dumps(record).encode('utf-8'))
+    upload.write(b']')
+
+
+def _write_ndjson_gz(upload, records):
+    with gzip.GzipFile(fileobj=upload, mode='wb', compresslevel=6) as stream:
+        for record in records:
+            stream.write(json.dumps(record).encode('utf-8') + b'\n')
+
+
+class _UploadSink(io.RawIOBase):
+    # Lets pyarrow write into an upload without closing it when the parquet writer closes
+    def __init__(self, upload):
+        self.upload = upload
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.upload.write(bytes(data))
+
+
+def _result_schema(pa, rows):
+    # Result columns that may first appear after the first row group (errors are
+    # rare) are always declared; other columns are inferred from the first rows
+    known = {'keyword': pa.string(), 'intitle': pa.int64(), 'allintitle': pa.int64(),
+             'timestamp': pa.string(), 'error': pa.string(), 'reason': pa.string(),
+             'allintitle_max': pa.int64(), 'attempts': pa.int64()}
+    inferred = pa.Table.from_pylist(rows).schema
+    fields = [pa.field(name, known.get(name, inferred.field(name).type)) for name in inferred.names]
+    fields += [pa.field(name, type) for name, type in known.items() if name not in inferred.names]
+    return pa.schema(fields)
+
+
+def _write_parquet(upload, records):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("The parquet result format needs pyarrow (pip install pyarrow)")
+    # One row group per PARQUET_ROW_GROUP records, written as it fills, so
+    # memory stays at one row group however large the batch
+    records = iter(records)
+    writer = None
+    with _UploadSink(upload) as sink:
+        while True:
+            rows = list(itertools.islice(records, PARQUET_ROW_GROUP))
+            if not rows:
+                break
+            if writer is None:
+                writer = pq.ParquetWriter(sink, _result_schema(pa, rows), compression='zstd')
+            extra = {name for row in rows for name in row} - set(writer.schema.names)
+            if extra:
+                raise ValueError(f"Result column(s) {', '.join(sorted(extra))} first appear after "
+                                 f"the first {PARQUET_ROW_GROUP} records")
+            writer.write_table(pa.Table.from_pylist(rows, schema=writer.schema))
+        if writer is None:
+            pq.write_table(pa.table({}), sink)
+        else:
+            writer.close()
+
+
+_FORMATS = {
+    'json': ('json', 'application/json', _write_json),
+    'ndjson.gz': ('ndjson.gz', 'application/x-ndjson', _write_ndjson_gz),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', _write_parquet),
+}
+
+
+def _result_format(result_format):
+    result_format = result_format or os.getenv('RESULTS_FORMAT', DEFAULT_RESULT_FORMAT)
+    if result_format not in _FORMATS:
+        raise ValueError(f"Unknown result format '{result_format}', expected one of {', '.join(RESULT_FORMATS)}")
+    return _FORMATS[result_format]
+
+
+def upload_results(batch_id, records, result_format=None, prefix='results'):
+    """Stream ``records`` to ``<prefix>/<batch_id>.<ext>``; returns the key.
+
+    ``result_format`` (or RESULTS_FORMAT) is 'json' (default; the array the
+    front end reads), 'ndjson.gz' or 'parquet' (needs pyarrow).
+    """
+    extension, content_type, writer = _result_format(result_format)
+    key = f'{prefix}/{batch_id}.{extension}'
+    metrics = get_metrics()
+    with metrics.stage('upload', key=key), StreamingUpload(key, content_type=content_type) as upload:
+        writer(upload, records)
+    metrics.incr('bytes_uploaded', upload.bytes_written)
+    print(f"Uploaded {upload.bytes_written} bytes to {key}")
+    return key
+
+
+def save_results(batch_id, records, directory, result_format=None):
+    """Write ``records`` to ``<directory>/<batch_id>.<ext>`` instead of R2; returns the path."""
+    extension, _, writer = _result_format(result_format)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{batch_id}.{extension}')
+    with get_metrics().stage('save_local', path=path), open(path, 'wb') as stream:
+        writer(stream, records)
+    print(f"Saved results to {path}")
+    return path
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BUCKET = 'kgr-test'
+
+
+@pytest.fixture(scope='session')
+def s3_server():
+    """A local S3 stand-in (moto_server) with conditional-write support."""
+    pytest.importorskip('boto3')
+    server_module = pytest.importorskip('moto.server')
+    server = server_module.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f'http://{host}:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def s3(s3_server):
+    """(client, bucket_name) on a fresh bucket."""
+    import boto3
+    client = boto3.client('s3', endpoint_url=s3_server, region_name='us-east-1',
+                          aws_access_key_id='test', aws_secret_access_key='test')
+    client.create_bucket(Bucket=BUCKET)
+    yield client, BUCKET
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET):
+        for item in page.get('Contents', []):
+            client.delete_object(Bucket=BUCKET, Key=item['Key'])
+    client.delete_bucket(Bucket=BUCKET)
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+import getbrowser
+
+
+class FakeTab:
+    def close(self):
+        pass
+
+
+class FakeChromium:
+    def __init__(self):
+        self.fail = 0           # new_tab() calls left to fail
+        self.gate = None        # threading.Event new_tab() waits on
+        self.entered = threading.Event()
+        self.opened = 0
+
+    def new_tab(self):
+        if self.gate is not None:
+            self.entered.set()
+            self.gate.wait(5)
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("tab crashed")
+        self.opened += 1
+        return FakeTab()
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(getbrowser, 'setup_chrome', lambda **kwargs: FakeChromium())
+    pool = getbrowser.BrowserPool(tabs_per_browser=2, max_navigations=1, lean=False,
+                                  max_rss_mb=0, renderer_cap=0, checkout_timeout=1)
+    yield pool.start()
+    pool.close()
+
+
+def _wear_out(pool, tab):
+    pool._navigations[id(tab)] = pool.max_navigations
+
+
+def test_recycling_a_tab_does_not_hold_the_pool_lock(pool):
+    chromium = pool._instances[0].chromium
+    tab = pool.checkout()
+    _wear_out(pool, tab)
+    chromium.gate = threading.Event()
+    recycler = threading.Thread(target=pool.checkin, args=(tab,))
+    recycler.start()
+    try:
+        assert chromium.entered.wait(5)
+        assert pool._lock.acquire(timeout=1)
+        pool._lock.release()
+        # The other tab is still handed out while the replacement is opening
+        other = pool.checkout(timeout=1)
+        assert pool.stats()['in_flight'] == 1
+        pool.checkin(other)
+    finally:
+        chromium.gate.set()
+        recycler.join(5)
+    assert pool.stats()['tabs'] == 2
+
+
+def test_failed_replacement_is_retried_by_checkout(pool):
+    chromium = pool._instances[0].chromium
+    chromium.fail = 1
+    for _ in range(2):
+        tab = pool.checkout()
+        _wear_out(pool, tab)
+        pool.checkin(tab)
+    assert pool.stats()['owed'] == 1
+    tabs = [pool.checkout(), pool.checkout()]
+    assert pool.stats()['owed'] == 0
+    for tab in tabs:
+        pool.checkin(tab)
+
+
+def test_checkout_gives_up_after_the_pool_timeout(pool):
+    tabs = [pool.checkout(), pool.checkout()]
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+    for tab in tabs:
+        pool.checkin(tab)
+
+
+def test_rss_is_sampled_outside_the_pool_lock(pool, monkeypatch):
+    held = []
+
+    def process_tree_rss(pid):
+        held.append(pool._lock.locked())
+        return 10 * 2 ** 30
+    monkeypatch.setattr(getbrowser, 'process_tree_rss', process_tree_rss)
+    pool.max_rss_mb = 1
+    tab = pool.checkout()
+    pool.checkin(tab)
+    assert held == [False]
+    assert pool.stats()['restarts']['memory'] == 1
+
+
+def test_refill_reports_success(pool):
+    chromium = pool._instances[0].chromium
+    assert pool._refill(pool._instances[0]) is True
+    chromium.fail = 1
+    assert pool._refill(pool._instances[0]) is False
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from checkpoint import Checkpoint, open_checkpoint
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('CHECKPOINT_DIR', str(tmp_path))
+    monkeypatch.setenv('EVENTS', 'off')
+    return tmp_path
+
+
+def test_load_reads_every_part_and_stops_at_a_torn_line(checkpoint_dir):
+    main = Checkpoint('run1')
+    main.append({'keyword': 'a'})
+    main.close()
+    part = Checkpoint('run1', part=7)
+    part.append({'keyword': 'b'})
+    part.close()
+    with open(part.path, 'a', encoding='utf-8') as file:
+        file.write('{"keyword": "c"')  # killed mid-write
+    other = Checkpoint('run10')
+    other.append({'keyword': 'other run'})
+    other.close()
+    assert sorted(record['keyword'] for record in Checkpoint('run1').load()) == ['a', 'b']
+
+
+def test_fresh_run_discards_a_stale_checkpoint():
+    stale = Checkpoint('run1')
+    stale.append({'keyword': 'a'})
+    stale.close()
+    checkpoint, resumed = open_checkpoint('run1')
+    assert resumed == [] and checkpoint.load() == []
+
+
+def test_resume_from_another_run_carries_its_records_over():
+    old = Checkpoint('run1')
+    old.append({'keyword': 'a'})
+    old.close()
+    checkpoint, resumed = open_checkpoint('run2', resume_id='run1')
+    checkpoint.close()
+    assert resumed == [{'keyword': 'a'}]
+    assert Checkpoint('run2').load() == [{'keyword': 'a'}]
+
+
+class CountingFetcher:
+    def __init__(self):
+        self.searched = []
+
+    def count(self, keyword, search_type):
+        self.searched.append((keyword, search_type))
+        return 5
+
+    def close(self):
+        pass
+
+
+def test_resume_skips_keywords_already_done(tmp_path, monkeypatch):
+    process_keywords = pytest.importorskip('process_keywords')
+    monkeypatch.setenv('PLANNER_ALLINTITLE_MIN', '1')
+    done = Checkpoint('batch1')
+    done.append({'keyword': 'alpha', 'intitle': 3, 'allintitle': 1})
+    done.close()
+    fetcher = CountingFetcher()
+    services = process_keywords.Services(None, None, fetcher)
+    out = tmp_path / 'out'
+
+    has_errors = process_keywords.run_batch('alpha,beta', 'batch1', 'g1', resume='batch1', local=str(out),
+                                            services=services)
+    assert not has_errors
+    assert fetcher.searched == [('beta', 'intitle'), ('beta', 'allintitle')]
+    results = json.loads((out / 'batch1.json').read_text(encoding='utf-8'))
+    assert [(r['keyword'], r['intitle']) for r in results] == [('alpha', 3), ('beta', 5)]
+    assert Checkpoint('batch1').load() == []  # removed after the complete run
@@ -0,0 +1,74 @@
+import asyncio
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip('playwright')
+
+
+def _load_main_pl():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main-pl.py')
+    spec = importlib.util.spec_from_file_location('main_pl', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+
+    def is_closed(self):
+        return False
+
+
+class FakeContext:
+    async def new_page(self):
+        return FakePage(self)
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    class browser_type:
+        name = 'fake'
+
+    def __init__(self):
+        self.fail = 0  # new_context() calls left to fail
+
+    async def new_context(self):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('context crashed')
+        return FakeContext()
+
+
+def test_failed_context_is_reopened_by_checkout():
+    main_pl = _load_main_pl()
+
+    async def run():
+        browser = FakeBrowser()
+        pool = await main_pl.ContextPool(browser, size=1, max_navigations=1, checkout_timeout=1).start()
+        page = await pool.checkout()
+        pool._navigations[id(page)] = 1
+        browser.fail = 1
+        await pool.checkin(page)
+        assert pool._owed == 1
+        assert await pool.checkout() is not None
+        assert pool._owed == 0
+
+    asyncio.run(run())
+
+
+def test_checkout_times_out():
+    main_pl = _load_main_pl()
+
+    async def run():
+        pool = await main_pl.ContextPool(FakeBrowser(), size=1, checkout_timeout=0.2).start()
+        await pool.checkout()
+        with pytest.raises(TimeoutError):
+            await pool.checkout()
+
+    asyncio.run(run())
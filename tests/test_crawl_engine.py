@@ -0,0 +1,59 @@
+import time
+import asyncio
+
+from crawl_engine import crawl, waiting
+from retry import CircuitBreaker
+
+
+def _run(jobs, fetch, **kwargs):
+    async def collect():
+        return [result async for result in crawl(jobs, fetch, **kwargs)]
+    return {result.job: result for result in asyncio.run(collect())}
+
+
+def _open_breaker(seconds):
+    breaker = CircuitBreaker()
+    breaker.state, breaker._open_until = 'open', time.monotonic() + seconds
+    return breaker
+
+
+def test_breaker_hold_is_not_a_timeout():
+    breaker = _open_breaker(1.0)
+    searched = []
+
+    def fetch(job):
+        with breaker.guard():
+            searched.append(job)
+            return 1
+
+    results = _run(['a', 'b'], fetch, concurrency=2, timeout=0.3)
+    assert {job: result.error for job, result in results.items()} == {'a': None, 'b': None}
+    assert sorted(searched) == ['a', 'b']
+
+
+def test_async_slot_wait_is_not_a_timeout():
+    breaker = _open_breaker(1.0)
+
+    async def fetch(job):
+        await breaker.acquire_async()
+        try:
+            return 2
+        finally:
+            breaker.release()
+
+    assert _run(['a'], fetch, concurrency=1, timeout=0.3)['a'].value == 2
+
+
+def test_slow_work_still_times_out_and_stops_there():
+    steps = []
+
+    def fetch(job):
+        time.sleep(0.5)
+        steps.append('first query')
+        with waiting():  # the next query's slot: given up once timed out
+            steps.append('second query')
+
+    result = _run(['a'], fetch, concurrency=1, timeout=0.2)['a']
+    assert result.reason == 'timeout'
+    time.sleep(0.5)
+    assert steps == ['first query']
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import queue
+import threading
+import http.client
+
+import pytest
+
+import events
+
+
+@pytest.fixture
+def port(tmp_path, monkeypatch):
+    monkeypatch.setenv('EVENTS_ALLOWED_ORIGINS', 'https://app.example')
+    servers = queue.Queue()
+
+    class Server(events.ThreadingHTTPServer):
+        def server_activate(self):
+            super().server_activate()
+            servers.put(self)
+
+    monkeypatch.setattr(events, 'ThreadingHTTPServer', Server)
+    threading.Thread(target=events.serve, daemon=True,
+                     kwargs={'port': 0, 'host': '127.0.0.1', 'directory': str(tmp_path)}).start()
+    server = servers.get(timeout=5)
+    yield server.server_address[1]
+    server.shutdown()
+
+
+def _get(port, path, origin=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', path, headers={'Origin': origin} if origin else {})
+    response = conn.getresponse()
+    conn.close()
+    return response.status, dict(response.getheaders())
+
+
+def test_unlisted_origin_gets_no_credentials(port):
+    status, headers = _get(port, '/results?batchGroupId=g&totalBatches=1', origin='https://evil.example')
+    assert status == 200
+    assert headers['Access-Control-Allow-Origin'] == '*'
+    assert 'Access-Control-Allow-Credentials' not in headers
+
+
+def test_listed_origin_may_send_credentials(port):
+    status, headers = _get(port, '/results?batchGroupId=g&totalBatches=1', origin='https://app.example')
+    assert status == 200
+    assert headers['Access-Control-Allow-Origin'] == 'https://app.example'
+    assert headers['Access-Control-Allow-Credentials'] == 'true'
+
+
+@pytest.mark.parametrize('total', ['abc', '-1', '1.5', '%C2%B2'])
+def test_bad_total_is_a_bad_request(port, total):
+    status, _ = _get(port, f'/results?batchGroupId=g&totalBatches={total}')
+    assert status == 400
+
+
+def _read_stream(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', path)
+    body = conn.getresponse().read().decode('utf-8')  # returns only once the server ends the stream
+    conn.close()
+    return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+
+def test_stream_without_total_ends_on_group_done(port, tmp_path, monkeypatch):
+    monkeypatch.setattr(events, '_total_batches', lambda batch_group_id: None)
+    path = str(tmp_path / 'g.jsonl')
+    reporter = events.ProgressReporter('g', 'b1', path=path)
+    reporter.start(1)
+    reporter.keyword({'keyword': 'a', 'intitle': 1, 'allintitle': 1})
+    reporter.finish(1)
+    events.finish_group('g', path=path)
+
+    messages = _read_stream(port, '/results?batchGroupId=g')
+    assert messages[-1]['status'] == 'completed'
+    assert messages[-1]['completedBatches'] == 1
+
+
+def test_group_done_sets_the_total():
+    state = events.GroupState(None)
+    state.apply({'type': 'batch_done', 'batchId': 'b1', 'keywords': 2})
+    assert not state.completed()
+    state.apply({'type': 'group_done', 'totalBatches': 3, 'hasErrors': True})
+    message = state.message()
+    assert message['status'] == 'completed'
+    assert message['totalBatches'] == 3
+    assert message['hasErrors']
+
+
+def test_finish_group_is_off_with_events(tmp_path, monkeypatch):
+    monkeypatch.setenv('EVENTS', 'off')
+    events.finish_group('g', path=str(tmp_path / 'g.jsonl'))
+    assert not os.path.exists(tmp_path / 'g.jsonl')
+
+
+def test_prune_drops_finished_and_idle_logs(tmp_path):
+    def log(name, age, finished):
+        path = str(tmp_path / f'{name}.jsonl')
+        events.append_event(path, {'type': 'batch_done', 'batchId': 'b1'})
+        if finished:
+            events.finish_group(name, path=path)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    fresh_finished = log('fresh', 10, True)
+    old_finished = log('old', 7200, True)
+    running = log('running', 7200, False)
+    abandoned = log('abandoned', 30 * 24 * 3600, False)
+
+    assert events.prune_logs(str(tmp_path), retain_finished=3600, retain_idle=7 * 24 * 3600) == 2
+    assert os.path.exists(fresh_finished) and os.path.exists(running)
+    assert not os.path.exists(old_finished) and not os.path.exists(abandoned)
+
+
+def test_prune_without_a_log_directory(tmp_path):
+    assert events.prune_logs(str(tmp_path / 'missing')) == 0
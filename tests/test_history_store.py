@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from history_store import HistoryStore, bucket_of
+
+
+def _run(directory, name, rows, mtime):
+    path = directory / f'{name}.csv'
+    path.write_text('keyword,search_type,count\n' + ''.join(f'{k},{t},{c}\n' for k, t, c in rows),
+                    encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+@pytest.fixture
+def runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # outside any git repo: run times come from mtimes
+    results = tmp_path / 'results'
+    results.mkdir()
+    return results
+
+
+def test_compact_merges_runs_and_keeps_the_newest_as_latest(runs, tmp_path):
+    store = HistoryStore(str(tmp_path / 'history'))
+    first = _run(runs, 'run1', [('Alpha', 'intitle', 10), ('alpha', 'allintitle', 2), ('beta', 'intitle', 5)],
+                 1_700_000_000)
+    assert store.compact([first]) == 3
+    second = _run(runs, 'run2', [('alpha', 'intitle', 12)], 1_700_086_400)
+    assert store.compact([first, second]) == 1  # run1 is already in the store
+
+    latest = store.last('ALPHA')
+    assert latest['intitle']['count'] == 12 and latest['intitle']['run_id'] == 'run2'
+    assert latest['allintitle']['count'] == 2
+    assert list(store.history('alpha', 'intitle')['count']) == [10, 12]
+    assert set(store.runs()) == {'run1', 'run2'}
+
+
+def test_forced_recompaction_does_not_duplicate_rows(runs, tmp_path):
+    store = HistoryStore(str(tmp_path / 'history'))
+    path = _run(runs, 'run1', [('alpha', 'intitle', 10)], 1_700_000_000)
+    store.compact([path])
+    _run(runs, 'run1', [('alpha', 'intitle', 11)], 1_700_000_000)  # the run's file was rewritten
+    assert store.compact([path]) == 0
+    assert store.compact([path], force=True) == 1
+    history = store.history('alpha')
+    assert list(history['count']) == [11]
+
+
+def test_join_reads_keywords_across_buckets(runs, tmp_path):
+    store = HistoryStore(str(tmp_path / 'history'))
+    keywords = [f'keyword {n}' for n in range(40)]
+    assert len({bucket_of(keyword) for keyword in keywords}) > 1
+    store.compact([_run(runs, 'run1', [(k, 'intitle', n) for n, k in enumerate(keywords)], 1_700_000_000)])
+    joined = store.join(['Keyword 3', 'keyword 17', 'missing'])
+    assert sorted(zip(joined['keyword'], joined['count'])) == [('keyword 17', 17), ('keyword 3', 3)]
+    assert store.join([]).empty
@@ -0,0 +1,43 @@
+from keyword_source import Deduper, batched, iter_keywords, normalize_keyword
+
+
+def test_keywords_are_normalized_and_deduplicated_as_read(tmp_path):
+    path = tmp_path / 'keywords.csv'
+    path.write_text('﻿Sprunki  Game,other\nsprunki game\n\nＡＢＣ\n', encoding='utf-8')
+    keywords = list(iter_keywords(str(path), 'abc, Sprunki Game ,new'))
+    assert keywords == ['sprunki game', 'abc', 'new']
+    assert list(iter_keywords(str(path), all_columns=True)) == ['sprunki game', 'other', 'abc']
+    assert list(iter_keywords(str(tmp_path / 'missing.csv'), 'x')) == ['x']
+    assert normalize_keyword(' Straße\tX ') == 'strasse x'
+
+
+def test_deduper_is_exact_below_its_limit():
+    deduper = Deduper(exact_limit=100)
+    assert [deduper.seen(item) for item in ['a', 'b', 'a']] == [False, False, True]
+    assert deduper._filters is None
+
+
+def test_deduper_memory_stays_bounded_past_its_limit():
+    deduper = Deduper(exact_limit=1000, error_rate=0.001)
+    items = [f'keyword number {n}' for n in range(20000)]
+    fresh = [not deduper.seen(item) for item in items]
+    assert deduper._exact is None  # moved to Bloom filters
+    # No false negatives, and false positives near the configured rate
+    assert all(deduper.seen(item) for item in items)
+    assert sum(fresh) >= len(items) * (1 - 0.01)
+    # A few bytes per keyword, against tens for an exact set of the strings
+    size = sum(len(bloom.array) for bloom in deduper._filters)
+    assert size / len(items) < 8
+    # Each filter doubles the last one: 2k + 4k + 8k + 16k keywords of capacity
+    assert len(deduper._filters) == 4
+
+
+def test_batched_is_lazy():
+    def endless():
+        n = 0
+        while True:
+            yield n
+            n += 1
+    chunks = batched(endless(), 3)
+    assert next(chunks) == [0, 1, 2]
+    assert next(chunks) == [3, 4, 5]
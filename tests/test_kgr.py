@@ -0,0 +1,73 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+import kgr
+
+
+def _volumes(rows):
+    frame = pd.DataFrame(rows, columns=['keyword', 'search_volume'])
+    frame['key'] = kgr.normalize_keywords(frame['keyword'])
+    return frame
+
+
+def _counts(rows):
+    frame = pd.DataFrame(rows, columns=['key', 'intitle_count', 'allintitle_count'])
+    return frame
+
+
+def _by_keyword(scored):
+    return {row['keyword']: row for row in scored.to_dict('records')}
+
+
+def test_classes_follow_the_sse_buckets():
+    volumes = _volumes([('a', 100), ('b', 100), ('c', 100), ('d', 100), ('e', 100)])
+    counts = _counts([('a', 1, 25), ('b', 1, 26), ('c', 1, 50), ('d', 1, 100), ('e', 1, 101)])
+    rows = _by_keyword(kgr.score(volumes, counts))
+    assert [rows[k]['kgr_class'] for k in 'abcde'] == [
+        'kgr-excellent', 'kgr-good', 'kgr-good', 'kgr-moderate', 'kgr-difficult']
+    assert rows['a']['kgr_score'] == 0.25
+
+
+def test_zero_and_missing_volume_or_count_have_no_score():
+    volumes = _volumes([('zero', 0), ('nan', np.nan), ('no count', 10), ('free', 10)])
+    counts = _counts([('zero', 5, 5), ('nan', 5, 5), ('no count', 5, np.nan), ('free', 0, 0)])
+    scored = kgr.score(volumes, counts)
+    rows = _by_keyword(scored)
+    for keyword in ('zero', 'nan', 'no count'):
+        assert math.isnan(rows[keyword]['kgr_score'])
+        assert rows[keyword]['kgr_class'] is None
+    assert rows['free']['kgr_score'] == 0.0 and rows['free']['kgr_class'] == 'kgr-excellent'
+    assert list(scored['keyword'])[0] == 'free'  # unscored rows sort last
+
+
+def test_join_is_on_the_normalized_keyword():
+    volumes = _volumes([('Sprunki  GAME', 200), ('unmatched', 10)])
+    counts = _counts([('sprunki game', 9, 20)])
+    scored = kgr.score(volumes, counts)
+    assert list(scored['keyword']) == ['Sprunki  GAME']
+    assert scored['kgr_score'].iloc[0] == 0.1
+
+
+def test_volume_exports_are_parsed(tmp_path):
+    path = tmp_path / 'volumes.csv'
+    path.write_text('Keyword,Avg. monthly searches\nA,"1,300"\nB,1.5K\nC,1K – 10K\nD,n/a\nA,90\n',
+                    encoding='utf-8')
+    volumes = kgr.load_volumes([str(path)]).set_index('key')['search_volume']
+    assert volumes['a'] == 90  # later rows win
+    assert volumes['b'] == 1500 and volumes['c'] == 1000
+    assert math.isnan(volumes['d'])
+
+
+def test_counts_from_long_csv_and_results_json(tmp_path):
+    long_csv = tmp_path / 'run.csv'
+    long_csv.write_text('keyword,search_type,count\nAlpha,intitle,40\nAlpha,allintitle,4\n', encoding='utf-8')
+    results = tmp_path / 'batch.json'
+    results.write_text(json.dumps([{'keyword': 'beta', 'intitle': 8, 'allintitle': 2},
+                                   {'keyword': 'gamma', 'error': 'timeout'}]), encoding='utf-8')
+    counts = kgr.load_counts([str(long_csv), str(results)]).set_index('key')
+    assert counts.loc['alpha', 'allintitle_count'] == 4
+    assert counts.loc['beta', 'intitle_count'] == 8
+    assert 'gamma' not in counts.index
@@ -0,0 +1,153 @@
+import os
+import time
+
+import pytest
+
+import storage
+import lease_queue
+
+GROUP = 'g1'
+
+
+@pytest.fixture(params=['sqlite', 'r2'])
+def store(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('EVENTS', 'off')
+    if request.param == 'sqlite':
+        store = lease_queue.SqliteLeaseStore(str(tmp_path / 'queue.sqlite3'))
+    else:
+        client, bucket = request.getfixturevalue('s3')
+        store = lease_queue.R2LeaseStore(client, bucket)
+    yield store
+    store.close()
+
+
+def _search_all(store, worker='w1'):
+    # Lease and complete every keyword, as a worker does, but never publish
+    while True:
+        leases = store.claim(GROUP, worker, limit=10)
+        if not leases:
+            return
+        for lease in leases:
+            assert store.complete(lease, {'keyword': lease.keyword, 'intitle': 1, 'allintitle': 1})
+
+
+def _fail_once(monkeypatch):
+    calls = []
+    real = storage.save_results
+
+    def save_results(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 1:
+            raise OSError('disk went away mid-publish')
+        return real(*args, **kwargs)
+    monkeypatch.setattr(storage, 'save_results', save_results)
+    return calls
+
+
+def test_failed_publish_is_retried_after_lease_expiry(store, tmp_path, monkeypatch):
+    store.enqueue(GROUP, 'b1', ['alpha', 'beta'])
+    _search_all(store)
+    calls = _fail_once(monkeypatch)
+    out = str(tmp_path / 'out')
+
+    assert not lease_queue.finalize_batch(store, GROUP, 'b1', 'w1', local=out, lease_seconds=1.5)
+    assert not store.is_finished(GROUP)
+    # Still leased by the failed publisher: nobody else publishes yet
+    assert store.claim_finalization(GROUP, 'b1', 'w2', 1.5) is None
+
+    time.sleep(2.6)
+    assert store.unfinalized(GROUP) == ['b1']
+    assert lease_queue.finalize_batch(store, GROUP, 'b1', 'w2', local=out, lease_seconds=1.5)
+    assert calls == ['b1', 'b1']
+    assert os.path.exists(os.path.join(out, 'b1.json'))
+    assert store.is_finished(GROUP)
+    assert store.unfinalized(GROUP) == []
+    assert not lease_queue.finalize_batch(store, GROUP, 'b1', 'w3', local=out)
+
+
+def test_crash_between_complete_and_finalize_is_swept(store, tmp_path, monkeypatch):
+    pytest.importorskip('DrissionPage')
+    monkeypatch.setenv('SERP_CACHE', 'off')
+    monkeypatch.setenv('RATE_LIMIT', 'off')
+    store.enqueue(GROUP, 'b1', ['alpha', 'beta'])
+    store.enqueue(GROUP, 'b2', ['gamma'])
+    # The worker that completed the last keywords died before publishing
+    _search_all(store)
+    out = str(tmp_path / 'out')
+
+    lease_queue.work(store, GROUP, local=out, exit_when_done=True, poll_interval=0.01)
+    assert sorted(os.listdir(out)) == ['b1.json', 'b2.json']
+    assert store.is_finished(GROUP)
+
+
+def test_r2_claim_reads_only_the_batches_it_needs(s3):
+    client, bucket = s3
+    listed = []
+
+    class CountingClient:
+        def __getattr__(self, name):
+            return getattr(client, name)
+
+        def get_paginator(self, name):
+            paginator = client.get_paginator(name)
+
+            class Paginator:
+                def paginate(self, **kwargs):
+                    listed.append(kwargs['Prefix'])
+                    return paginator.paginate(**kwargs)
+            return Paginator()
+
+    store = lease_queue.R2LeaseStore(CountingClient(), bucket)
+    for n in range(20):
+        store.enqueue(GROUP, f'b{n:02d}', [f'kw{n}-{i}' for i in range(5)])
+
+    leases = store.claim(GROUP, 'w1', limit=4, home='b07')
+    assert {lease.batch_id for lease in leases} == {'b07'}
+    scanned = {prefix.split('/')[3] for prefix in listed if prefix.count('/') > 3}
+    assert scanned == {'b07'}
+
+
+def test_released_keyword_backs_off(store):
+    store.enqueue(GROUP, 'b1', ['alpha'])
+    lease, = store.claim(GROUP, 'w1')
+    store.release(lease, delay=1.5)
+    assert store.claim(GROUP, 'w1') == []
+    time.sleep(2.0)
+    lease, = store.claim(GROUP, 'w1')
+    assert lease.keyword == 'alpha' and lease.attempts == 1
+
+
+def test_stolen_lease_is_not_released_by_its_old_owner(store):
+    store.enqueue(GROUP, 'b1', ['alpha'])
+    stale, = store.claim(GROUP, 'w1', lease_seconds=0.5)
+    time.sleep(1.1)
+    lease, = store.claim(GROUP, 'w2', lease_seconds=0.5)
+    store.release(stale, delay=60)
+    assert store.complete(lease, {'keyword': 'alpha', 'intitle': 1, 'allintitle': 1})
+    assert store.is_batch_done(GROUP, 'b1')
+
+
+def test_r2_stolen_lease_is_not_completed_by_its_old_owner(s3):
+    store = lease_queue.R2LeaseStore(*s3)
+    store.enqueue(GROUP, 'b1', ['alpha'])
+    stale, = store.claim(GROUP, 'w1', lease_seconds=0.5)
+    time.sleep(1.1)
+    lease, = store.claim(GROUP, 'w2', lease_seconds=0.5)
+    assert not store.complete(stale, {'keyword': 'alpha', 'intitle': 0, 'allintitle': 0})
+    assert store.status(GROUP)['b1']['leased'] == 1  # the new owner still holds it
+    assert store.complete(lease, {'keyword': 'alpha', 'intitle': 1, 'allintitle': 1})
+    assert store.results(GROUP, 'b1')[0]['intitle'] == 1
+
+
+def test_taken_over_finalization_cannot_commit(store):
+    store.enqueue(GROUP, 'b1', ['alpha'])
+    _search_all(store)
+    stale = store.claim_finalization(GROUP, 'b1', 'w1', lease_seconds=0.5)
+    time.sleep(1.1)
+    token = store.claim_finalization(GROUP, 'b1', 'w2', lease_seconds=0.5)
+    assert token is not None
+    assert not store.commit_finalization(GROUP, 'b1', stale)
+    assert not store.is_finished(GROUP)
+    assert store.commit_finalization(GROUP, 'b1', token)
+    assert store.is_finished(GROUP)
@@ -0,0 +1,105 @@
+import pickle
+
+import pytest
+
+import planner
+from planner import GroupIndex, allintitle_min, cluster_key, pruned_count, skip_allintitle
+
+GROUP = 'g1'
+
+
+@pytest.mark.parametrize('intitle,threshold,skip', [
+    (0, 1, True), (1, 1, False), (None, 1, False),
+    (4, 5, True), (5, 5, False), (0, 0, False),
+])
+def test_allintitle_is_skipped_below_the_threshold(intitle, threshold, skip):
+    assert skip_allintitle(intitle, threshold) is skip
+
+
+def test_only_a_zero_intitle_prunes_to_an_exact_zero():
+    assert pruned_count(0) == 0
+    assert pruned_count(3) is None  # an upper bound, not a measurement
+
+
+def test_threshold_comes_from_the_environment(monkeypatch):
+    monkeypatch.delenv('PLANNER_ALLINTITLE_MIN', raising=False)
+    assert allintitle_min() == 1
+    monkeypatch.setenv('PLANNER_ALLINTITLE_MIN', '10')
+    assert allintitle_min() == 10
+
+
+def test_perform_search_prunes_and_reports_the_upper_bound(monkeypatch):
+    process_keywords = pytest.importorskip('process_keywords')
+
+    class Backend:
+        def __init__(self, intitle):
+            self.intitle, self.searched = intitle, []
+
+        def count(self, keyword, search_type):
+            self.searched.append(search_type)
+            return self.intitle if search_type == 'intitle' else 1
+
+    monkeypatch.setenv('PLANNER_ALLINTITLE_MIN', '10')
+    backend = Backend(0)
+    assert process_keywords.perform_search('a', backend=backend) == {'keyword': 'a', 'intitle': 0, 'allintitle': 0}
+    assert backend.searched == ['intitle']
+    backend = Backend(7)
+    result = process_keywords.perform_search('b', backend=backend)
+    assert result['allintitle'] is None and result['allintitle_max'] == 7
+    backend = Backend(10)
+    assert process_keywords.perform_search('c', backend=backend)['allintitle'] == 1
+    assert backend.searched == ['intitle', 'allintitle']
+
+
+def test_cluster_key_groups_related_keywords():
+    keywords = ['game sprunki', 'apple pie', 'sprunki game', 'sprunki mods']
+    assert sorted(keywords, key=cluster_key) == ['apple pie', 'game sprunki', 'sprunki game', 'sprunki mods']
+
+
+def test_report_counts_navigations_saved():
+    from metrics import Metrics
+    metrics = Metrics()
+    planner.record(metrics, 'navigation', 3)
+    planner.record(metrics, 'pruned')
+    assert '4 possible searches' in planner.report(metrics, 2)
+    assert '-> 3 navigation(s), 1 saved (25%)' in planner.report(metrics, 2)
+
+
+def _result(keyword, intitle, allintitle):
+    return {'keyword': keyword, 'intitle': intitle, 'allintitle': allintitle}
+
+
+def test_group_index_claims_each_keyword_once(s3):
+    first = GroupIndex(GROUP, 'b1', *s3)
+    second = GroupIndex(GROUP, 'b2', *s3)
+    assert first.claim(['alpha', 'beta']) == ['alpha', 'beta']
+    # Running at the same time: the shared keyword goes last, not searched twice
+    assert second.claim(['beta', 'gamma']) == ['gamma', 'beta']
+    assert 'beta' not in second  # b1 has not searched it yet
+    first.record(_result('beta', 7, 3))
+    assert 'beta' in second and second['beta'] == {'intitle': 7, 'allintitle': 3}
+    assert 'gamma' not in second
+
+
+def test_group_index_keeps_a_batchs_own_claims_on_rerun(s3):
+    index = GroupIndex(GROUP, 'b1', *s3)
+    index.claim(['alpha'])
+    rerun = GroupIndex(GROUP, 'b1', *s3)
+    assert rerun.claim(['alpha']) == ['alpha'] and not rerun.others
+
+
+def test_group_index_skips_unknown_counts(s3):
+    first = GroupIndex(GROUP, 'b1', *s3)
+    second = GroupIndex(GROUP, 'b2', *s3)
+    first.claim(['alpha', 'beta'])
+    second.claim(['alpha', 'beta'])
+    first.record(_result('alpha', 9, None))  # pruned: only an upper bound
+    first.record({'keyword': 'beta', 'error': 'timeout', 'reason': 'timeout'})
+    assert 'alpha' not in second and 'beta' not in second
+
+
+def test_group_index_pickles_without_its_client(s3):
+    index = GroupIndex(GROUP, 'b1', *s3)
+    index.claim(['alpha'])
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy._s3 is None and copy.batch_id == 'b1'
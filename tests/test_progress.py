@@ -0,0 +1,123 @@
+import json
+import threading
+
+import pytest
+
+import progress
+
+
+class _RacingClient:
+    """Proxy that holds every group-object GET until ``parties`` readers hold the same ETag."""
+
+    def __init__(self, client, key, parties):
+        self._client = client
+        self._key = key
+        self._barrier = threading.Barrier(parties)
+        self._first_read = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_object(self, **kwargs):
+        response = self._client.get_object(**kwargs)
+        if kwargs['Key'] == self._key and not getattr(self._first_read, 'done', False):
+            self._first_read.done = True
+            self._barrier.wait(timeout=10)
+        return response
+
+
+def _create_group(client, bucket, group, total):
+    client.put_object(Bucket=bucket, Key=progress._group_key(group),
+                      Body=json.dumps({'batchGroupId': group, 'totalBatches': total, 'completedBatches': 0}))
+
+
+def test_racing_refreshes_lose_no_update(s3):
+    client, bucket = s3
+    _create_group(client, bucket, 'g1', 2)
+    racing = _RacingClient(client, progress._group_key('g1'), 2)
+    results, errors = [], []
+
+    def finish(batch_id, error):
+        try:
+            progress.mark_batch_complete('g1', batch_id, error=error, s3=racing, bucket_name=bucket)
+            results.append(progress.refresh_rollup('g1', s3=racing, bucket_name=bucket))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=finish, args=('b1', False)),
+               threading.Thread(target=finish, args=('b2', True))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    status = progress.read_status('g1', s3=client, bucket_name=bucket)
+    assert status['completedBatches'] == 2
+    assert status['hasErrors'] is True
+    assert progress.aggregate('g1', s3=client, bucket_name=bucket) == (2, True)
+
+
+def test_rollup_never_moves_backwards(s3):
+    client, bucket = s3
+    _create_group(client, bucket, 'g2', 3)
+    for batch_id in ('b1', 'b2'):
+        progress.mark_batch_complete('g2', batch_id, s3=client, bucket_name=bucket)
+    assert progress.refresh_rollup('g2', s3=client, bucket_name=bucket)['completedBatches'] == 2
+
+    # A writer holding a stale view (one marker) must not roll the count back
+    client.delete_object(Bucket=bucket, Key=progress._marker_prefix('g2') + 'b2.json')
+    assert progress.refresh_rollup('g2', s3=client, bucket_name=bucket)['completedBatches'] == 2
+    assert progress.read_status('g2', s3=client, bucket_name=bucket)['completedBatches'] == 2
+
+
+def test_no_unconditional_fallback(s3):
+    client, bucket = s3
+    from botocore.exceptions import ParamValidationError
+    _create_group(client, bucket, 'g3', 1)
+    progress.mark_batch_complete('g3', 'b1', s3=client, bucket_name=bucket)
+
+    class OldBotocore:
+        # Rejects IfMatch client-side, like botocore releases before conditional writes
+        def __getattr__(self, name):
+            return getattr(client, name)
+
+        def put_object(self, **kwargs):
+            if 'IfMatch' in kwargs:
+                raise ParamValidationError(report='Unknown parameter in input: "IfMatch"')
+            return client.put_object(**kwargs)
+
+    with pytest.raises(RuntimeError, match='IfMatch'):
+        progress.refresh_rollup('g3', s3=OldBotocore(), bucket_name=bucket)
+    assert progress.read_status('g3', s3=client, bucket_name=bucket)['completedBatches'] == 0
+    assert progress.aggregate('g3', s3=client, bucket_name=bucket) == (1, False)
+
+
+class _ConflictOnceClient:
+    """Proxy whose first conditional PUT fails the way R2 reports a racing conditional write."""
+
+    def __init__(self, client):
+        self._client = client
+        self.conflicts = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def put_object(self, **kwargs):
+        if 'IfMatch' in kwargs and not self.conflicts:
+            from botocore.exceptions import ClientError
+            self.conflicts += 1
+            raise ClientError({'Error': {'Code': 'ConditionalRequestConflict', 'Message': 'conflict'},
+                               'ResponseMetadata': {'HTTPStatusCode': 409}}, 'PutObject')
+        return self._client.put_object(**kwargs)
+
+
+def test_r2_conflict_is_retried(s3):
+    client, bucket = s3
+    _create_group(client, bucket, 'g1', 1)
+    progress.mark_batch_complete('g1', 'b1', s3=client, bucket_name=bucket)
+    conflicting = _ConflictOnceClient(client)
+    rollup = progress.refresh_rollup('g1', conflicting, bucket)
+    assert conflicting.conflicts == 1
+    assert rollup['completedBatches'] == 1
+    assert progress.read_status('g1', client, bucket)['completedBatches'] == 1
@@ -0,0 +1,54 @@
+import pytest
+
+from ratelimit import RateLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'rate.sqlite3'), rate=1.0, min_rate=0.1, max_rate=1.2,
+                          burst=2.0, increase=0.1, decrease=0.5, slow_seconds=5.0, cooldown=60.0)
+    yield limiter
+    limiter.close()
+
+
+def test_success_raises_the_rate_additively_up_to_the_max(limiter):
+    assert limiter.report() == pytest.approx(1.1)
+    assert limiter.report(elapsed=1.0) == pytest.approx(1.2)
+    assert limiter.report() == pytest.approx(1.2)
+
+
+def test_block_halves_the_rate_once_per_cooldown(limiter):
+    assert limiter.report(blocked=True) == pytest.approx(0.5)
+    # A burst of failures inside the cooldown counts once
+    assert limiter.report(blocked=True) == pytest.approx(0.5)
+    assert limiter.report(elapsed=30.0) == pytest.approx(0.5)
+
+
+def test_slow_response_counts_as_congestion(tmp_path):
+    limiter = RateLimiter(str(tmp_path / 'rate.sqlite3'), rate=0.4, min_rate=0.3, decrease=0.5, cooldown=0)
+    try:
+        assert limiter.report(elapsed=limiter.slow_seconds + 1) == pytest.approx(0.3)  # floored at min_rate
+    finally:
+        limiter.close()
+
+
+def test_back_off_empties_the_bucket(limiter):
+    assert limiter.try_acquire() == 0.0
+    limiter.report(blocked=True)
+    wait = limiter.try_acquire()
+    assert wait == pytest.approx(1 / 0.5, rel=0.05)  # a whole token at the halved rate
+
+
+def test_limiters_sharing_a_path_share_the_bucket(limiter):
+    other = RateLimiter(limiter.path, rate=5.0)
+    try:
+        other.report(blocked=True)
+        assert limiter.rate == pytest.approx(0.5)  # the existing bucket's rate, not 5.0
+    finally:
+        other.close()
+
+
+def test_pause_holds_callers_then_restarts_from_the_minimum(limiter):
+    limiter.pause(10)
+    assert limiter.rate == pytest.approx(0.1)
+    assert limiter.try_acquire() == pytest.approx(10, rel=0.05)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+import refresh
+
+NOW = pd.Timestamp('2026-01-31', tz='UTC')
+
+
+class FakeStore:
+    def __init__(self, rows):
+        self.rows = pd.DataFrame(rows, columns=['keyword', 'search_type', 'count', 'run_id', 'fetched_at'])
+
+    def join(self, keywords, table='all'):
+        return self.rows[self.rows['keyword'].isin(keywords)]
+
+
+def _runs(keyword, intitle, allintitle, days_ago):
+    # Two runs of both operators, the last one ``days_ago`` days before NOW
+    rows = []
+    for run, age in (('r1', days_ago + 1), ('r2', days_ago)):
+        fetched_at = (NOW - pd.Timedelta(days=age)).isoformat()
+        rows.append((keyword, 'intitle', intitle, run, fetched_at))
+        rows.append((keyword, 'allintitle', allintitle, run, fetched_at))
+    return rows
+
+
+def test_cheaper_keywords_still_fit_after_one_overflows():
+    store = FakeStore(_runs('stale', 500, 40, days_ago=80) + _runs('empty', 0, 0, days_ago=60))
+    # never crawled (cost 2, first), stale (cost 2), then empty (cost 1: allintitle is skipped)
+    frame = refresh.plan(['new', 'stale', 'empty'], store, budget=3, now=NOW, max_days=30)
+    planned = dict(zip(frame['keyword'], frame['planned']))
+    assert planned == {'new': True, 'stale': False, 'empty': True}
+    assert frame.loc[frame['planned'], 'cost'].sum() == 3
+
+
+def test_budget_is_never_exceeded():
+    frame = refresh.plan([f'kw{n}' for n in range(5)], FakeStore([]), budget=5, now=NOW)
+    assert frame['planned'].sum() == 2
+    assert frame.loc[frame['planned'], 'cost'].sum() <= 5
+
+
+def test_not_due_keywords_wait_unless_filling():
+    store = FakeStore(_runs('fresh', 500, 40, days_ago=0.1))
+    frame = refresh.plan(['fresh'], store, budget=10, now=NOW)
+    assert not frame['planned'].any()
+    frame = refresh.plan(['fresh'], store, budget=10, now=NOW, fill=True)
+    assert frame['planned'].all()
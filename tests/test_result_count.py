@@ -0,0 +1,58 @@
+import os
+import json
+
+import pytest
+
+from result_count import count_from_html, detect_locale, extract_count, is_no_results, stats_text
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures', 'serp')
+
+with open(os.path.join(FIXTURES, 'expected.json'), encoding='utf-8') as _file:
+    EXPECTED = sorted(json.load(_file).items())
+
+
+@pytest.mark.parametrize('name,count', EXPECTED)
+def test_fixture_pages(name, count):
+    with open(os.path.join(FIXTURES, name), 'rb') as file:
+        raw = file.read()
+    assert count_from_html(raw) == count
+    assert count_from_html(raw.decode('utf-8')) == count
+
+
+@pytest.mark.parametrize('text,locale,count', [
+    ('About 4,720,000 results (0.32 seconds)', 'en', 4720000),
+    ('Page 2 of about 16,100,000 results', None, 16100000),
+    ('1 result', 'en', 1),
+    ('Ungefähr 4.720.000 Ergebnisse', 'de', 4720000),
+    ('1 Ergebnis', None, 1),
+    ('Environ 16 100 000 résultats', 'fr', 16100000),
+    ('Cerca de 41.900 resultados', 'es', 41900),
+    ('約 4,720,000 件', 'ja', 4720000),
+    ('找到约 4,720,000 条结果', 'zh', 4720000),
+    ("Etwa 1'234 Ergebnisse", 'de', 1234),
+    ('About 1 234 results', 'en', 1234),
+])
+def test_locale_number_grouping(text, locale, count):
+    assert extract_count(text, locale) == count
+    assert extract_count(text) == count  # locale unknown: every pattern is tried
+
+
+def test_text_without_a_count():
+    assert extract_count('') is None
+    assert extract_count('Tools') is None
+    assert extract_count('Your search - x - did not match any documents.') == 0
+
+
+def test_stats_anchor_must_be_the_id():
+    raw = (b'<style>#result-stats{color:red}</style><div class="result-stats-x"></div>'
+           b"<div id='result-stats'>About 12 results<nobr> (0.2 seconds)</nobr></div>")
+    assert stats_text(raw).split() == ['About', '12', 'results', '(0.2', 'seconds)']
+    assert count_from_html(raw) == 12
+    assert stats_text(b'<div id="other">About 12 results</div>') is None
+
+
+def test_unreadable_page_is_not_a_zero():
+    assert count_from_html(b'<html lang="en"><body>Loading...</body></html>') is None
+    assert is_no_results(b'<html lang="de"><p>Die Suche ergab keine Treffer.</p></html>')
+    assert detect_locale(b'<html lang="de-DE">') == 'de'
+    assert detect_locale(b'<html lang="pt">') is None
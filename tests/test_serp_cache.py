@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from serp_cache import SerpCache, get_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SerpCache(str(tmp_path / 'cache.sqlite3'), ttl=3600, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_hit_is_keyed_by_normalized_keyword(cache):
+    cache.put('Sprunki  Game', 'intitle', 120)
+    assert cache.get('sprunki game', 'intitle') == 120
+    assert cache.get('SPRUNKI game', 'allintitle') is None
+    assert cache.get_many([('sprunki game', 'intitle'), ('Sprunki Game', 'intitle')]) == {
+        ('sprunki game', 'intitle'): 120, ('Sprunki Game', 'intitle'): 120}
+
+
+def test_entries_past_the_ttl_are_misses(cache):
+    cache.put('fresh', 'intitle', 1, fetched_at=time.time() - 3599)
+    cache.put('stale', 'intitle', 2, fetched_at=time.time() - 3601)
+    assert cache.get('fresh', 'intitle') == 1
+    assert cache.get('stale', 'intitle') is None
+
+
+def test_evict_drops_expired_rows_and_trims_to_max_entries(cache):
+    now = time.time()
+    cache.put('expired', 'intitle', 1, fetched_at=now - 7200)
+    for n in range(4):
+        cache.put(f'kw{n}', 'intitle', n, fetched_at=now - n)
+    assert cache.evict() == 2
+    assert len(cache) == 3
+    assert cache.get('kw3', 'intitle') is None  # the oldest of the live rows went
+    assert cache.get('kw0', 'intitle') == 0
+
+
+def test_warm_from_csv_keeps_the_newest_count(cache, tmp_path):
+    old, new = tmp_path / 'old.csv', tmp_path / 'new.csv'
+    old.write_text('keyword,search_type,count\nalpha,intitle,5\nbeta,intitle,0\n', encoding='utf-8')
+    new.write_text('Keyword,Search Type,Count\nalpha,intitle,7\n', encoding='utf-8')
+    now = time.time()
+    os.utime(old, (now - 60, now - 60))
+    os.utime(new, (now, now))
+    assert cache.warm_from_csv([str(new), str(old)]) == 2  # the 0 count is skipped
+    assert cache.get('alpha', 'intitle') == 7
+    assert cache.get('beta', 'intitle') is None
+
+
+def test_get_cache_reads_the_ttl_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('SERP_CACHE_PATH', str(tmp_path / 'env.sqlite3'))
+    monkeypatch.setenv('SERP_CACHE_TTL', '60')
+    cache = get_cache()
+    try:
+        assert cache.ttl == 60
+    finally:
+        cache.close()
+    monkeypatch.setenv('SERP_CACHE', 'off')
+    assert get_cache() is None
@@ -0,0 +1,264 @@
+"""Long-running batch worker: one warm process serving many small batches.
+
+``process_keywords.py`` pays for interpreter start, imports, Chrome discovery
+and browser launch on every batch. ``worker.py serve`` pays them once, keeps
+the browser pool, R2 client, SERP cache and rate limiter open, and pulls
+batches from a local SQLite queue, running each one exactly the way
+``process_keywords.main`` does (same R2 results and batch-group status).
+
+    python worker.py serve [--backend http] [--local results]
+    python worker.py submit "kw1,kw2" <batch_id> <batch_group_id> [--format ndjson.gz]
+    python worker.py status
+
+SIGTERM / Ctrl-C drains: the batch in progress finishes and is published,
+queued batches stay queued for the next worker. A batch left 'running' by a
+worker that died is re-queued and resumed from its checkpoint.
+"""
+import os
+import json
+import time
+import socket
+import signal
+import sqlite3
+import argparse
+import threading
+from keyword_source import iter_keywords
+from getbrowser import get_pool
+from fetch_backend import BACKENDS, DEFAULT_BACKEND
+from storage import RESULT_FORMATS, get_r2_client
+from process_keywords import close_services, open_services, run_batch
+from metrics import configure, get_metrics
+
+DEFAULT_QUEUE_PATH = os.path.join('.cache', 'batch_queue.sqlite3')
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class BatchQueue:
+    """FIFO of batches in a SQLite file shared by every worker on the host.
+
+    Rows move queued -> running -> done (``has_errors`` mirrors the batch status). ``claim()`` takes the oldest
+    queued batch inside BEGIN IMMEDIATE, so concurrent workers never run the
+    same batch twice.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL,
+                batch_group_id TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                options TEXT NOT NULL DEFAULT '{}',
+                state TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                has_errors INTEGER,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS batches_state ON batches (state, id)')
+
+    def submit(self, batch_id, batch_group_id, keywords, options=None):
+        """Queue a batch of (already normalized) keywords; returns its queue id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO batches (batch_id, batch_group_id, keywords, options, enqueued_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (batch_id, batch_group_id, json.dumps(list(keywords)), json.dumps(options or {}),
+                 time.time()))
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """Mark the oldest queued batch as running for ``worker`` and return it, or None."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._requeue_orphans()
+                row = self._conn.execute(
+                    "SELECT * FROM batches WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE batches SET state = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ? WHERE id = ?", (worker, time.time(), row['id']))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        batch = dict(row)
+        batch['keywords'] = json.loads(batch['keywords'])
+        batch['options'] = json.loads(batch['options'])
+        batch['attempts'] += 1
+        return batch
+
+    def _requeue_orphans(self):
+        # Only workers on this host can be checked; their ids are "<host>:<pid>"
+        host = socket.gethostname()
+        for row in self._conn.execute(
+                "SELECT id, worker FROM batches WHERE state = 'running'").fetchall():
+            worker_host, _, pid = (row['worker'] or '').rpartition(':')
+            if worker_host == host and pid.isdigit() and not _alive(int(pid)):
+                print(f"Re-queueing batch {row['id']} left running by dead worker {row['worker']}")
+                self._conn.execute("UPDATE batches SET state = 'queued', worker = NULL WHERE id = ?",
+                                   (row['id'],))
+
+    def finish(self, queue_id, has_errors):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batches SET state = 'done', has_errors = ?, finished_at = ? WHERE id = ?",
+                (int(bool(has_errors)), time.time(), queue_id))
+
+    def counts(self):
+        with self._lock:
+            return {row['state']: row['n'] for row in self._conn.execute(
+                'SELECT state, COUNT(*) AS n FROM batches GROUP BY state')}
+
+    def recent(self, limit=10):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                'SELECT id, batch_id, batch_group_id, state, worker, attempts, has_errors, '
+                'enqueued_at, started_at, finished_at FROM batches ORDER BY id DESC LIMIT ?', (limit,))]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_queue():
+    return BatchQueue(os.getenv('BATCH_QUEUE_PATH', DEFAULT_QUEUE_PATH))
+
+
+def serve(queue, backend=None, local=None, poll_interval=DEFAULT_POLL_INTERVAL, idle_exit=None):
+    """Run queued batches until stopped (or idle for ``idle_exit`` seconds)."""
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop.is_set():
+            print("Shutdown requested: finishing the current batch, queued batches stay queued")
+        stop.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # Pay the start-up costs once: browser launch, R2 client, cache and limiter
+    if (backend or os.getenv('FETCH_BACKEND', DEFAULT_BACKEND)) == 'browser':
+        get_pool().start()
+    if not local:
+        get_r2_client()
+    services = open_services(backend)
+    print(f"Worker {worker} ready, polling {queue.path}")
+
+    served = 0
+    idle_since = time.monotonic()
+    try:
+        while not stop.is_set():
+            batch = queue.claim(worker)
+            if batch is None:
+                if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                    print(f"Idle for {idle_exit:.0f}s, exiting")
+                    break
+                stop.wait(poll_interval)
+                continue
+
+            started = time.monotonic()
+            print(f"Batch {batch['batch_id']} ({len(batch['keywords'])} keyword(s), "
+                  f"attempt {batch['attempts']})")
+            has_errors = True
+            try:
+                # A retried batch picks up from its checkpoint
+                has_errors = run_batch(
+                    batch['keywords'], batch['batch_id'], batch['batch_group_id'],
+                    resume=batch['batch_id'] if batch['attempts'] > 1 else None, backend=backend,
+                    result_format=batch['options'].get('result_format'),
+                    columnar=batch['options'].get('columnar', False), local=local, services=services,
+                    group_dedupe=batch['options'].get('group_dedupe', False))
+            finally:
+                queue.finish(batch['id'], has_errors)
+            served += 1
+            idle_since = time.monotonic()
+            print(f"Batch {batch['batch_id']} finished in {time.monotonic() - started:.1f}s "
+                  f"(errors: {has_errors}, {served} served)")
+    finally:
+        close_services(services)
+        get_pool().close()
+        print(f"Worker {worker} stopped after {served} batch(es)")
+
+
+def submit(queue, keywords, batch_id, batch_group_id, result_format=None, columnar=False, group_dedupe=False):
+    if keywords == '-':
+        keywords = list(iter_keywords('-'))
+    else:
+        keywords = list(iter_keywords(input_keywords=keywords))
+    options = {'result_format': result_format, 'columnar': columnar, 'group_dedupe': group_dedupe}
+    queue_id = queue.submit(batch_id, batch_group_id, keywords, options)
+    print(f"Queued batch {batch_id} as #{queue_id} ({len(keywords)} keyword(s))")
+    return queue_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm worker daemon for process_keywords batches')
+    parser.add_argument('--queue', help=f'queue database (BATCH_QUEUE_PATH, default {DEFAULT_QUEUE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run queued batches until stopped')
+    serve_parser.add_argument('--backend', choices=BACKENDS,
+                              help="how pages are fetched: 'browser' (default, FETCH_BACKEND), 'http' or 'auto'")
+    serve_parser.add_argument('--local', metavar='DIR',
+                              help='write results to DIR/<batch_id>.* and skip R2 and the batch-group status')
+    serve_parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL,
+                              help='seconds between queue polls while idle')
+    serve_parser.add_argument('--idle-exit', type=float,
+                              help='exit after this many seconds without work')
+    serve_parser.add_argument('--metrics-port', type=int,
+                              help='serve Prometheus metrics on this port (METRICS_PORT)')
+
+    submit_parser = commands.add_parser('submit', help='queue a batch')
+    submit_parser.add_argument('keywords', help="comma-separated keywords, or '-' for one per line on stdin")
+    submit_parser.add_argument('batch_id')
+    submit_parser.add_argument('batch_group_id')
+    submit_parser.add_argument('--format', dest='result_format', choices=RESULT_FORMATS)
+    submit_parser.add_argument('--columnar', action='store_true')
+    submit_parser.add_argument('--group-dedupe', action='store_true')
+
+    commands.add_parser('status', help='show queue counts and recent batches')
+    args = parser.parse_args()
+
+    queue = BatchQueue(args.queue) if args.queue else get_queue()
+    try:
+        if args.command == 'serve':
+            configure(args.metrics_port)
+            try:
+                serve(queue, backend=args.backend, local=args.local, poll_interval=args.poll,
+                      idle_exit=args.idle_exit)
+            finally:
+                get_metrics().close()
+        elif args.command == 'submit':
+            submit(queue, args.keywords, args.batch_id, args.batch_group_id,
+                   result_format=args.result_format, columnar=args.columnar, group_dedupe=args.group_dedupe)
+        else:
+            print(json.dumps({'counts': queue.counts(), 'recent': queue.recent()}, indent=2))
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()